@@ -4,13 +4,30 @@ from utils.draw_display import *
 from exercise.squat import *
 from collections import deque
 from utils.mediapipe_helper import *
-
-from tensorflow import keras
-from keras.models import Model, load_model
-from keras.layers import (LSTM, Dense, Dropout, Input, Flatten,
-                          Bidirectional, Permute, multiply)
+from utils.smoothing import create_filter
+from utils.metrics import PipelineMetrics, MetricsExporter
+from utils.profiling import profiler_from_env
+from utils.frame_buffers import FrameBuffers
+from utils.causal_model import CausalClassifier
+from utils.presence import PresenceDetector, NO_POSE
+from utils.cascade import CascadeClassifier, LinearStage
+from utils.quality import QualityController, QualityLevel, PoseGraphs
+import argparse
+import time
+from exercise.rep_segmentation import RepClassifier, RepSegmenter
+
+try:
+    from tensorflow import keras
+    from keras.models import Model, load_model
+    from keras.layers import (LSTM, Dense, Dropout, Input, Flatten,
+                              Bidirectional, Permute, multiply)
+except ImportError:  # only create_model needs TensorFlow, pose, counting and drawing run without it
+    keras = None
 from collections import deque
 
+# classes of the models/meg_owndata AttnLSTM loaded by create_model, in output order
+ACTIONS = ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Good']
+
 
 ## Create and Load the Model
 def attention_block(inputs, time_steps):
@@ -39,6 +56,8 @@ def create_model():
     create and load LSTM Model with attention mechinism
 
     """
+    if keras is None:
+        raise ImportError("create_model needs TensorFlow / Keras")
 
     HIDDEN_UNITS = 256
     sequence_length = 30
@@ -80,11 +99,12 @@ def create_model():
 class VideoProcessor:
     def __init__(self):
         # Initilize parameters and variables
-        self.sequence_length = 30
-        self.actions = ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Good']
-        self.sequence = deque(maxlen=self.sequence_length)
+        self.actions = list(ACTIONS)
 
         self.prediction_history = deque(maxlen=5)
+        self.last_average = None
+        # counts the causal model inferences, replaced by the metrics of the live loop
+        self.metrics = PipelineMetrics(enabled=False)
         self.counter = 0
         self.colors = [
             (245, 117, 16),  # Orange
@@ -104,7 +124,8 @@ class VideoProcessor:
         as a horizontal bar graph
         
         """
-        output_frame = input_frame.copy()
+        # drawn into the frame in place, no copy of the whole frame
+        output_frame = input_frame
         font_size = 2
         for num, prob in enumerate(res):
             # change prob * ___ for longer length
@@ -119,10 +140,10 @@ class VideoProcessor:
 
     def inference_process(self, model, image, results):
         """
-        Function to process and run inference on AttnLSTM with real time video frame input
+        Function to process and run inference on the causal model with real time video frame input
 
         Args:
-            model: the AttnLSTM classification model
+            model: CausalClassifier (utils/causal_model.py), takes the frame itself instead of the whole window
             image (numpy array): input image from the webcam
             results: Processed frame from mediapipe Pose
 
@@ -132,100 +153,206 @@ class VideoProcessor:
 
         # Prediction logic
         keypoints = extract_keypoints(results)
-        moving_average = np.zeros(len(self.actions))
-        self.sequence.append(keypoints.astype('float32', casting='same_kind'))
-
-        if len(self.sequence) == self.sequence_length:
-            res = model.predict(np.expand_dims(list(self.sequence), axis=0), verbose=0)[0]
+        moving_average = self.last_average if self.last_average is not None else np.zeros(len(self.actions))
+        # constant time per frame, None until the model has seen a whole window. Not motion gated (the gate
+        # only runs in camera_server.py --classify window): a pause longer than STREAM_MAX_GAP would restart
+        # the model and leave it blind for a whole window once the user moves again, for next to no saving
+        self.metrics.inference_done()
+        res = model.update(time.monotonic(), keypoints)
+
+        if res is not None:
             # self.current_action = self.actions[np.argmax(res)]
             self.prediction_history.append(res)
 
             if len(self.prediction_history) == self.prediction_history.maxlen:
                 moving_average = np.mean(self.prediction_history, axis=0)
                 self.current_action = self.actions[np.argmax(moving_average)]
+                self.last_average = moving_average
 
+        if res is not None or self.last_average is not None:
             # Viz probabilities
             image = self.prob_viz(moving_average, image)
 
         return image
 
+    def rep_inference_process(self, rep_classifier, image):
+        """
+        Displays the AttnLSTM prediction of the last finished repetition
 
-class LandmarkData:
-    def __init__(self, landmark_left, landmark_right, max_frames):
-        self.landmark_left = landmark_left
-        self.landmark_right = landmark_right
-
-        # tracks x value (position[0] = left, position[1] = right)
-        self.x_queue = deque(maxlen=max_frames)
-        # tracks y value (position[0] = left, position[1] = right)
-        self.y_queue = deque(maxlen=max_frames)
-
-        # left and right contain both (x value, y value)
-        self.left = None
-        self.right = None
-        # average of y values
-        self.avg_val_left = None
-        self.avg_val_right = None
-
-        self.angles = deque(maxlen=max_frames)
-        self.left_angle = None
-        self.right_angle = None
-        self.avg_angle_left = None
-        self.avg_angle_right = None
-
-    def update_values(self, results, update_y=True):
-        self.left = results.pose_landmarks.landmark[self.landmark_left]
-        self.right = results.pose_landmarks.landmark[self.landmark_right]
-        if update_y:
-            self.y_queue.append((self.left.y, self.right.y))
-        else:
-            self.x_queue.append((self.left.x, self.right.x))
+        Args:
+            rep_classifier: RepClassifier already updated with the current frame
+            image (numpy array): input image from the webcam
 
-        self.update_average(update_y=update_y)
+        Returns:
+            numpy array: image with the prediction probabilities
+        """
+        if rep_classifier.last_prediction is not None:
+            self.current_action = self.actions[np.argmax(rep_classifier.last_prediction)]
+            image = self.prob_viz(rep_classifier.last_prediction, image)
 
-    def update_average(self, update_y=True):
-        queue = self.y_queue if update_y else self.x_queue
+        return image
 
-        self.avg_val_left, self.avg_val_right = map(lambda x: sum(x) / len(x), zip(*queue))
 
+class FramePipeline:
+    """
+    Per-frame processing of the live loop, from the captured BGR frame to the frame with skeleton, counter and
+    prediction drawn. main() runs it on the webcam, tests/stage_benchmark.py times its stages on the test clips
+
+    Args:
+        mp_pose: MediaPipe pose solution
+        pose: MediaPipe Pose graph, replaced by main() when the quality level changes
+        level (QualityLevel): Pose input size and overlay detail
+        segmenter (RepSegmenter): shoulder / knee landmark data and the counter
+        video_processor (VideoProcessor): draws the predictions
+        metrics: PipelineMetrics (or StageTimer) the stages are timed into
+        rep_classifier (RepClassifier): owns segmenter and classifies every repetition, None to only count
+        causal_model (CausalClassifier): classifies every frame instead, None for the repetition classifier
+        presence (PresenceDetector): skips Pose on an empty scene, None runs Pose on every frame
+    """
+    def __init__(self, mp_pose, pose, level, segmenter, video_processor, metrics, rep_classifier=None,
+                 causal_model=None, presence=None):
+        self.mp_pose = mp_pose
+        self.pose = pose
+        self.level = level
+        self.segmenter = segmenter
+        self.video_processor = video_processor
+        self.metrics = metrics
+        self.rep_classifier = rep_classifier
+        self.causal_model = causal_model
+        self.presence = presence
+        # Capture and RGB frames are read / converted into the same arrays every frame
+        self.buffers = FrameBuffers()
+
+    def read(self, cap):
+        """
+        Returns:
+            tuple: (ret, frame) of cap.read(), into the reused capture buffer
+        """
+        with self.metrics.span("decode"):
+            return self.buffers.read(cap)
 
-    def update_angles(self, left_angle, right_angle):
-        self.left_angle = left_angle
-        self.right_angle = right_angle
-        self.angles.append((self.left_angle, self.right_angle))
+    def process(self, frame, capture_time):
+        """
+        Args:
+            frame (numpy array): BGR frame, drawn into
+            capture_time (float): time.monotonic() of the capture
 
-        self.avg_angle_left, self.avg_angle_right = map(lambda x: sum(x) / len(x), zip(*self.angles))
+        Returns:
+            tuple: (frame with the overlay, MediaPipe Pose results, NO_POSE when Pose was skipped)
+        """
+        metrics = self.metrics
+        knee_obj = self.segmenter.knee_obj
+        counter_obj = self.segmenter.counter
+
+        with metrics.span("presence"):
+            check_pose = self.presence is None or self.presence.check(frame, capture_time)
+
+        if check_pose:
+            # Convert the BGR image to RGB
+            with metrics.span("bgr_to_rgb"):
+                rgb_frame = self.buffers.to_rgb(self.buffers.resize(frame, self.level.pose_size(frame)))
+
+            # Process the frame with MediaPipe Pose
+            with metrics.span("pose"):
+                results = self.pose.process(rgb_frame)
+            if self.presence is not None:
+                self.presence.report(results.pose_landmarks is not None)
+        else:
+            # empty, static scene
+            results = NO_POSE
 
+        if not results.pose_landmarks:
+            return frame, results
 
-class Counter:
-    def __init__(self):
-        self.count = 0
-        self.direction_text = "STABLE"
-        self.going_up = False
-
-    def update_counter(self, shoulder_obj, knee_obj):
-        # Compare with previous Y positions to determine movement direction
-        if is_standing_up(shoulder_obj, knee_obj):
-            self.direction_text = "UP"
-            # Change in direction: going up now
-            if not self.going_up:
-                self.count += 1
-                self.going_up = True
-
-        elif is_squatting_down(shoulder_obj, knee_obj):
-            self.direction_text = "DOWN"
-            self.going_up = False
+        # Draw landmarks on the frame
+        with metrics.span("draw"):
+            if self.level.draws('full'):
+                drawing_utils = mp.solutions.drawing_utils
+                drawing_utils.draw_landmarks(frame,
+                                             results.pose_landmarks,
+                                             self.mp_pose.POSE_CONNECTIONS,
+                                             drawing_utils.DrawingSpec(color=(245, 117, 66), thickness=15,
+                                                                       circle_radius=5),
+                                             drawing_utils.DrawingSpec(color=(255, 255, 255), thickness=15,
+                                                                       circle_radius=5)
+                                             )
+
+        # Update landmark data, knee angles and counter, classify the repetition when it ends
+        with metrics.span("counter_classify"):
+            if self.rep_classifier is not None:
+                self.rep_classifier.update(results, extract_keypoints(results))
+            else:
+                self.segmenter.update(results, extract_keypoints(results))
+
+        with metrics.span("overlay"):
+            if self.level.draws('basic'):
+                knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
+                # Draw the left leg in red if the knee angle is greater than the threshold
+                draw_leg_landmarks(mp, frame, results,
+                                   color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
+
+                ################### ERROR CHECKING ###################
+
+                process_shallow(frame, counter_obj, knee_obj)
+
+                ######################################################
 
-        else:
-            self.direction_text = "STABLE"
+            cycle_x = 0
+            cycle_y = 50
+            text_to_display = f"{counter_obj.direction_text} | Cycles: {counter_obj.count}"
+            draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
+
+            if self.causal_model is not None:
+                # Show the causal model prediction of the current frame
+                frame = self.video_processor.inference_process(self.causal_model, frame, results)
+            elif self.rep_classifier is not None:
+                # Show the AttnLSTM prediction of the last repetition
+                frame = self.video_processor.rep_inference_process(self.rep_classifier, frame)
+
+        return frame, results
 
 
 def main():
-    # Create LSTM model
-    AttnLSTM = create_model()
+    parser = argparse.ArgumentParser(description="Live squat counting and classification")
+    parser.add_argument("--profile", action="store_true", help="profile the first frames (see utils/profiling.py)")
+    parser.add_argument("--profile-trigger-ms", type=float, default=None,
+                        help="profile automatically when a frame takes longer than this")
+    parser.add_argument("--streaming", nargs="?", const=CAUSAL_MODEL_PATH, default=None, metavar="MODEL",
+                        help="classify every frame with the causal model (train_causal_model.py) "
+                             "instead of once per repetition")
+    parser.add_argument("--cascade", nargs="?", const=CASCADE_MODEL_PATH, default=None, metavar="STAGE",
+                        help="classify repetitions with the first stage (train_cascade.py) and run the AttnLSTM "
+                             "only when it is not confident")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="adapt Pose model, Pose input size and overlay detail to process "
+                             "this many frames per second (utils/quality.py)")
+    parser.add_argument("--target-latency", type=float, default=QUALITY_TARGET_LATENCY * 1000,
+                        help="processing ms per frame (95th percentile) the quality controller holds")
+    args = parser.parse_args()
+    if args.streaming and args.cascade:
+        parser.error("--cascade classifies repetitions, it can not be combined with --streaming")
+    profiler = profiler_from_env("camera_movement", start_now=args.profile, trigger_ms=args.profile_trigger_ms)
+
+    causal_model = None
+    if args.streaming:
+        # the causal model replaces the AttnLSTM, which is not loaded
+        causal_model = CausalClassifier.load(args.streaming)
+    else:
+        # Create LSTM model
+        AttnLSTM = create_model()
+        if args.cascade:
+            AttnLSTM = CascadeClassifier(AttnLSTM, LinearStage.load(args.cascade))
     # Initialize MediaPipe Pose
     mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose()
+    # one Pose graph per model complexity the quality controller steps through
+    pose_graphs = PoseGraphs(mp_pose)
+    quality = None
+    if args.target_fps:
+        quality = QualityController(args.target_fps, target_latency=args.target_latency / 1000)
+        level = quality.level
+    else:
+        level = QualityLevel(*QUALITY_LEVELS[QUALITY_START_LEVEL])
+    pose = pose_graphs.get(level.model_complexity)
 
     # Initialize video capture
     cap = cv2.VideoCapture(0)  # 0 corresponds to the default camera (change it if you have multiple cameras)
@@ -233,81 +360,71 @@ def main():
     fps = cap.get(cv2.CAP_PROP_FPS)
     print("FPS value", fps)
 
+    # Stage timings, on-frame HUD and export, all no-ops unless METRICS_ENABLED
+    metrics = PipelineMetrics(enabled=METRICS_ENABLED, nominal_fps=fps)
+    exporter = MetricsExporter(metrics, METRICS_FILE, METRICS_URL, METRICS_PORT) if METRICS_ENABLED else None
+
     # Initialize Video Processor
     video_processor = VideoProcessor()
-
-    # Initialize landmark data for shoulder
-    shoulder_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER, NUM_FRAMES_SHOULDER)
-    knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, NUM_FRAMES_KNEE)
-
-    # Initialize counter
-    counter_obj = Counter()
+    video_processor.metrics = metrics
+    if causal_model is not None:
+        video_processor.actions = causal_model.class_labels
+    # MediaPipe is skipped while nobody is in front of the camera
+    presence = PresenceDetector() if PRESENCE_ENABLED else None
+
+    # Rep segmentation owns the shoulder / knee landmark data and the counter,
+    # the model runs once per repetition instead of on every frame; with the causal model it only counts
+    rep_classifier = None
+    if causal_model is not None:
+        segmenter = RepSegmenter(mp_pose, landmark_filter=create_filter(LANDMARK_FILTER))
+    else:
+        rep_classifier = RepClassifier(AttnLSTM, mp_pose, landmark_filter=create_filter(LANDMARK_FILTER))
+        segmenter = rep_classifier.segmenter
+    pipeline = FramePipeline(mp_pose, pose, level, segmenter, video_processor, metrics, rep_classifier=rep_classifier,
+                             causal_model=causal_model, presence=presence)
 
     while cap.isOpened():
-        ret, frame = cap.read()
+        profiler.frame_start()
+        ret, frame = pipeline.read(cap)
+        capture_time = time.monotonic()
 
         if not ret:
             print("Failed to capture frame. Exiting...")
             break
+        process_start = time.perf_counter()
 
         frame_height, frame_width, _ = frame.shape
+        frame, results = pipeline.process(frame, capture_time)
 
-        # Convert the BGR image to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Process the frame with MediaPipe Pose
-        results = pose.process(rgb_frame)
-
-        # Draw landmarks on the frame
         if results.pose_landmarks:
-
-            mp.solutions.drawing_utils.draw_landmarks(frame,
-                                                      results.pose_landmarks,
-                                                      mp_pose.POSE_CONNECTIONS,
-                                                      mp.solutions.drawing_utils.DrawingSpec(color=(245, 117, 66),
-                                                                                             thickness=15,
-                                                                                             circle_radius=5),
-                                                      mp.solutions.drawing_utils.DrawingSpec(color=(255, 255, 255),
-                                                                                             thickness=15,
-                                                                                             circle_radius=5)
-                                                      )
-
-            # Update landmark data
-            shoulder_obj.update_values(results)
-            knee_obj.update_values(results)
-
-            # update knee angles
-            left_knee_angle, right_knee_angle = calculate_knee_angles(results, mp_pose)
-            knee_obj.update_angles(left_knee_angle, right_knee_angle)
-
-            # update counter - MUST update landark data first
-            counter_obj.update_counter(shoulder_obj, knee_obj)
-
-            knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
-            # Draw the left leg in red if the knee angle is greater than the threshold
-            draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
-
-            ################### ERROR CHECKING ###################
-
-            process_shallow(frame, counter_obj, knee_obj)
-
-            ######################################################
-
-            cycle_x = 0
-            cycle_y = 50
-            text_to_display = f"{counter_obj.direction_text} | Cycles: {counter_obj.count}"
-            draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
-
-            # Process the frame with AttnLSTM model
-            frame = video_processor.inference_process(AttnLSTM, frame, results)
+            # only frames with a person are timed, an empty scene says nothing about the cost of a squat
+            if quality is not None and quality.update(time.monotonic(), time.perf_counter() - process_start):
+                pipeline.level = quality.level
+                pipeline.pose = pose_graphs.get(pipeline.level.model_complexity)
+            if SHOW_HUD:
+                metrics.draw_hud(frame, position=(frame_width - 320, 30))
             cv2.imshow('Classification', frame)
+        # every captured frame counts, also the ones without a person or skipped by the presence detector
+        metrics.frame_done(capture_time)
+        profiler.frame_end()
 
         # Break the loop if 'q' key is pressed
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    profiler.close()
+    if exporter is not None:
+        exporter.close()
+    if rep_classifier is not None:
+        print(rep_classifier.stats_text())
+    if quality is not None:
+        print(quality.stats_text())
+    if args.cascade:
+        print(AttnLSTM.stats_text())
+
     # Release the video capture
     cap.release()
+    pose_graphs.close()
 
     # Destroy all OpenCV windows
     cv2.destroyAllWindows()
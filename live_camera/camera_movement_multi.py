@@ -0,0 +1,204 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import mediapipe as mp
+from utils.draw_display import *
+from utils.mediapipe_helper import *
+from utils.constant import *
+from utils.person_tracking import PersonDetector, TilePoseDetector, iou, match_boxes, pad_box, landmarks_to_frame, landmark_box
+from exercise.rep_segmentation import RepClassifier
+
+from camera_movement import create_model, ACTIONS
+
+
+class PersonTrack:
+    """
+    One tracked person with its own Pose graph, landmark data, Counter and classifier buffer
+
+    """
+    def __init__(self, track_id, box, model, mp_pose):
+        self.track_id = track_id
+        self.box = box
+        self.pose = mp_pose.Pose()
+        self.rep_classifier = RepClassifier(model, mp_pose)
+        self.results = None
+        self.missed = 0
+
+    def estimate(self, rgb_frame):
+        """
+        Runs pose estimation on the cropped ROI of the track. Called from the worker pool.
+
+        """
+        roi = pad_box(self.box, rgb_frame.shape)
+        x0, y0, x1, y1 = roi
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            self.results = None
+            return
+
+        results = self.pose.process(np.ascontiguousarray(rgb_frame[y0:y1, x0:x1]))
+        if results.pose_landmarks:
+            landmarks_to_frame(results.pose_landmarks, roi, rgb_frame.shape)
+        self.results = results
+
+    def update(self, frame_shape):
+        """
+        Updates counter and rep classification from the last estimate. Runs on the main thread,
+        so the model is never called concurrently.
+
+        """
+        if self.results is None or not self.results.pose_landmarks:
+            self.missed += 1
+            return
+
+        self.missed = 0
+        box = landmark_box(self.results.pose_landmarks, frame_shape)
+        if box is not None:
+            self.box = box
+        self.rep_classifier.update(self.results, extract_keypoints(self.results))
+
+    def close(self):
+        self.pose.close()
+
+
+class MultiPersonTracker:
+    """
+    Finds people with a lightweight detector, keeps stable track ids by IoU matching
+    and runs pose estimation for every track on a shared worker pool
+
+    """
+    def __init__(self, model, mp_pose, workers=None, max_people=MAX_PEOPLE, detect_every=DETECT_EVERY_N_FRAMES,
+                 detector="tiles"):
+        self.model = model
+        self.mp_pose = mp_pose
+        self.max_people = max_people
+        self.detect_every = detect_every
+        self.detector = TilePoseDetector(mp_pose) if detector == "tiles" else PersonDetector()
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+
+        self.tracks = []
+        self.next_track_id = 1
+        self.frame_index = 0
+
+    def _detect(self, frame):
+        detections = self.detector.detect(frame)
+        matches, _, unmatched_detections = match_boxes([track.box for track in self.tracks], detections,
+                                                       TRACK_IOU_THR)
+        for track_index, detection_index in matches:
+            self.tracks[track_index].box = detections[detection_index]
+
+        for detection_index in unmatched_detections:
+            if len(self.tracks) >= self.max_people:
+                break
+            self.tracks.append(PersonTrack(self.next_track_id, detections[detection_index], self.model, self.mp_pose))
+            self.next_track_id += 1
+
+    def _drop_lost_tracks(self):
+        kept = []
+        for track in self.tracks:
+            # a track that lost its person, or drifted onto a person already followed by an older track
+            duplicate = any(iou(other.box, track.box) > 0.7 for other in kept)
+            if track.missed > TRACK_MAX_MISSED or duplicate:
+                track.close()
+            else:
+                kept.append(track)
+        self.tracks = kept
+
+    def process(self, frame):
+        """
+        Runs detection (every detect_every frames), pose estimation for every track and rep classification
+
+        Returns:
+            list: the active PersonTrack objects
+        """
+        if self.frame_index % self.detect_every == 0 or not self.tracks:
+            self._detect(frame)
+        self.frame_index += 1
+
+        # Convert the BGR image to RGB once, every track crops its ROI from it
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        list(self.executor.map(lambda track: track.estimate(rgb_frame), self.tracks))
+
+        for track in self.tracks:
+            track.update(frame.shape)
+        self._drop_lost_tracks()
+
+        return self.tracks
+
+    def close(self):
+        for track in self.tracks:
+            track.close()
+        self.detector.close()
+        self.executor.shutdown()
+
+
+def draw_tracks(frame, tracks, actions, mp_pose):
+    for track in tracks:
+        if track.results is None or not track.results.pose_landmarks:
+            continue
+
+        mp.solutions.drawing_utils.draw_landmarks(frame,
+                                                  track.results.pose_landmarks,
+                                                  mp_pose.POSE_CONNECTIONS,
+                                                  mp.solutions.drawing_utils.DrawingSpec(color=(245, 117, 66),
+                                                                                         thickness=4,
+                                                                                         circle_radius=3),
+                                                  mp.solutions.drawing_utils.DrawingSpec(color=(255, 255, 255),
+                                                                                         thickness=4,
+                                                                                         circle_radius=3)
+                                                  )
+
+        counter_obj = track.rep_classifier.counter
+        text_to_display = f"#{track.track_id} {counter_obj.direction_text} | Cycles: {counter_obj.count}"
+        prediction = track.rep_classifier.last_prediction
+        if prediction is not None:
+            text_to_display += f" | {actions[np.argmax(prediction)]}"
+
+        x0, y0 = int(track.box[0]), int(track.box[1])
+        draw_text(frame, (x0 + 10, max(30, y0 - 10)), text_to_display, font_scale=0.8, color=(255, 255, 255))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Squat counting and classification for several people on one camera")
+    parser.add_argument("--source", default="0", help="camera index or video file")
+    parser.add_argument("--workers", type=int, default=None, help="pose estimation threads, defaults to the CPU count")
+    parser.add_argument("--max-people", type=int, default=MAX_PEOPLE)
+    parser.add_argument("--detector", choices=["tiles", "hog"], default="tiles",
+                        help="find people with pose estimation on frame tiles or with the OpenCV HOG people detector")
+    args = parser.parse_args()
+
+    # Create LSTM model
+    AttnLSTM = create_model()
+    mp_pose = mp.solutions.pose
+    tracker = MultiPersonTracker(AttnLSTM, mp_pose, workers=args.workers, max_people=args.max_people,
+                                 detector=args.detector)
+
+    # Initialize video capture
+    cap = cv2.VideoCapture(int(args.source) if args.source.isdigit() else args.source)
+
+    while cap.isOpened():
+        ret, frame = cap.read()
+
+        if not ret:
+            print("Failed to capture frame. Exiting...")
+            break
+
+        tracks = tracker.process(frame)
+        draw_tracks(frame, tracks, ACTIONS, mp_pose)
+        cv2.imshow('Classification', frame)
+
+        # Break the loop if 'q' key is pressed
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    tracker.close()
+
+    # Release the video capture
+    cap.release()
+
+    # Destroy all OpenCV windows
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,11 @@ from utils.draw_display import *
 from exercise.squat import *
 from collections import deque
 from utils.mediapipe_helper import * 
+from utils.resample import TimestampedWindow
+import time
+from exercise.rep_segmentation import RepClassifier, shoulder_height_recovered
+from utils.frame_buffers import FrameBuffers
+from utils.presence import PresenceDetector, detect_pose
 
 from tensorflow import keras
 from keras.models import Model, load_model
@@ -80,9 +85,9 @@ class VideoProcessor:
         #Initilize parameters and variables
         self.sequence_length = 30
         self.actions = ['Bad_head', 'Bad_back_round', 'Bad_back_warp', 'Bad_lifted_heels', 'Bad_inward_knee', 'Bad_shallow','Good']
-        self.sequence = deque(maxlen=self.sequence_length)
+        # last frames with their capture time, resampled to the model frame rate
+        self.sequence = TimestampedWindow(self.sequence_length)
 
-        self.frame_history = []
         self.counter = 0
         self.colors = [
             (245, 117, 16),  # Orange
@@ -101,7 +106,8 @@ class VideoProcessor:
         as a horizontal bar graph
         
         """
-        output_frame = input_frame.copy()
+        # drawn into the frame in place, no copy of the whole frame
+        output_frame = input_frame
         for num, prob in enumerate(res):        
             cv2.rectangle(output_frame, (0,60+num*40), (int(prob*100), 90+num*40), self.colors[num], -1)
             cv2.putText(output_frame, self.actions[num], (0, 85+num*40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255,255,255), 2, cv2.LINE_AA)
@@ -123,10 +129,10 @@ class VideoProcessor:
 
         # Prediction logic
         keypoints = extract_keypoints(results)
-        self.sequence.append(keypoints.astype('float32', casting='same_kind'))
+        self.sequence.append(time.monotonic(), keypoints)
 
-        if len(self.sequence) == self.sequence_length:
-            res = model.predict(np.expand_dims(list(self.sequence), axis=0), verbose=0)[0]
+        if self.sequence.is_full():
+            res = model.predict(np.expand_dims(self.sequence.window(), axis=0), verbose=0)[0]
             self.current_action = self.actions[np.argmax(res)]
 
             # Viz probabilities
@@ -145,15 +151,16 @@ def main():
 
     # Initialize Video Processor
     video_processor = VideoProcessor()
-    # Initialize shoulder Y positions
-    shoulder_positions = deque(maxlen=NUM_FRAMES_SHOULDER)
-    left_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-    right_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
+    # Capture and RGB frames are read / converted into the same arrays every frame
+    buffers = FrameBuffers()
+    # MediaPipe is skipped while nobody is in front of the camera
+    presence = PresenceDetector() if PRESENCE_ENABLED else None
 
-    # Initalize counter
-    count = 0
-    going_up = False
-    squat_start_height = 1000
+    # Classify each repetition once the shoulders are back above 80% of the squat start height
+    rep_classifier = RepClassifier(AttnLSTM, mp_pose, end_trigger=shoulder_height_recovered(0.8))
+    knee_obj = rep_classifier.segmenter.knee_obj
+    counter_obj = rep_classifier.counter
+    prediction = [0] * 7
 
     # Initialize video capture
     cap = cv2.VideoCapture(0)  # 0 corresponds to the default camera (change it if you have multiple cameras)
@@ -162,7 +169,7 @@ def main():
     print ("FPS value",fps)
 
     while cap.isOpened():
-        ret, frame = cap.read()
+        ret, frame = buffers.read(cap)
 
         if not ret:
             print("Failed to capture frame. Exiting...")
@@ -170,29 +177,23 @@ def main():
 
         frame_height, frame_width, _ = frame.shape
 
-        # Convert the BGR image to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Process the frame with MediaPipe Pose
-        results = pose.process(rgb_frame)
+        # Process the frame with MediaPipe Pose, unless the scene is empty
+        results = detect_pose(pose, frame, buffers, presence)
 
 
         # Draw landmarks on the frame
         if results.pose_landmarks:
-            # Process the frame with AttnLSTM model
-            # img = video_processor.inference_process(AttnLSTM, rgb_frame, results)
-            frame = rgb_frame
-            prediction = [0] * 7
-
-            video_processor.frame_history.append(extract_keypoints(results))
+            # Update landmark data and counter, the model runs when a repetition ends
+            rep_prediction = rep_classifier.update(results, extract_keypoints(results))
+            if rep_prediction is not None:
+                prediction = rep_prediction
+                video_processor.current_action = video_processor.actions[np.argmax(prediction)]
 
-            if len(video_processor.frame_history) > 100:
-                print("Clearing frame history")
-                video_processor.frame_history = video_processor.frame_history[-video_processor.sequence_length:]
+                print("Prediction: ", prediction)
+                print("Max prediction", video_processor.current_action)
 
             # Viz probabilities
             frame = video_processor.prob_viz(prediction, frame)
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
 
             mp.solutions.drawing_utils.draw_landmarks(frame,
                                                       results.pose_landmarks,
@@ -205,100 +206,36 @@ def main():
                                                                                              circle_radius=5)
                                                       )
 
-            # Get Y positions of the left and right shoulders
-            left_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER].y
-            right_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER].y
-
-            # Update deque with shoulder positions
-            shoulder_positions.append((left_shoulder_y, right_shoulder_y))
-
-            average_left_shoulder_y = sum(pos[0] for pos in shoulder_positions) / len(shoulder_positions)
-            average_right_shoulder_y = sum(pos[1] for pos in shoulder_positions) / len(shoulder_positions)
-
-            ###################### Calculate knee angles ######################
-            left_knee_angle, right_knee_angle = calculate_knee_angles(results, mp_pose)
-
-            left_knee_angles.append(left_knee_angle)
-            right_knee_angles.append(right_knee_angle)
-
-            # Calculate moving average of knee angles
-            average_left_knee_angle = sum(left_knee_angles) / len(left_knee_angles)
-            average_right_knee_angle = sum(right_knee_angles) / len(right_knee_angles)
-
-            left_knee_pixel_x = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].x * frame_width)
-            left_knee_pixel_y = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].y * frame_height)
+            left_knee_pixel_x = int(knee_obj.left.x * frame_width)
+            left_knee_pixel_y = int(knee_obj.left.y * frame_height)
             knee_loc = (left_knee_pixel_x + 10, left_knee_pixel_y)
-            knee_angle = min(left_knee_angle, right_knee_angle)
+            knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
 
             # Draw the left leg in red if the knee angle is greater than the threshold
             draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
 
-            # Compare with previous Y positions to determine movement direction
-            if is_standing_up(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                              left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-                direction_text = "UP"
-                # Change in direction: going up now
-                if not going_up:
-                    count += 1
-                    going_up = True
-
-            elif is_squatting_down(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                                   left_knee_angle, right_knee_angle, average_left_knee_angle,
-                                   average_right_knee_angle):
-                direction_text = "DOWN"
-                going_up = False
-
-                # Calculate squat height
-                squat_start_height = (average_left_shoulder_y + average_right_shoulder_y) / 2
-
-                if knee_angle > KNEE_ANGLE_DEPTH:
-                    text_to_display = "Go lower!"
-                    draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display, font_scale=2,
-                              color=(0, 0, 255))
-            else:
-                direction_text = "STABLE"
-
-            current_shoulder_avg = (average_left_shoulder_y + average_right_shoulder_y) / 2
-            if going_up and current_shoulder_avg > squat_start_height * 0.8:
-                if len(video_processor.frame_history) >= 30:
-                    # sample 30 frames
-                    model_input = feature_extraction_data(mp_pose, video_processor.frame_history)
-                    print(len(model_input))
-                    # make prediction
-                    prediction = AttnLSTM.predict(np.expand_dims(model_input, axis=0), verbose=0)[0]
-                    video_processor.current_action = video_processor.actions[np.argmax(prediction)]
-
-                    print("Prediction: ", prediction)
-                    print("Max prediction", video_processor.current_action)
-
-                    # # Viz probabilities
-                    # img = video_processor.prob_viz(prediction, img)
-                    frame = video_processor.prob_viz(prediction, frame)
-
-                # clear frame history
-                video_processor.frame_history = []
+            knee_angle_text = f"{knee_angle:.2f} degrees"
+            draw_text(frame, knee_loc, knee_angle_text)
+            _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
+
+            if counter_obj.direction_text == "DOWN" and knee_angle > KNEE_ANGLE_DEPTH:
+                text_to_display = "Go lower!"
+                draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display, font_scale=2,
+                          color=(0, 0, 255))
 
             # Display the direction text on the frame
             cycle_x = 50
             cycle_y = 100
-            text_to_display = f"{direction_text} | Cycles: {count}"
+            text_to_display = f"{counter_obj.direction_text} | Cycles: {counter_obj.count}"
             draw_text(frame, (cycle_x, cycle_y), text_to_display)
 
             knee_info_x = 50
             knee_info_y = 200
-            knee_text = f"Left Knee: {average_left_knee_angle:.2f} degrees | Right Knee: {average_right_knee_angle:.2f} degrees"
+            knee_text = f"Left Knee: {knee_obj.avg_angle_left:.2f} degrees | Right Knee: {knee_obj.avg_angle_right:.2f} degrees"
             # show per frame values
-            # knee_text = f"Left Knee: {left_knee_angle:.2f} degrees | Right Knee: {right_knee_angle:.2f} degrees"
+            # knee_text = f"Left Knee: {knee_obj.left_angle:.2f} degrees | Right Knee: {knee_obj.right_angle:.2f} degrees"
             draw_text(frame, (knee_info_x, knee_info_y), knee_text)
 
-            knee_angle_text = f"{knee_angle:.2f} degrees"
-            draw_text(frame, knee_loc, knee_angle_text)
-            _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
-
-            # Update previous Y positions
-            prev_left_shoulder_y = left_shoulder_y
-            prev_right_shoulder_y = right_shoulder_y
-
             # Display the resulting frame
             cv2.imshow('Classification', frame)
 
@@ -309,6 +246,8 @@ def main():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    print(rep_classifier.stats_text())
+
     # Release the video capture
     cap.release()
 
@@ -6,12 +6,20 @@ from utils.draw_display import *
 from exercise.squat import *
 from collections import deque
 from utils.mediapipe_helper import * 
+from exercise.rep_segmentation import RepClassifier
+from utils.frame_buffers import FrameBuffers, to_video_frame
+from utils.presence import PresenceDetector, detect_pose
+from utils.quality import QualityController, QualityLevel, PoseGraphs
+from utils.constant import QUALITY_LEVELS, QUALITY_START_LEVEL, METRICS_ENABLED, MODEL_FPS
+from utils.metrics import PipelineMetrics
+from utils.profiling import profiler_from_env
 
 from keras.models import Model, load_model
 from keras.layers import (LSTM, Dense, Dropout, Input, Flatten, 
                                      Bidirectional, Permute, multiply)
 from collections import deque
 import av
+import time
 
 st.set_page_config(layout="wide")
 # Add custom CSS for styling
@@ -66,6 +74,8 @@ st.markdown("### ✨ Personalize Your Settings", unsafe_allow_html=True)
 threshold1 = st.slider("Keypoint Detection Confidence", 0.00, 1.00, 0.50, help="Adjust the sensitivity for mediapipe keypoint detection to ensure accurate pose detection.")
 threshold2 = st.slider("Tracking Confidence", 0.00, 1.00, 0.50, help="Set the stability level for consistent tracking throughout your workout.")
 KNEE_ANGLE_DEPTH = st.slider("Knee Angle for Sufficient Depth", 80, 160, 120, help="Select the perfect knee angle to hit the right depth for your squats.")
+show_hud = st.checkbox("Show performance overlay", False, help="Display frame rate, dropped frames and processing time per stage on the webcam video.")
+target_fps = st.slider("Target Frame Rate", 0, 30, 0, help="Lower the pose model, pose input size and overlay detail when the webcam video can not be processed at this many frames per second, 0 always keeps the full quality.")
 
 
 st.write("\n")
@@ -93,11 +103,7 @@ pose = mp_pose.Pose(min_detection_confidence=threshold1, min_tracking_confidence
 class VideoProcessor :
     def __init__(self):
         #Initilize parameters and variables
-        self.sequence_length = 30
         self.actions = ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Bad Shallow','Good']
-        self.sequence = deque(maxlen=self.sequence_length)
-
-        self.prediction_history = deque(maxlen=5)
         self.colors = [
             (245, 117, 16),  # Orange
             (117, 245, 16),  # Lime Green
@@ -107,16 +113,26 @@ class VideoProcessor :
             (255, 255, 0),    # Yellow
             (0, 255, 0)  # Green
         ]
-        # Initialize shoulder Y positions
-        self.shoulder_positions = deque(maxlen=NUM_FRAMES_SHOULDER)
-        self.left_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-        self.right_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-
-        # Initalize counter
-        self.count = 0
-        self.going_up = False
-
-        self.direction_text = "STABLE"
+        # AttnLSTM runs once per repetition instead of on every frame
+        self.rep_classifier = RepClassifier(AttnLSTM, mp_pose)
+
+        # Stage timings for the performance overlay, no-ops when it is off
+        self.show_hud = show_hud
+        self.metrics = PipelineMetrics(enabled=METRICS_ENABLED or show_hud, nominal_fps=MODEL_FPS)
+        # FV_PROFILE / FV_PROFILE_TRIGGER_MS, one profile folder entry per webcam session
+        self.profiler = profiler_from_env("webcam")
+        # RGB buffer for MediaPipe, reused for every frame
+        self.buffers = FrameBuffers()
+        # MediaPipe is skipped while nobody is in front of the camera
+        self.presence = PresenceDetector() if PRESENCE_ENABLED else None
+        # Pose model, Pose input size and overlay detail follow the target frame rate when one is set,
+        # the shared Pose graph is used otherwise
+        self.quality = QualityController(target_fps) if target_fps else None
+        self.level = (self.quality.level if self.quality is not None
+                      else QualityLevel(*QUALITY_LEVELS[QUALITY_START_LEVEL]))
+        self.pose_graphs = PoseGraphs(mp_pose, min_detection_confidence=threshold1,
+                                      min_tracking_confidence=threshold2)
+        self.pose = self.pose_graphs.get(self.level.model_complexity) if self.quality is not None else pose
 
     def prob_viz(self, res, input_frame):
         """
@@ -124,7 +140,8 @@ class VideoProcessor :
         as a horizontal bar graph
 
         """
-        output_frame = input_frame.copy()
+        # drawn into the frame in place, no copy of the whole frame
+        output_frame = input_frame
         font_size = 1.5
         for num, prob in enumerate(res):
             # change prob * ___ for longer length
@@ -138,148 +155,101 @@ class VideoProcessor :
         return output_frame
 
 
-    def inference_process(self, model, image, results):
+    def rep_inference_process(self, image, results):
         """
-        Function to process and run inference on AttnLSTM with real time video frame input
+        Feeds the frame to the rep segmentation and displays the prediction of the last finished repetition
 
         Args:
-            model: the AttnLSTM classification model
             image (numpy array): input image from the webcam
             results: Processed frame from mediapipe Pose
 
         Returns:
-            numpy array: processed image with keypoint detection and classification
+            numpy array: processed image with the classification of the last repetition
         """
+        self.rep_classifier.update(results, extract_keypoints(results))
 
-        # Prediction logic
-        keypoints = extract_keypoints(results)
-        moving_average = np.zeros(len(self.actions))
-        self.sequence.append(keypoints.astype('float32', casting='same_kind'))
-
-        if len(self.sequence) == self.sequence_length:
-            res = model.predict(np.expand_dims(list(self.sequence), axis=0), verbose=0)[0]
-            # self.current_action = self.actions[np.argmax(res)]
-            self.prediction_history.append(res)
-
-            if len(self.prediction_history) == self.prediction_history.maxlen:
-                moving_average = np.mean(self.prediction_history, axis=0)
-                self.current_action = self.actions[np.argmax(moving_average)]
+        prediction = self.rep_classifier.last_prediction
+        if prediction is None:
+            prediction = np.zeros(len(self.actions))
+        else:
+            self.current_action = self.actions[np.argmax(prediction)]
 
-            # Viz probabilities
-            image = self.prob_viz(moving_average, image)
+        return self.prob_viz(prediction, image)
 
-        return image
-    
     def process(self, frame):
-        knee_text_height = 10
-
+        process_start = time.perf_counter()
         frame_height, frame_width, _ = frame.shape
 
-        # Convert the BGR image to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Process the frame with MediaPipe Pose
-        results = pose.process(rgb_frame)
+        # Process the frame with MediaPipe Pose, unless the scene is empty
+        with self.metrics.span("pose"):
+            pose_frame = self.buffers.resize(frame, self.level.pose_size(frame))
+            results = detect_pose(self.pose, pose_frame, self.buffers, self.presence)
 
         # Draw landmarks on the frame
         if results.pose_landmarks:
 
-            mp.solutions.drawing_utils.draw_landmarks(frame,
-                                                    results.pose_landmarks,
-                                                    mp_pose.POSE_CONNECTIONS,
-                                                    mp.solutions.drawing_utils.DrawingSpec(color=(245, 117, 66),
-                                                                                            thickness=10,
-                                                                                            circle_radius=5),
-                                                    mp.solutions.drawing_utils.DrawingSpec(color=(255, 255, 255),
-                                                                                            thickness=10,
-                                                                                            circle_radius=5)
-                                                    )
-
-            # Get Y positions of the left and right shoulders
-            left_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER].y
-            right_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER].y
-
-            # Update deque with shoulder positions
-            self.shoulder_positions.append((left_shoulder_y, right_shoulder_y))
-
-            average_left_shoulder_y = sum(pos[0] for pos in self.shoulder_positions) / len(self.shoulder_positions)
-            average_right_shoulder_y = sum(pos[1] for pos in self.shoulder_positions) / len(self.shoulder_positions)
-
-            ###################### Calculate knee angles ######################
-            left_knee_angle, right_knee_angle = calculate_knee_angles(results, mp_pose)
-
-            self.left_knee_angles.append(left_knee_angle)
-            self.right_knee_angles.append(right_knee_angle)
-
-            # Calculate moving average of knee angles
-            average_left_knee_angle = sum(self.left_knee_angles) / len(self.left_knee_angles)
-            average_right_knee_angle = sum(self.right_knee_angles) / len(self.right_knee_angles)
-
-            left_knee_pixel_x = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].x * frame_width)
-            left_knee_pixel_y = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].y * frame_height)
-            knee_loc = (left_knee_pixel_x + 10, left_knee_pixel_y)
-            knee_angle = min(left_knee_angle, right_knee_angle)
-
-            # Draw the left leg in red if the knee angle is greater than the threshold
-            draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
-
-            # Compare with previous Y positions to determine movement direction
-            if is_standing_up_old(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                            left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-                self.direction_text = "UP"
-                # Change in direction: going up now
-                if not self.going_up:
-                    self.count += 1
-                    self.going_up = True
-
-            elif is_squatting_down_old(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                                left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-                self.direction_text = "DOWN"
-                self.going_up = False
-
-                if knee_angle > KNEE_ANGLE_DEPTH:
-                    text_to_display = "Go lower!"
-                    draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display, font_scale=2,
-                            color=(0, 0, 255))
-            else:
-                self.direction_text = "STABLE"
-
-            # Display the direction text on the frame
-            cycle_x = 0
-            cycle_y = 50
-            text_to_display = f"{self.direction_text} | Cycles: {self.count}"
-            draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
-
-            # knee_info_x = 50
-            # knee_info_y = 200
-            # knee_text = f"Left Knee: {average_left_knee_angle:.2f} degrees | Right Knee: {average_right_knee_angle:.2f} degrees"
-            # # show per frame values
-            # # knee_text = f"Left Knee: {left_knee_angle:.2f} degrees | Right Knee: {right_knee_angle:.2f} degrees"
-            # draw_text(frame, (knee_info_x, knee_info_y), knee_text)
-
-            knee_angle_text = f"{knee_angle:.2f} degrees"
-            draw_text(frame, knee_loc, knee_angle_text)
-            _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
-
-            # Update previous Y positions
-            prev_left_shoulder_y = left_shoulder_y
-            prev_right_shoulder_y = right_shoulder_y
-
-            # Process the frame with AttnLSTM model
-            frame = self.inference_process(AttnLSTM, frame, results)
-            # frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            with self.metrics.span("draw"):
+                if self.level.draws('full'):
+                    drawing_utils = mp.solutions.drawing_utils
+                    drawing_utils.draw_landmarks(frame,
+                                                 results.pose_landmarks,
+                                                 mp_pose.POSE_CONNECTIONS,
+                                                 drawing_utils.DrawingSpec(color=(245, 117, 66), thickness=10,
+                                                                           circle_radius=5),
+                                                 drawing_utils.DrawingSpec(color=(255, 255, 255), thickness=10,
+                                                                           circle_radius=5)
+                                                 )
+
+            # Process the frame with AttnLSTM model, classified once per repetition; the rep segmentation also
+            # keeps the counter and the knee angles shown below
+            with self.metrics.span("counter_classify"):
+                frame = self.rep_inference_process(frame, results)
+            counter, knee_obj = self.rep_classifier.counter, self.rep_classifier.segmenter.knee_obj
+
+            with self.metrics.span("overlay"):
+                if self.level.draws('basic'):
+                    knee_loc = (int(knee_obj.left.x * frame_width) + 10, int(knee_obj.left.y * frame_height))
+                    knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
+
+                    # Draw the left leg in red if the knee angle is greater than the threshold
+                    draw_leg_landmarks(mp, frame, results,
+                                       color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
+
+                    knee_angle_text = f"{knee_angle:.2f} degrees"
+                    draw_text(frame, knee_loc, knee_angle_text)
+                    _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
+
+                    if counter.direction_text == "DOWN" and knee_angle > KNEE_ANGLE_DEPTH:
+                        text_to_display = "Go lower!"
+                        draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display,
+                                  font_scale=2, color=(0, 0, 255))
+
+            # only frames with a person are timed, an empty scene says nothing about the cost of a squat
+            if self.quality is not None and self.quality.update(time.monotonic(), time.perf_counter() - process_start):
+                self.level = self.quality.level
+                self.pose = self.pose_graphs.get(self.level.model_complexity)
         else:
             frame = self.prob_viz(np.zeros(len(self.actions)), frame)
 
         # Display the direction text on the frame
         cycle_x = 0
         cycle_y = 50
-        text_to_display = f"{self.direction_text} | Cycles: {self.count}"
+        text_to_display = f"{self.rep_classifier.counter.direction_text} | Cycles: {self.rep_classifier.counter.count}"
         draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
 
         return frame
             
 
+    def on_ended(self):
+        """
+        Called by streamlit_webrtc when the webcam stream ends
+        """
+        # writes a profile still running when the stream stops
+        self.profiler.close()
+        self.pose_graphs.close()
+        if self.quality is not None:
+            print(self.quality.stats_text())
+
     def recv(self, frame):
         """
         Receive and process video stream from webcam
@@ -290,9 +260,18 @@ class VideoProcessor :
         Returns:
             av.VideoFrame: processed video frame
         """
-        img = frame.to_ndarray(format="bgr24")
-        img = self.process(img)
-        return av.VideoFrame.from_ndarray(img, format="bgr24")
+        self.profiler.frame_start()
+        with self.metrics.span("decode"):
+            img = frame.to_ndarray(format="bgr24")
+        with self.metrics.span("process"):
+            img = self.process(img)
+        # frames the async processing skipped show up as gaps in the frame times
+        self.metrics.frame_done(frame.time)
+        if self.show_hud:
+            self.metrics.draw_hud(img, position=(img.shape[1] - 320, 30))
+        self.profiler.frame_end()
+        # img is the array of the decoded frame with everything drawn in place, wrapped without a copy
+        return to_video_frame(img)
         
 
 ## Stream Webcam Video and Run Model
@@ -0,0 +1,231 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mediapipe as mp
+from utils.mediapipe_helper import *
+from utils.constant import *
+from utils.batch_inference import BatchedClassifier
+from utils.resample import TimestampedWindow
+from utils.stream_stats import StreamStats
+from utils.frame_buffers import FrameBuffers
+from utils.latest_frame import LatestFrameQueue
+from utils.motion_gate import MotionGate
+from utils.presence import PresenceDetector, detect_pose
+from utils.cascade import CascadeClassifier, LinearStage
+from utils.quality import QualityController, QualityLevel, PoseGraphs
+from exercise.rep_segmentation import RepSegmenter, sample_rep_window
+
+from camera_movement import create_model, ACTIONS
+
+
+def open_source(source):
+    """
+    Opens a camera index ("0"), a video file or a stream URL (rtsp://, http://)
+
+    """
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+class CameraStream:
+    """
+    One camera of the server. A capture thread keeps only the newest frame; frames that arrive while
+    the previous one is still waiting are dropped. Pose estimation runs on the shared worker pool,
+    never on two frames of the same stream at once (every stream owns a stateful Pose graph), and
+    classifier windows go to the shared BatchedClassifier.
+
+    """
+    def __init__(self, stream_id, source, mp_pose, pool, classifier, classify="rep",
+                 window_stride=SERVER_WINDOW_STRIDE, loop=False, motion_gate=MOTION_GATE_ENABLED,
+                 presence=PRESENCE_ENABLED, target_fps=None, target_latency=QUALITY_TARGET_LATENCY):
+        self.stream_id = stream_id
+        self.source = source
+        self.classifier = classifier
+        self.classify = classify
+        self.window_stride = window_stride
+        self.loop = loop
+
+        # the quality controller steps the Pose model, its input size and the window stride of this stream
+        self.quality = None
+        if target_fps:
+            self.quality = QualityController(target_fps, target_latency=target_latency,
+                                             log=lambda text: print(f"[{stream_id}] {text}"))
+            self.level = self.quality.level
+        else:
+            self.level = QualityLevel(*QUALITY_LEVELS[QUALITY_START_LEVEL])
+        self.pose_graphs = PoseGraphs(mp_pose)
+        self.pose = self.pose_graphs.get(self.level.model_complexity)
+        # frames of one stream are processed one at a time, the RGB buffer is reused
+        self.buffers = FrameBuffers()
+        # an idle camera skips MediaPipe while its scene is empty and static
+        self.presence = PresenceDetector() if presence else None
+        self.segmenter = RepSegmenter(mp_pose)
+        self.sequence = TimestampedWindow(classifier.model.input_shape[1])
+        # sliding windows are not classified while the user stands still
+        self.motion_gate = MotionGate() if motion_gate else None
+        self.stats = StreamStats()
+        self.last_prediction = None
+        # processed frames with a person, the window stride counts these: captured frame indices skip the
+        # frames dropped under load and could always miss the stride
+        self.person_frames = 0
+
+        # newest frame first on the shared pool, never two frames of this stream at once
+        self.frames = LatestFrameQueue(pool, self._process, on_drop=self.stats.frame_dropped, name=str(stream_id))
+        self.running = True
+        self.capture_thread = threading.Thread(target=self._capture, name=f"capture-{stream_id}", daemon=True)
+
+    def start(self):
+        self.capture_thread.start()
+
+    def _capture(self):
+        cap = open_source(self.source)
+        # files are played back at their own frame rate, like a camera would deliver them
+        is_file = os.path.isfile(self.source)
+        frame_interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or MODEL_FPS) if is_file else 0.0
+        next_frame_time = time.monotonic()
+        frame_index = 0
+
+        while self.running and cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                if is_file and self.loop:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+
+            if frame_interval:
+                next_frame_time += frame_interval
+                time.sleep(max(0.0, next_frame_time - time.monotonic()))
+
+            self.stats.frame_captured()
+            self.frames.offer((frame_index, time.monotonic(), frame))
+            frame_index += 1
+
+        cap.release()
+        self.running = False
+
+    def _process(self, frame_index, capture_time, frame):
+        process_start = time.perf_counter()
+        # Process the frame with MediaPipe Pose, unless the scene is empty
+        pose_frame = self.buffers.resize(frame, self.level.pose_size(frame))
+        results = detect_pose(self.pose, pose_frame, self.buffers, self.presence, capture_time)
+
+        if results.pose_landmarks:
+            keypoints = extract_keypoints(results)
+
+            if self.classify == "rep":
+                for event in self.segmenter.update(results, keypoints, frame_index, capture_time):
+                    if event['event'] == 'end':
+                        window = sample_rep_window(event['keypoints'], self.sequence.sequence_length,
+                                                   event['timestamps'])
+                        self.classifier.submit(window, self._on_prediction)
+            else:
+                self.segmenter.update(results, keypoints, frame_index, capture_time)
+                self.sequence.append(capture_time, keypoints)
+                self.person_frames += 1
+                moving = self.motion_gate is None or self.motion_gate.update(capture_time, keypoints)
+                # a lower quality level classifies every classify_stride th window only
+                stride = self.window_stride * self.level.classify_stride
+                if self.sequence.is_full() and self.person_frames % stride == 0:
+                    # the last prediction stays while the user stands still
+                    if moving:
+                        self.classifier.submit(self.sequence.window(), self._on_prediction)
+                    self.stats.inference_done(skipped=not moving)
+
+            # only frames with a person are timed, an empty scene says nothing about the cost of a squat
+            if self.quality is not None and self.quality.update(time.monotonic(), time.perf_counter() - process_start):
+                self.level = self.quality.level
+                self.pose = self.pose_graphs.get(self.level.model_complexity)
+
+        self.stats.frame_processed(capture_time)
+
+    def _on_prediction(self, prediction):
+        self.last_prediction = prediction
+
+    def stats_text(self, actions):
+        text = f"[{self.stream_id}] {self.stats.stats_text()} | Cycles: {self.segmenter.counter.count}"
+        if self.presence is not None:
+            text += f" | pose skipped on {self.presence.skipped_ratio():.0%} of frames"
+        if self.quality is not None:
+            text += f" | {self.quality.stats_text()}"
+        if self.last_prediction is not None:
+            text += f" | {actions[np.argmax(self.last_prediction)]}"
+        return text
+
+    def close(self):
+        self.running = False
+        self.capture_thread.join()
+        # wait for a frame still on the pool before closing its graph
+        self.frames.wait_idle()
+        self.pose_graphs.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Squat counting and classification for many cameras on one machine")
+    parser.add_argument("sources", nargs="+", help="camera indices, video files or rtsp:// / http:// stream URLs")
+    parser.add_argument("--workers", type=int, default=None, help="pose estimation threads, defaults to the CPU count")
+    parser.add_argument("--batch-size", type=int, default=SERVER_BATCH_SIZE)
+    parser.add_argument("--batch-wait", type=float, default=SERVER_BATCH_WAIT, help="seconds")
+    parser.add_argument("--classify", choices=["rep", "window"], default="rep",
+                        help="classify every finished repetition or a sliding window every --window-stride frames")
+    parser.add_argument("--window-stride", type=int, default=SERVER_WINDOW_STRIDE)
+    parser.add_argument("--loop", action="store_true", help="replay video files forever")
+    parser.add_argument("--cascade", nargs="?", const=CASCADE_MODEL_PATH, default=None, metavar="STAGE",
+                        help="first stage classifier (train_cascade.py), the AttnLSTM only runs when it is unsure")
+    parser.add_argument("--no-presence", action="store_true",
+                        help="run pose estimation on every frame, also while nobody is in front of a camera")
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="classify sliding windows also while the user stands still")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="adapt Pose model, Pose input size and window stride of every stream to process this "
+                             "many of its frames per second (utils/quality.py)")
+    parser.add_argument("--target-latency", type=float, default=QUALITY_TARGET_LATENCY * 1000,
+                        help="processing ms per frame (95th percentile) the quality controller holds")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args()
+
+    # Create LSTM model, shared by all streams
+    AttnLSTM = create_model()
+    if args.cascade:
+        AttnLSTM = CascadeClassifier(AttnLSTM, LinearStage.load(args.cascade))
+    mp_pose = mp.solutions.pose
+
+    classifier = BatchedClassifier(AttnLSTM, max_batch=args.batch_size, max_wait=args.batch_wait)
+    pool = ThreadPoolExecutor(max_workers=args.workers or os.cpu_count())
+    streams = [CameraStream(stream_id, source, mp_pose, pool, classifier, classify=args.classify,
+                            window_stride=args.window_stride, loop=args.loop,
+                            motion_gate=MOTION_GATE_ENABLED and not args.no_motion_gate,
+                            presence=PRESENCE_ENABLED and not args.no_presence,
+                            target_fps=args.target_fps, target_latency=args.target_latency / 1000)
+               for stream_id, source in enumerate(args.sources)]
+    for stream in streams:
+        stream.start()
+
+    start = time.monotonic()
+    try:
+        while any(stream.running for stream in streams):
+            time.sleep(STATS_INTERVAL)
+            for stream in streams:
+                print(stream.stats_text(ACTIONS))
+            print(classifier.stats_text())
+            if args.duration is not None and time.monotonic() - start > args.duration:
+                break
+    except KeyboardInterrupt:
+        pass
+
+    for stream in streams:
+        stream.close()
+    pool.shutdown()
+    classifier.close()
+
+    for stream in streams:
+        print(stream.stats_text(ACTIONS))
+    print(classifier.stats_text())
+    if args.cascade:
+        print(AttnLSTM.stats_text())
+
+
+if __name__ == "__main__":
+    main()
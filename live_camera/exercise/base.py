@@ -0,0 +1,171 @@
+import operator
+
+import numpy as np
+
+from utils.angles import joint_angles
+
+# MediaPipe Pose landmark values per frame
+LANDMARK_VALUES = ('x', 'y', 'z', 'visibility')
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+EXERCISES = {}
+
+
+def register_exercise(exercise):
+    EXERCISES[exercise.name] = exercise
+    return exercise
+
+
+def get_exercise(name):
+    return EXERCISES[name]
+
+
+def landmarks_from_results(results, dtype=np.float64):
+    """
+    Converts mediapipe Pose results to a (33, 4) array of x, y, z, visibility, NaN when nobody is detected
+
+    """
+    if not results.pose_landmarks:
+        return np.full((33, 4), np.nan, dtype=dtype)
+    return np.array([[res.x, res.y, res.z, res.visibility] for res in results.pose_landmarks.landmark], dtype=dtype)
+
+
+def rolling_mean(values, window):
+    """
+    Trailing moving average along the last (time) axis, the first frames average what is available.
+    Same values as appending to a deque(maxlen=window) and averaging it on every frame.
+
+    """
+    csum = np.cumsum(values, axis=-1)
+    shifted = np.zeros_like(csum)
+    shifted[..., window:] = csum[..., :-window]
+    counts = np.minimum(np.arange(1, values.shape[-1] + 1), window)
+    return (csum - shifted) / counts
+
+
+def going_up_state(up, down):
+    """
+    Vectorized Counter state: going_up turns True on an UP frame, False on a DOWN frame and holds otherwise
+
+    Returns:
+        tuple: (going_up after every frame, frames where a new repetition is counted)
+    """
+    # UP wins over DOWN, same as the if / elif order in Counter.update_counter
+    codes = np.where(up, 1, np.where(down, 0, -1))
+    n_frames = codes.shape[-1]
+
+    # forward fill the last decided state along time
+    frame_idx = np.arange(n_frames)
+    last_decided = np.maximum.accumulate(np.where(codes >= 0, frame_idx, -1), axis=-1)
+    filled = np.take_along_axis(codes, np.maximum(last_decided, 0), axis=-1)
+    going_up = np.where(last_decided >= 0, filled, 0).astype(bool)
+
+    previous = np.zeros_like(going_up)
+    previous[..., 1:] = going_up[..., :-1]
+    counted = up & ~previous
+    return going_up, counted
+
+
+class Exercise:
+    """
+    Declarative exercise plugin. An exercise only lists data:
+
+    joints: {joint name: MediaPipe landmark index}, gives features <joint>_x, <joint>_y, <joint>_z, <joint>_visibility
+    angles: {angle name: (first joint, mid joint, end joint)}, angle at the mid joint in the image plane
+    averages: {feature name: window in frames}, gives feature avg_<feature name>
+    thresholds: {threshold name: value}
+    phases: {phase name: [(feature, op, reference, offset), ...]}
+        a phase is true on frames where every rule holds: feature op reference + offset.
+        reference and offset are feature names, threshold names or numbers, offset is optional.
+        A leading '-' negates a named value.
+
+    The RuleEngine evaluates all of it over whole arrays of frames at once.
+
+    """
+    def __init__(self, name, joints, angles, averages, thresholds, phases, up_phase='up', down_phase='down'):
+        self.name = name
+        self.joints = joints
+        self.angles = angles
+        self.averages = averages
+        self.thresholds = thresholds
+        self.phases = phases
+        self.up_phase = up_phase
+        self.down_phase = down_phase
+
+    def with_thresholds(self, **thresholds):
+        """
+        Copy of the exercise with some thresholds replaced, e.g. the knee depth slider of the Streamlit apps
+
+        """
+        return Exercise(self.name, self.joints, self.angles, self.averages, {**self.thresholds, **thresholds},
+                        self.phases, self.up_phase, self.down_phase)
+
+
+class RuleEngine:
+    """
+    Evaluates an Exercise over batches of frames with NumPy.
+
+    evaluate() takes landmarks of shape (..., frames, 33, 4), e.g. (frames, 33, 4) for one session
+    or (sessions, frames, 33, 4) for many sessions of the same length. Like the live loops, which skip
+    frames without a detected person, frames without landmarks should be left out.
+
+    """
+    def __init__(self, exercise):
+        self.exercise = exercise
+
+    def _resolve(self, features, value):
+        if isinstance(value, str):
+            if value.startswith('-'):
+                return -self._resolve(features, value[1:])
+            if value in features:
+                return features[value]
+            return self.exercise.thresholds[value]
+        return value
+
+    def features(self, landmarks):
+        landmarks = np.asarray(landmarks, dtype=np.float64)
+        features = {}
+        for joint, index in self.exercise.joints.items():
+            for value_index, value_name in enumerate(LANDMARK_VALUES):
+                features[f"{joint}_{value_name}"] = landmarks[..., index, value_index]
+
+        for angle, (first, mid, end) in self.exercise.angles.items():
+            xy = [landmarks[..., self.exercise.joints[joint], :2] for joint in (first, mid, end)]
+            features[angle] = joint_angles(*xy)
+
+        for feature, window in self.exercise.averages.items():
+            features[f"avg_{feature}"] = rolling_mean(features[feature], window)
+
+        return features
+
+    def evaluate(self, landmarks):
+        """
+        Returns:
+            tuple: (features dict, phases dict) of arrays shaped (..., frames)
+        """
+        features = self.features(landmarks)
+        phases = {}
+        for phase, rules in self.exercise.phases.items():
+            result = None
+            for rule in rules:
+                feature, op, reference = rule[:3]
+                offset = self._resolve(features, rule[3]) if len(rule) > 3 else 0
+                holds = OPERATORS[op](self._resolve(features, feature), self._resolve(features, reference) + offset)
+                result = holds if result is None else result & holds
+            phases[phase] = result
+        return features, phases
+
+    def count_reps(self, landmarks):
+        """
+        Number of repetitions per session, same counting as the Counter class
+
+        """
+        _, phases = self.evaluate(landmarks)
+        _, counted = going_up_state(phases[self.exercise.up_phase], phases[self.exercise.down_phase])
+        return counted.sum(axis=-1)
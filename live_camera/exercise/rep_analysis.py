@@ -0,0 +1,66 @@
+import numpy as np
+
+from exercise.rep_segmentation import RepSegmenter, sample_rep_window
+from utils.constant import REP_BATCH_SIZE
+from utils.dtypes import check_array
+from utils.mediapipe_helper import extract_keypoints
+from utils.video_io import iter_timed_frames, upload_bytes
+
+
+def classify_reps(model, reps, class_labels, sequence_length):
+    """
+    Classifies a batch of repetitions with a single predict call
+
+    Returns:
+        list: one dict per repetition with its frame range and class probabilities
+    """
+    X = np.stack([sample_rep_window(rep['keypoints'], sequence_length, rep['timestamps']) for rep in reps])
+    check_array(X, (None,) + tuple(model.input_shape[1:]), name="windows")
+    predictions = model.predict(X, verbose=0)
+
+    return [{
+        'start_frame': rep['start_frame'],
+        'bottom_frame': rep['bottom_frame'],
+        'end_frame': rep['frame'],
+        'probabilities': {class_label: prob for class_label, prob in zip(class_labels, prediction)},
+    } for rep, prediction in zip(reps, predictions)]
+
+
+def analyze_video_reps(uploaded_file, model, pose, mp_pose, class_labels, extract_fn=extract_keypoints,
+                       batch_size=REP_BATCH_SIZE):
+    """
+    Decodes a video once, tracks the pose on every frame and classifies every repetition.
+    Only one decoded frame, the repetition in progress and batch_size finished repetitions
+    are held in memory, whatever the length of the video.
+
+    Args:
+        uploaded_file: Streamlit UploadedFile, bytes or file-like object
+        model: the AttnLSTM classification model
+        pose: mediapipe Pose in tracking mode, fresh for every video
+        mp_pose: Mediapipe pose solution
+        class_labels (list): class names in model output order
+        extract_fn: keypoint extraction matching the model input
+        batch_size (int): repetitions classified together
+
+    Returns:
+        list: per repetition dicts with start_frame, bottom_frame, end_frame and probabilities
+    """
+    sequence_length = model.input_shape[1]
+    segmenter = RepSegmenter(mp_pose)
+    rep_results = []
+    pending = []
+
+    # frames are decoded straight to RGB, nothing is drawn on them
+    for frame_index, timestamp, frame in iter_timed_frames(upload_bytes(uploaded_file), format="rgb24"):
+        results = pose.process(frame)
+        events = segmenter.update(results, extract_fn(results), frame_index, timestamp)
+        pending.extend(event for event in events if event['event'] == 'end')
+        if len(pending) >= batch_size:
+            rep_results.extend(classify_reps(model, pending, class_labels, sequence_length))
+            pending = []
+
+    pending.extend(segmenter.flush())
+    if pending:
+        rep_results.extend(classify_reps(model, pending, class_labels, sequence_length))
+
+    return rep_results
@@ -0,0 +1,203 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from exercise.squat import Counter
+from utils.angles import calculate_knee_angles
+from utils.dtypes import feature_dtype, buffer_dtype, check_array
+from utils.constant import (NUM_FRAMES_SHOULDER, NUM_FRAMES_KNEE, SMOOTHED_NUM_FRAMES_SHOULDER,
+                            SMOOTHED_NUM_FRAMES_KNEE, MAX_REP_FRAMES)
+from utils.landmark_data import LandmarkData
+from utils.resample import resample_window
+from utils.smoothing import LandmarkSmoother
+from utils.video_io import sample_frame_indices
+
+
+def sample_rep_window(rep_keypoints, sequence_length, timestamps=None):
+    """
+    Resamples one repetition to sequence_length frames.
+    With timestamps the frames are interpolated onto a grid evenly spaced in time, so the camera fps
+    and dropped frames do not change what the model sees. Without, evenly spaced frames are picked.
+
+    """
+    if timestamps is not None:
+        return resample_window(timestamps, np.stack(rep_keypoints).astype(feature_dtype, copy=False), sequence_length)
+
+    frame_indices = sample_frame_indices(len(rep_keypoints), sequence_length)
+    return np.stack([rep_keypoints[i] for i in frame_indices]).astype(feature_dtype, copy=False)
+
+
+def stopped_rising(segmenter):
+    """
+    End trigger: the repetition ends on the first frame the user is no longer going UP
+
+    """
+    return segmenter.counter.direction_text != "UP"
+
+
+def shoulder_height_recovered(ratio=0.8):
+    """
+    End trigger from camera_movement_record.py: the repetition ends once the shoulders are back
+    above ratio * the shoulder height at the start of the squat
+
+    """
+    def trigger(segmenter):
+        shoulder_obj = segmenter.shoulder_obj
+        current_shoulder_avg = (shoulder_obj.avg_val_left + shoulder_obj.avg_val_right) / 2
+        return segmenter.counter.going_up and current_shoulder_avg > segmenter.squat_start_height * ratio
+
+    return trigger
+
+
+class RepSegmenter:
+    """
+    Follows the squat Counter through a stream of frames and cuts out the keypoints of every repetition.
+    A repetition starts on the first DOWN frame, reaches the bottom when the Counter counts it
+    and ends when end_trigger fires (by default the first frame the user is no longer going UP).
+
+    update() returns the events of the frame as dicts:
+        {'event': 'start', 'frame': i}
+        {'event': 'bottom', 'frame': i}
+        {'event': 'end', 'frame': i, 'start_frame': s, 'bottom_frame': b, 'keypoints': [...], 'timestamps': [...]}
+
+    Only frames with detected landmarks enter the repetition, gaps are interpolated over by their timestamps.
+
+    With a landmark_filter (utils/smoothing.py) the landmarks are smoothed in place before the counter sees them
+    and the counter compares against the shorter SMOOTHED_NUM_FRAMES_* moving averages, which detects
+    repetitions sooner. The keypoints passed in for the classifier are not changed.
+
+    """
+    def __init__(self, mp_pose, end_trigger=stopped_rising, max_rep_frames=MAX_REP_FRAMES, landmark_filter=None):
+        self.mp_pose = mp_pose
+        self.end_trigger = end_trigger
+        self.smoother = LandmarkSmoother(landmark_filter) if landmark_filter is not None else None
+        shoulder_frames = NUM_FRAMES_SHOULDER if self.smoother is None else SMOOTHED_NUM_FRAMES_SHOULDER
+        knee_frames = NUM_FRAMES_KNEE if self.smoother is None else SMOOTHED_NUM_FRAMES_KNEE
+        self.shoulder_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER,
+                                         shoulder_frames)
+        self.knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, knee_frames)
+        self.counter = Counter()
+
+        # (frame index, timestamp, keypoints) of the repetition in progress, bounded so a stuck rep can not grow forever
+        self.rep_frames = deque(maxlen=max_rep_frames)
+        self.frame_index = -1
+        self.start_frame = None
+        self.bottom_frame = None
+        self.squat_start_height = None
+
+    def _end_event(self, end_frame):
+        event = {
+            'event': 'end',
+            'frame': end_frame,
+            'start_frame': max(self.start_frame, self.rep_frames[0][0]),
+            'bottom_frame': self.bottom_frame,
+            'keypoints': [keypoints for _, _, keypoints in self.rep_frames],
+            'timestamps': [timestamp for _, timestamp, _ in self.rep_frames],
+        }
+        self.rep_frames.clear()
+        self.start_frame = None
+        self.bottom_frame = None
+        return event
+
+    def update(self, results, keypoints, frame_index=None, timestamp=None):
+        """
+        Feeds one frame to the segmenter
+
+        Args:
+            results: Processed frame from mediapipe Pose
+            keypoints (numpy array): model input features of the frame, FEATURE_DTYPE, kept as BUFFER_DTYPE
+            frame_index (int): index of the frame in the video, counted internally when None
+            timestamp (float): capture or presentation time in seconds, time of the call when None
+
+        Returns:
+            list: events of this frame, usually empty
+        """
+        self.frame_index = self.frame_index + 1 if frame_index is None else frame_index
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        events = []
+        if keypoints is not None:
+            check_array(keypoints, (None,), name="keypoints")
+
+        if self.smoother is not None:
+            self.smoother.apply(results, timestamp)
+
+        if results.pose_landmarks:
+            # update landmark data first, the counter depends on it
+            self.shoulder_obj.update_values(results)
+            self.knee_obj.update_values(results)
+            self.knee_obj.update_angles(*calculate_knee_angles(results, self.mp_pose))
+
+            count_before = self.counter.count
+            self.counter.update_counter(self.shoulder_obj, self.knee_obj)
+
+            if self.counter.count != count_before and self.start_frame is not None:
+                self.bottom_frame = self.frame_index
+                events.append({'event': 'bottom', 'frame': self.frame_index})
+            elif self.bottom_frame is not None and self.end_trigger(self):
+                events.append(self._end_event(self.frame_index))
+
+            if self.counter.direction_text == "DOWN":
+                # updated on every DOWN frame as in camera_movement_record.py, shoulder_height_recovered
+                # compares against the shoulders of the last DOWN frame, not of the first one
+                self.squat_start_height = (self.shoulder_obj.avg_val_left + self.shoulder_obj.avg_val_right) / 2
+                if self.start_frame is None:
+                    self.start_frame = self.frame_index
+                    events.append({'event': 'start', 'frame': self.frame_index})
+
+            if self.start_frame is not None:
+                self.rep_frames.append((self.frame_index, timestamp,
+                                        None if keypoints is None else keypoints.astype(buffer_dtype, copy=False)))
+
+        return events
+
+    def flush(self):
+        """
+        Ends the repetition still in progress (end of a video) if it already reached the bottom
+
+        """
+        if self.bottom_frame is None:
+            return []
+        return [self._end_event(self.frame_index)]
+
+
+class RepClassifier:
+    """
+    Runs the classification model once per repetition instead of on every frame.
+    Each finished repetition is resampled to the model sequence length.
+
+    """
+    def __init__(self, model, mp_pose, end_trigger=stopped_rising, landmark_filter=None):
+        self.model = model
+        self.sequence_length = model.input_shape[1]
+        self.segmenter = RepSegmenter(mp_pose, end_trigger=end_trigger, landmark_filter=landmark_filter)
+
+        self.last_prediction = None
+        self.frames = 0
+        self.classifier_calls = 0
+
+    @property
+    def counter(self):
+        return self.segmenter.counter
+
+    def update(self, results, keypoints, frame_index=None, timestamp=None):
+        """
+        Feeds one frame, classifies the repetition if it just ended
+
+        Returns:
+            numpy array: class probabilities of the repetition that ended on this frame, or None
+        """
+        self.frames += 1
+        prediction = None
+        for event in self.segmenter.update(results, keypoints, frame_index, timestamp):
+            if event['event'] == 'end':
+                window = sample_rep_window(event['keypoints'], self.sequence_length, event['timestamps'])
+                check_array(window, self.model.input_shape[1:], name="window")
+                prediction = self.model.predict(np.expand_dims(window, axis=0), verbose=0)[0]
+                self.classifier_calls += 1
+                self.last_prediction = prediction
+
+        return prediction
+
+    def stats_text(self):
+        return f"{self.classifier_calls} classifier calls for {self.frames} frames"
@@ -1,5 +1,6 @@
 from utils.constant import *
 from utils.draw_display import *
+from exercise.base import Exercise, register_exercise
 
 
 def process_shallow(frame, counter, knee_obj):
@@ -133,6 +134,82 @@ def knee_straightening(left_knee_angle, right_knee_angle, left_average, right_av
             and right_knee_angle > right_average)
 
 
+class Counter:
+    def __init__(self):
+        self.count = 0
+        self.direction_text = "STABLE"
+        self.going_up = False
+
+    def update_counter(self, shoulder_obj, knee_obj):
+        # Compare with previous Y positions to determine movement direction
+        if is_standing_up(shoulder_obj, knee_obj):
+            self.direction_text = "UP"
+            # Change in direction: going up now
+            if not self.going_up:
+                self.count += 1
+                self.going_up = True
+
+        elif is_squatting_down(shoulder_obj, knee_obj):
+            self.direction_text = "DOWN"
+            self.going_up = False
+
+        else:
+            self.direction_text = "STABLE"
+
+
+# Declarative version of the rules above for the vectorized RuleEngine
+SQUAT = register_exercise(Exercise(
+    name='squat',
+    joints={
+        'left_shoulder': 11, 'right_shoulder': 12,
+        'left_hip': 23, 'right_hip': 24,
+        'left_knee': 25, 'right_knee': 26,
+        'left_ankle': 27, 'right_ankle': 28,
+    },
+    angles={
+        'left_knee_angle': ('left_hip', 'left_knee', 'left_ankle'),
+        'right_knee_angle': ('right_hip', 'right_knee', 'right_ankle'),
+    },
+    averages={
+        'left_shoulder_y': NUM_FRAMES_SHOULDER,
+        'right_shoulder_y': NUM_FRAMES_SHOULDER,
+        'left_knee_angle': NUM_FRAMES_KNEE,
+        'right_knee_angle': NUM_FRAMES_KNEE,
+    },
+    thresholds={
+        'movement': MOVEMENT_THR,
+        'bending': 170,
+        'straightening': 90,
+        'depth': KNEE_ANGLE_DEPTH,
+    },
+    phases={
+        # is_shoulder_downwards and knee_bending
+        'down': [
+            ('left_shoulder_y', '>', 'avg_left_shoulder_y', 'movement'),
+            ('right_shoulder_y', '>', 'avg_right_shoulder_y', 'movement'),
+            ('left_knee_angle', '<', 'bending'),
+            ('left_knee_angle', '<', 'avg_left_knee_angle'),
+            ('right_knee_angle', '<', 'bending'),
+            ('right_knee_angle', '<', 'avg_right_knee_angle'),
+        ],
+        # is_shoulder_upwards and knee_straightening
+        'up': [
+            ('left_shoulder_y', '<', 'avg_left_shoulder_y', '-movement'),
+            ('right_shoulder_y', '<', 'avg_right_shoulder_y', '-movement'),
+            ('left_knee_angle', '>', 'straightening'),
+            ('left_knee_angle', '>', 'avg_left_knee_angle'),
+            ('right_knee_angle', '>', 'straightening'),
+            ('right_knee_angle', '>', 'avg_right_knee_angle'),
+        ],
+        # process_shallow depth check, min knee angle above the depth threshold
+        'shallow': [
+            ('left_knee_angle', '>', 'depth'),
+            ('right_knee_angle', '>', 'depth'),
+        ],
+    },
+))
+
+
 # OLDER CODE
 def is_squatting_down_old(left_shoulder, right_shoulder, average_left_shoulder, average_right_shoulder, left_knee_angle, right_knee_angle, left_knee_average, right_knee_average, threshold=170):
 
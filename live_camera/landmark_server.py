@@ -0,0 +1,229 @@
+"""
+Live squat counting and classification in the browser, with the overlay drawn by the browser.
+
+The page (static/landmark_overlay.html) sends the webcam to the server as a send-only WebRTC video track and
+shows the local camera itself. The server runs presence detection, MediaPipe Pose, the counter and the
+repetition classifier on the received frames and sends back only the state of every frame (landmarks, knee
+angles, counter, class probabilities; utils/landmark_message.py, a few hundred bytes) over a data channel.
+The page draws skeleton, bars and text on a canvas over its video. Nothing is drawn or video encoded on
+the server, compared to the SENDRECV stream of realtime_upload.py which returns every 1280x720 frame.
+
+Frames of one session are processed one at a time on a shared thread pool; frames that arrive while the
+previous one is still processed are dropped, the newest one waits. Needs aiohttp and aiortc:
+    python landmark_server.py [--port 8080] [--cascade]
+and open http://localhost:8080 (browsers only give camera access to localhost or https pages).
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mediapipe as mp
+from aiohttp import web
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+from utils.mediapipe_helper import *
+from utils.constant import *
+from utils.batch_inference import BatchedClassifier
+from utils.stream_stats import StreamStats
+from utils.latest_frame import LatestFrameQueue
+from utils.presence import PresenceDetector
+from utils.cascade import CascadeClassifier, LinearStage
+from utils.landmark_message import hello_message, pack_frame_state
+from exercise.rep_segmentation import RepSegmenter, sample_rep_window
+
+from camera_movement import create_model, ACTIONS
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+class LandmarkSession:
+    """
+    One browser connection: its Pose graph, counter and repetition segmentation, and the data channel the
+    frame states go to. Repetitions are classified on the shared BatchedClassifier, the prediction goes out
+    with the following frames.
+
+    """
+    def __init__(self, session_id, mp_pose, pool, classifier, loop, presence=PRESENCE_ENABLED):
+        self.session_id = session_id
+        self.classifier = classifier
+        self.loop = loop
+
+        self.pose = mp_pose.Pose()
+        # the presence detector only compares frames with each other, RGB frames work like BGR ones
+        self.presence = PresenceDetector() if presence else None
+        self.segmenter = RepSegmenter(mp_pose)
+        self.sequence_length = classifier.model.input_shape[1]
+        self.stats = StreamStats()
+        self.last_prediction = ()
+        self.channel = None
+        self.message_bytes = 0
+
+        # newest frame first on the shared pool, never two frames of this session at once
+        self.frames = LatestFrameQueue(pool, self._process, on_drop=self.stats.frame_dropped, name=str(session_id))
+
+    async def consume(self, track):
+        """
+        Receives the video track until it ends, the newest frame is offered to the pool
+        """
+        while True:
+            try:
+                frame = await track.recv()
+            except Exception:
+                # MediaStreamError when the browser stops the track or the connection closes
+                return
+            self.stats.frame_captured()
+            self.frames.offer((frame, time.monotonic()))
+
+    def _process(self, frame, arrival_time):
+        # MediaPipe reads RGB, the frame is converted from the decoder output once
+        image = frame.to_ndarray(format="rgb24")
+        if self.presence is None or self.presence.check(image, arrival_time):
+            results = self.pose.process(image)
+            if self.presence is not None:
+                self.presence.report(results.pose_landmarks is not None)
+        else:
+            results = None
+
+        counter, knee_obj = self.segmenter.counter, self.segmenter.knee_obj
+        if results is not None and results.pose_landmarks:
+            keypoints = extract_keypoints(results)
+            for event in self.segmenter.update(results, keypoints, timestamp=arrival_time):
+                if event['event'] == 'end':
+                    window = sample_rep_window(event['keypoints'], self.sequence_length, event['timestamps'])
+                    self.classifier.submit(window, self._on_prediction)
+            knee_angles = (knee_obj.left_angle, knee_obj.right_angle)
+            # same warning as process_shallow
+            go_lower = not counter.going_up and min(knee_angles) > KNEE_ANGLE_DEPTH
+            message = pack_frame_state(frame.time or 0.0, counter, keypoints, knee_angles, self.last_prediction,
+                                       go_lower)
+        else:
+            message = pack_frame_state(frame.time or 0.0, counter, probabilities=self.last_prediction)
+
+        self.loop.call_soon_threadsafe(self._send, message)
+        self.stats.frame_processed(arrival_time)
+
+    def _send(self, message):
+        if self.channel is not None and self.channel.readyState == "open":
+            self.channel.send(message)
+            self.message_bytes += len(message)
+
+    def _on_prediction(self, prediction):
+        self.last_prediction = prediction
+
+    def stats_text(self):
+        text = f"[{self.session_id}] {self.stats.stats_text()} | Cycles: {self.segmenter.counter.count}"
+        if self.stats.processed:
+            text += f" | {self.message_bytes / self.stats.processed:.0f} bytes per frame sent"
+        if self.presence is not None:
+            text += f" | pose skipped on {self.presence.skipped_ratio():.0%} of frames"
+        return text
+
+    def close(self):
+        # wait for a frame still on the pool before closing its graph
+        self.frames.wait_idle()
+        self.pose.close()
+
+
+async def index(request):
+    return web.FileResponse(os.path.join(STATIC_DIR, "landmark_overlay.html"))
+
+
+async def offer(request):
+    """
+    Answers the SDP offer of the page. The page only sends video, the answer only receives it, so the
+    server never encodes a frame.
+    """
+    app = request.app
+    params = await request.json()
+    pc = RTCPeerConnection()
+    session = LandmarkSession(next(app["session_ids"]), app["mp_pose"], app["pool"], app["classifier"],
+                              asyncio.get_running_loop(), presence=app["presence"])
+    app["sessions"][pc] = session
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        if channel.label == LANDMARK_CHANNEL:
+            session.channel = channel
+            channel.send(hello_message(app["actions"], KNEE_ANGLE_DEPTH))
+
+    @pc.on("track")
+    def on_track(track):
+        if track.kind == "video":
+            asyncio.ensure_future(session.consume(track))
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        if pc.connectionState in ("failed", "closed"):
+            await close_session(app, pc)
+
+    await pc.setRemoteDescription(RTCSessionDescription(sdp=params["sdp"], type=params["type"]))
+    await pc.setLocalDescription(await pc.createAnswer())
+    return web.json_response({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type})
+
+
+async def close_session(app, pc):
+    session = app["sessions"].pop(pc, None)
+    await pc.close()
+    if session is not None:
+        await asyncio.get_running_loop().run_in_executor(None, session.close)
+        print(session.stats_text())
+
+
+async def print_stats(app):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        for session in app["sessions"].values():
+            print(session.stats_text())
+        if app["sessions"]:
+            print(app["classifier"].stats_text())
+
+
+async def on_startup(app):
+    app["stats_task"] = asyncio.ensure_future(print_stats(app))
+
+
+async def on_shutdown(app):
+    app["stats_task"].cancel()
+    for pc in list(app["sessions"]):
+        await close_session(app, pc)
+    app["pool"].shutdown()
+    app["classifier"].close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=LANDMARK_SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="pose estimation threads, defaults to the CPU count")
+    parser.add_argument("--cascade", nargs="?", const=CASCADE_MODEL_PATH, default=None, metavar="STAGE",
+                        help="classify repetitions with the first stage (train_cascade.py) and run the AttnLSTM "
+                             "only when it is not confident")
+    parser.add_argument("--no-presence", action="store_true",
+                        help="run MediaPipe on every frame, also while nobody is in front of the camera")
+    args = parser.parse_args()
+
+    # Create LSTM model, shared by all sessions
+    AttnLSTM = create_model()
+    if args.cascade:
+        AttnLSTM = CascadeClassifier(AttnLSTM, LinearStage.load(args.cascade))
+
+    app = web.Application()
+    app["mp_pose"] = mp.solutions.pose
+    app["actions"] = ACTIONS
+    app["classifier"] = BatchedClassifier(AttnLSTM)
+    app["pool"] = ThreadPoolExecutor(max_workers=args.workers or os.cpu_count())
+    app["presence"] = PRESENCE_ENABLED and not args.no_presence
+    app["sessions"] = {}
+    app["session_ids"] = itertools.count()
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.router.add_get("/", index)
+    app.router.add_post("/offer", offer)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,11 @@ from utils.draw_display import *
 from exercise.squat import *
 from collections import deque
 from utils.mediapipe_helper import * 
+from utils.resample import TimestampedWindow
+import time
+from exercise.rep_segmentation import RepClassifier
+from utils.frame_buffers import FrameBuffers
+from utils.presence import PresenceDetector, detect_pose
 
 from tensorflow import keras
 from keras.models import Model, load_model
@@ -80,10 +85,19 @@ class VideoProcessor :
         #Initilize parameters and variables
         self.sequence_length = 30
         self.actions = ['Bad Head', 'Bad Back Round', 'Bad Back Warp', 'Bad Lifted Heels', 'Bad Inward Knee', 'Bad_Shallow','Good']
-        self.sequence = deque(maxlen=self.sequence_length)
+        # last frames with their capture time, resampled to the model frame rate
+        self.sequence = TimestampedWindow(self.sequence_length)
 
         self.prediction_history = deque(maxlen=5)
         self.counter = 0
+        # created on the first frame, AttnLSTM then runs once per repetition
+        self.rep_classifier = None
+        # one MediaPipe Pose graph for the whole session, created on the first frame
+        self.pose = None
+        # frame buffers reused for every frame (RGB for MediaPipe, capture and resize in tkinter_gui)
+        self.buffers = FrameBuffers()
+        # MediaPipe is skipped while nobody is in front of the camera
+        self.presence = PresenceDetector() if PRESENCE_ENABLED else None
         self.colors = [
             (245, 117, 16),  # Orange
             (117, 245, 16),  # Lime Green
@@ -101,7 +115,8 @@ class VideoProcessor :
         as a horizontal bar graph
         
         """
-        output_frame = input_frame.copy()
+        # drawn into the frame in place, no copy of the whole frame
+        output_frame = input_frame
         font_size = 1
         for num, prob in enumerate(res):
             # change prob * ___ for longer length
@@ -113,6 +128,29 @@ class VideoProcessor :
         return output_frame
 
 
+    def rep_inference_process(self, model, image, results):
+        """
+        Feeds the frame to the rep segmentation and displays the prediction of the last finished repetition
+
+        Args:
+            model: the AttnLSTM classification model
+            image (numpy array): input image from the webcam
+            results: Processed frame from mediapipe Pose
+
+        Returns:
+            numpy array: processed image with the classification of the last repetition
+        """
+        if self.rep_classifier is None:
+            self.rep_classifier = RepClassifier(model, mp.solutions.pose)
+        self.rep_classifier.update(results, extract_keypoints(results))
+
+        prediction = self.rep_classifier.last_prediction
+        if prediction is not None:
+            self.current_action = self.actions[np.argmax(prediction)]
+            image = self.prob_viz(prediction, image)
+
+        return image
+
     def inference_process(self, model, image, results):
         """
         Function to process and run inference on AttnLSTM with real time video frame input
@@ -129,10 +167,10 @@ class VideoProcessor :
         # Prediction logic
         keypoints = extract_keypoints(results)
         moving_average = np.zeros(len(self.actions))
-        self.sequence.append(keypoints.astype('float32', casting='same_kind'))
+        self.sequence.append(time.monotonic(), keypoints)
 
-        if len(self.sequence) == self.sequence_length:
-            res = model.predict(np.expand_dims(list(self.sequence), axis=0), verbose=0)[0]
+        if self.sequence.is_full():
+            res = model.predict(np.expand_dims(self.sequence.window(), axis=0), verbose=0)[0]
             # self.current_action = self.actions[np.argmax(res)]
             self.prediction_history.append(res)
 
@@ -147,27 +185,16 @@ class VideoProcessor :
 
 
 def analysis(frame, AttnLSTM, video_processor):
-    # Initialize MediaPipe Pose
+    # Initialize MediaPipe Pose once, a new graph per frame is slow, loses tracking and is never released
     mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose()
-
-    # Initialize shoulder Y positions
-    shoulder_positions = deque(maxlen=NUM_FRAMES_SHOULDER)
-    left_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-    right_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-
-    # Initalize counter
-    count = 0
-    going_up = False
-    knee_text_height = ""
+    if video_processor.pose is None:
+        video_processor.pose = mp_pose.Pose()
+    pose = video_processor.pose
 
     frame_height, frame_width, _ = frame.shape
 
-    # Convert the BGR image to RGB
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    # Process the frame with MediaPipe Pose
-    results = pose.process(rgb_frame)
+    # Process the frame with MediaPipe Pose, unless the scene is empty
+    results = detect_pose(pose, frame, video_processor.buffers, video_processor.presence)
 
     # Draw landmarks on the frame
     if results.pose_landmarks:
@@ -183,54 +210,26 @@ def analysis(frame, AttnLSTM, video_processor):
                                                                                          circle_radius=5)
                                                   )
 
-        # Get Y positions of the left and right shoulders
-        left_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER].y
-        right_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER].y
-
-        # Update deque with shoulder positions
-        shoulder_positions.append((left_shoulder_y, right_shoulder_y))
-
-        average_left_shoulder_y = sum(pos[0] for pos in shoulder_positions) / len(shoulder_positions)
-        average_right_shoulder_y = sum(pos[1] for pos in shoulder_positions) / len(shoulder_positions)
+        # Update landmark data, knee angles and counter, AttnLSTM runs when a repetition ends
+        frame = video_processor.rep_inference_process(AttnLSTM, frame, results)
+        knee_obj = video_processor.rep_classifier.segmenter.knee_obj
+        counter_obj = video_processor.rep_classifier.counter
+        direction_text = counter_obj.direction_text
+        count = counter_obj.count
 
-        ###################### Calculate knee angles ######################
-        left_knee_angle, right_knee_angle = calculate_knee_angles(results, mp_pose)
-
-        left_knee_angles.append(left_knee_angle)
-        right_knee_angles.append(right_knee_angle)
-
-        # Calculate moving average of knee angles
-        average_left_knee_angle = sum(left_knee_angles) / len(left_knee_angles)
-        average_right_knee_angle = sum(right_knee_angles) / len(right_knee_angles)
-
-        left_knee_pixel_x = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].x * frame_width)
-        left_knee_pixel_y = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].y * frame_height)
+        left_knee_pixel_x = int(knee_obj.left.x * frame_width)
+        left_knee_pixel_y = int(knee_obj.left.y * frame_height)
         knee_loc = (left_knee_pixel_x + 10, left_knee_pixel_y)
-        knee_angle = min(left_knee_angle, right_knee_angle)
+        knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
 
         # Draw the left leg in red if the knee angle is greater than the threshold
         draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
 
-        # Compare with previous Y positions to determine movement direction
-        if is_standing_up(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                          left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-            direction_text = "UP"
-            # Change in direction: going up now
-            if not going_up:
-                count += 1
-                going_up = True
-
-        elif is_squatting_down(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                               left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-            direction_text = "DOWN"
-            going_up = False
-
-            if knee_angle > KNEE_ANGLE_DEPTH:
-                text_to_display = "Go lower!"
-                draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display, font_scale=1,
-                          color=(0, 0, 255))
-        else:
-            direction_text = "STABLE"
+        if direction_text == "DOWN" and knee_angle > KNEE_ANGLE_DEPTH:
+            text_to_display = "Go lower!"
+            _, knee_text_height = cv2.getTextSize(f"{knee_angle:.2f} degrees", cv2.FONT_HERSHEY_SIMPLEX, 1, thickness=2)[0]
+            draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 20), text_to_display, font_scale=1,
+                      color=(0, 0, 255))
 
         # Display the direction text on the frame
         cycle_x = 0
@@ -247,13 +246,5 @@ def analysis(frame, AttnLSTM, video_processor):
 
         knee_angle_text = f"{knee_angle:.2f} degrees"
         draw_text(frame, knee_loc, knee_angle_text, font_scale=1)
-        _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 1, thickness=2)[0]
-
-        # Update previous Y positions
-        prev_left_shoulder_y = left_shoulder_y
-        prev_right_shoulder_y = right_shoulder_y
-
-        # Process the frame with AttnLSTM model
-        frame = video_processor.inference_process(AttnLSTM, frame, results)
 
     return frame
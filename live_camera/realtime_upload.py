@@ -6,12 +6,23 @@ from utils.draw_display import *
 from exercise.squat import *
 from collections import deque
 from utils.mediapipe_helper import * 
-import tempfile
+from exercise.rep_segmentation import RepClassifier
+from utils.video_io import iter_sampled_frames
+from utils.prediction_cache import PredictionCache, session_cache_key
+from utils.constant import (PREDICTION_CACHE_SIZE, METRICS_ENABLED, MODEL_FPS, QUALITY_LEVELS,
+                            QUALITY_START_LEVEL)
+from utils.metrics import PipelineMetrics
+from utils.profiling import profiler_from_env
+from utils.frame_buffers import FrameBuffers, to_video_frame
+from utils.presence import PresenceDetector, NO_POSE
+from utils.quality import QualityController, QualityLevel, PoseGraphs
+from exercise.rep_analysis import analyze_video_reps
 from keras.models import Model, load_model
 from keras.layers import (LSTM, Dense, Dropout, Input, Flatten, 
                                      Bidirectional, Permute, multiply)
 from collections import deque
 import av
+import time
 import pandas as pd
 class_labels = ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Bad Shallow','Good']
 
@@ -41,13 +52,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state variables if they don't already exist
-# This is to prevent processing uploaded videos multiple times
-if 'last_processed' not in st.session_state:
-    st.session_state['last_processed'] = None
-if 'prediction_dict' not in st.session_state:
-    st.session_state['prediction_dict'] = None
-
 st.title("Welcome to Fitness Vision!")
 
 st.write("\n")
@@ -74,54 +78,44 @@ st.markdown("### ✨ Personalize Your Settings", unsafe_allow_html=True)
 threshold1 = st.slider("Keypoint Detection Confidence", 0.00, 1.00, 0.50, help="Adjust the sensitivity for mediapipe keypoint detection to ensure accurate pose detection.")
 threshold2 = st.slider("Tracking Confidence", 0.00, 1.00, 0.50, help="Set the stability level for consistent tracking throughout your workout.")
 KNEE_ANGLE_DEPTH = st.slider("Knee Angle for Sufficient Depth", 80, 160, 120, help="Select the perfect knee angle to hit the right depth for your squats.")
+target_fps = st.slider("Target Frame Rate", 0, 30, 0, help="Lower the pose model, pose input size and overlay detail when the webcam video can not be processed at this many frames per second, 0 always keeps the full quality.")
+show_hud = st.checkbox("Show performance overlay", False, help="Display frame rate, dropped frames and processing time per stage on the webcam video.")
+
 
+MODEL_FOLDER = 'models/right_original_back_combined_0.001'
 
 @st.cache_resource
 def create_model():
    
-    folder = 'models/right_original_back_combined_0.001'
-
-    AttnLSTM = load_model(folder)
+    AttnLSTM = load_model(MODEL_FOLDER)
     print(AttnLSTM.summary())
     
     return AttnLSTM
 
+@st.cache_resource
+def create_prediction_cache():
+    # One cache for every session, so the same video uploaded again or after a page reload is not reprocessed
+    return PredictionCache(maxsize=PREDICTION_CACHE_SIZE)
+
 # Create LSTM model
 AttnLSTM = create_model()       
 
+prediction_cache = create_prediction_cache()
+
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
 pose = mp_pose.Pose(min_detection_confidence=threshold1, min_tracking_confidence=threshold2) # mediapipe pose model
 
 def feature_extraction_data(uploaded_file, width=1920, height=1080):
  
-    # Read the uploaded video file into a byte stream and then into OpenCV
-    tfile = tempfile.NamedTemporaryFile(delete=False) 
-    tfile.write(uploaded_file.getvalue())
-    
-    # Use the temporary file's name to read it into OpenCV
-    video_stream = cv2.VideoCapture(tfile.name)
+    # Decode the uploaded video straight from memory, nothing is written to disk
     #initialize lists to store frame features and images.
     keypoint_list = []
 
-    #get estimation of number of frames
-    video_frames_count = int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))
-
     SEQUENCE_LENGTH=30
 
-    frame_indices = [video_frames_count*i// SEQUENCE_LENGTH for i in range(SEQUENCE_LENGTH)]
-
-    for current_frame in frame_indices:
-
-        # Set current frame to be the specific frame
-        video_stream.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-
-        #Read the specific frame
-        #check if the reading is successful
-        success, frame = video_stream.read()
-
-        if not success:
-            return keypoint_list
+    # frames come decoded to RGB, MediaPipe reads them without a colour conversion
+    for frame in iter_sampled_frames(uploaded_file, SEQUENCE_LENGTH, format="rgb24"):
 
         # resize video frame if too large
         vid_height, vid_width, channels = frame.shape
@@ -129,14 +123,12 @@ def feature_extraction_data(uploaded_file, width=1920, height=1080):
           cv2.resize(frame, (width, height))
 
         # Make detection
-        image, results = mediapipe_detection(frame, pose)
+        results = pose.process(frame)
         #extract keypoints
         keypoints = extract_keypoints(results)
         #Add the frame and image to the list
         keypoint_list.append(keypoints)
 
-    video_stream.release()
-    tfile.close()
     return keypoint_list
   
 def make_prediction(uploaded_file, model):
@@ -168,36 +160,62 @@ def display_predictions(prediction_dict):
     st.write("#### Prediction Results:")
     st.markdown(predictions_html, unsafe_allow_html=True)
 
+def display_rep_predictions(rep_results):
+    if not rep_results:
+        st.write("No complete squat repetition was detected in this video.")
+        return
+
+    # One row per repetition, one column per class
+    rows = []
+    for rep_number, rep in enumerate(rep_results, start=1):
+        row = {'Rep': rep_number, 'Frames': f"{rep['start_frame']}-{rep['end_frame']}",
+               'Prediction': max(rep['probabilities'], key=rep['probabilities'].get)}
+        row.update({class_label: f"{prob*100:.2f}%" for class_label, prob in rep['probabilities'].items()})
+        rows.append(row)
+
+    predictions_html = pd.DataFrame(rows).to_html(index=False)
+
+    st.write(f"#### Prediction Results for {len(rep_results)} Repetitions:")
+    st.markdown(predictions_html, unsafe_allow_html=True)
+
 st.write("\n")  # Add some space
 st.markdown("---")  # Visual separator, like a horizontal line
 
 # Uploaded video processing section
 st.write("### 🎥 Analyze Your Uploaded Video ")
-uploaded_file = st.file_uploader("Upload one repetition of squat to analyze", type=["mp4"])
-if uploaded_file is not None and uploaded_file != st.session_state.get('last_processed', None):
-    with st.spinner('Processing...'):
-        prediction_dict = make_prediction(uploaded_file, AttnLSTM)
-        st.session_state['last_processed'] = uploaded_file  # Update session state
-        st.session_state['prediction_dict'] = prediction_dict
-        # Display the prediction results
-        display_predictions(prediction_dict)
-elif uploaded_file is None:
-    st.write("Please upload a video file for analysis.")
+analysis_mode = st.radio("Analysis mode", ["Single repetition", "Every repetition"], horizontal=True,
+                         help="Every repetition tracks the whole video and classifies each squat separately.")
+uploaded_file = st.file_uploader("Upload a squat video to analyze", type=["mp4"])
+if uploaded_file is not None:
+    # Same content, model and pose settings give the same prediction, whoever uploaded it.
+    # Reruns of the script for the same upload are not hashed again and not counted as cache hits
+    cache_key, new_request = session_cache_key(st.session_state, uploaded_file, MODEL_FOLDER,
+                                               analysis_mode=analysis_mode, detection_confidence=threshold1,
+                                               tracking_confidence=threshold2)
+    prediction = prediction_cache.get(cache_key, count=new_request)
+    if prediction is None:
+        with st.spinner('Processing...'):
+            if analysis_mode == "Every repetition":
+                # fresh tracker so landmarks of a previous video do not leak into this one
+                with mp_pose.Pose(min_detection_confidence=threshold1, min_tracking_confidence=threshold2) as rep_pose:
+                    prediction = analyze_video_reps(uploaded_file, AttnLSTM, rep_pose, mp_pose, class_labels)
+            else:
+                prediction = make_prediction(uploaded_file, AttnLSTM)
+            prediction_cache.put(cache_key, prediction)
+    # Display the prediction results
+    if analysis_mode == "Every repetition":
+        display_rep_predictions(prediction)
+    else:
+        display_predictions(prediction)
 else:
-    # If the same file is still there, just show the last predictions without reprocessing
-    #st.write("Showing results from the last processed video:")
-    if 'prediction_dict' in st.session_state:
-        display_predictions(st.session_state['prediction_dict'])
+    st.write("Please upload a video file for analysis.")
+st.caption(prediction_cache.stats_text())
         
 
 class VideoProcessor :
     def __init__(self):
         #Initilize parameters and variables
-        self.sequence_length = 30
         self.actions = ['Bad Head', 'Bad Back', 'Bad Frontal Knee', 'Bad Inward Knee', 'Bad Shallow','Good']
-        self.sequence = deque(maxlen=self.sequence_length)
-
-        self.prediction_history = deque(maxlen=5)
         self.colors = [
             (245, 117, 16),  # Orange
             (117, 245, 16),  # Lime Green
@@ -207,16 +225,26 @@ class VideoProcessor :
             (255, 255, 0),    # Yellow
             (0, 255, 0)  # Green
         ]
-        # Initialize shoulder Y positions
-        self.shoulder_positions = deque(maxlen=NUM_FRAMES_SHOULDER)
-        self.left_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-        self.right_knee_angles = deque(maxlen=NUM_FRAMES_KNEE)
-
-        # Initalize counter
-        self.count = 0
-        self.going_up = False
-
-        self.direction_text = "STABLE"
+        # AttnLSTM runs once per repetition instead of on every frame
+        self.rep_classifier = RepClassifier(AttnLSTM, mp_pose)
+
+        # Stage timings for the performance overlay, no-ops when it is off
+        self.show_hud = show_hud
+        self.metrics = PipelineMetrics(enabled=METRICS_ENABLED or show_hud, nominal_fps=MODEL_FPS)
+        # FV_PROFILE / FV_PROFILE_TRIGGER_MS, one profile folder entry per webcam session
+        self.profiler = profiler_from_env("webcam")
+        # RGB buffer for MediaPipe, reused for every frame
+        self.buffers = FrameBuffers()
+        # MediaPipe is skipped while nobody is in front of the camera
+        self.presence = PresenceDetector() if PRESENCE_ENABLED else None
+        # Pose model, Pose input size and overlay detail follow the target frame rate when one is set,
+        # the shared Pose graph is used otherwise
+        self.quality = QualityController(target_fps) if target_fps else None
+        self.level = (self.quality.level if self.quality is not None
+                      else QualityLevel(*QUALITY_LEVELS[QUALITY_START_LEVEL]))
+        self.pose_graphs = PoseGraphs(mp_pose, min_detection_confidence=threshold1,
+                                      min_tracking_confidence=threshold2)
+        self.pose = self.pose_graphs.get(self.level.model_complexity) if self.quality is not None else pose
 
     def prob_viz(self, res, input_frame):
         """
@@ -224,7 +252,8 @@ class VideoProcessor :
         as a horizontal bar graph
 
         """
-        output_frame = input_frame.copy()
+        # drawn into the frame in place, no copy of the whole frame
+        output_frame = input_frame
         font_size = 1.5
         for num, prob in enumerate(res):
             # change prob * ___ for longer length
@@ -238,148 +267,110 @@ class VideoProcessor :
         return output_frame
 
 
-    def inference_process(self, model, image, results):
+    def rep_inference_process(self, image, results):
         """
-        Function to process and run inference on AttnLSTM with real time video frame input
+        Feeds the frame to the rep segmentation and displays the prediction of the last finished repetition
 
         Args:
-            model: the AttnLSTM classification model
             image (numpy array): input image from the webcam
             results: Processed frame from mediapipe Pose
 
         Returns:
-            numpy array: processed image with keypoint detection and classification
+            numpy array: processed image with the classification of the last repetition
         """
+        self.rep_classifier.update(results, extract_keypoints(results))
 
-        # Prediction logic
-        keypoints = extract_keypoints(results)
-        moving_average = np.zeros(len(self.actions))
-        self.sequence.append(keypoints.astype('float32', casting='same_kind'))
-
-        if len(self.sequence) == self.sequence_length:
-            res = model.predict(np.expand_dims(list(self.sequence), axis=0), verbose=0)[0]
-            # self.current_action = self.actions[np.argmax(res)]
-            self.prediction_history.append(res)
-
-            if len(self.prediction_history) == self.prediction_history.maxlen:
-                moving_average = np.mean(np.array(self.prediction_history), axis=0)
-                self.current_action = self.actions[np.argmax(moving_average)]
+        prediction = self.rep_classifier.last_prediction
+        if prediction is None:
+            prediction = np.zeros(len(self.actions))
+        else:
+            self.current_action = self.actions[np.argmax(prediction)]
 
-            # Viz probabilities
-            image = self.prob_viz(moving_average, image)
+        return self.prob_viz(prediction, image)
 
-        return image
-    
     def process(self, frame):
-        knee_text_height = 10
-
+        process_start = time.perf_counter()
         frame_height, frame_width, _ = frame.shape
 
-        # Convert the BGR image to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with self.metrics.span("presence"):
+            check_pose = self.presence is None or self.presence.check(frame)
 
-        # Process the frame with MediaPipe Pose
-        results = pose.process(rgb_frame)
+        if check_pose:
+            # Convert the BGR image to RGB
+            with self.metrics.span("bgr_to_rgb"):
+                rgb_frame = self.buffers.to_rgb(self.buffers.resize(frame, self.level.pose_size(frame)))
+
+            # Process the frame with MediaPipe Pose
+            with self.metrics.span("pose"):
+                results = self.pose.process(rgb_frame)
+            if self.presence is not None:
+                self.presence.report(results.pose_landmarks is not None)
+        else:
+            # empty, static scene
+            results = NO_POSE
 
         # Draw landmarks on the frame
         if results.pose_landmarks:
 
-            mp.solutions.drawing_utils.draw_landmarks(frame,
-                                                    results.pose_landmarks,
-                                                    mp_pose.POSE_CONNECTIONS,
-                                                    mp.solutions.drawing_utils.DrawingSpec(color=(245, 117, 66),
-                                                                                            thickness=10,
-                                                                                            circle_radius=5),
-                                                    mp.solutions.drawing_utils.DrawingSpec(color=(255, 255, 255),
-                                                                                            thickness=10,
-                                                                                            circle_radius=5)
-                                                    )
-
-            # Get Y positions of the left and right shoulders
-            left_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER].y
-            right_shoulder_y = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER].y
-
-            # Update deque with shoulder positions
-            self.shoulder_positions.append((left_shoulder_y, right_shoulder_y))
-
-            average_left_shoulder_y = sum(pos[0] for pos in self.shoulder_positions) / len(self.shoulder_positions)
-            average_right_shoulder_y = sum(pos[1] for pos in self.shoulder_positions) / len(self.shoulder_positions)
-
-            ###################### Calculate knee angles ######################
-            left_knee_angle, right_knee_angle = calculate_knee_angles(results, mp_pose)
-
-            self.left_knee_angles.append(left_knee_angle)
-            self.right_knee_angles.append(right_knee_angle)
-
-            # Calculate moving average of knee angles
-            average_left_knee_angle = sum(self.left_knee_angles) / len(self.left_knee_angles)
-            average_right_knee_angle = sum(self.right_knee_angles) / len(self.right_knee_angles)
-
-            left_knee_pixel_x = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].x * frame_width)
-            left_knee_pixel_y = int(results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE].y * frame_height)
-            knee_loc = (left_knee_pixel_x + 10, left_knee_pixel_y)
-            knee_angle = min(left_knee_angle, right_knee_angle)
-
-            # Draw the left leg in red if the knee angle is greater than the threshold
-            draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
-
-            # Compare with previous Y positions to determine movement direction
-            if is_standing_up_old(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                            left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-                self.direction_text = "UP"
-                # Change in direction: going up now
-                if not self.going_up:
-                    self.count += 1
-                    self.going_up = True
-
-            elif is_squatting_down_old(left_shoulder_y, right_shoulder_y, average_left_shoulder_y, average_right_shoulder_y,
-                                left_knee_angle, right_knee_angle, average_left_knee_angle, average_right_knee_angle):
-                self.direction_text = "DOWN"
-                self.going_up = False
-
-                if knee_angle > KNEE_ANGLE_DEPTH:
+            if self.level.draws('full'):
+                mp.solutions.drawing_utils.draw_landmarks(frame,
+                                                        results.pose_landmarks,
+                                                        mp_pose.POSE_CONNECTIONS,
+                                                        mp.solutions.drawing_utils.DrawingSpec(color=(245, 117, 66),
+                                                                                                thickness=10,
+                                                                                                circle_radius=5),
+                                                        mp.solutions.drawing_utils.DrawingSpec(color=(255, 255, 255),
+                                                                                                thickness=10,
+                                                                                                circle_radius=5)
+                                                        )
+
+            # Process the frame with AttnLSTM model, classified once per repetition; the rep segmentation also
+            # keeps the counter and the knee angles shown below
+            frame = self.rep_inference_process(frame, results)
+            counter, knee_obj = self.rep_classifier.counter, self.rep_classifier.segmenter.knee_obj
+
+            if self.level.draws('basic'):
+                knee_loc = (int(knee_obj.left.x * frame_width) + 10, int(knee_obj.left.y * frame_height))
+                knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
+
+                # Draw the left leg in red if the knee angle is greater than the threshold
+                draw_leg_landmarks(mp, frame, results, color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
+
+                knee_angle_text = f"{knee_angle:.2f} degrees"
+                draw_text(frame, knee_loc, knee_angle_text)
+                _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
+
+                if counter.direction_text == "DOWN" and knee_angle > KNEE_ANGLE_DEPTH:
                     text_to_display = "Go lower!"
                     draw_text(frame, (knee_loc[0], knee_loc[1] + knee_text_height + 40), text_to_display, font_scale=2,
-                            color=(0, 0, 255))
-            else:
-                self.direction_text = "STABLE"
-
-            # Display the direction text on the frame
-            cycle_x = 0
-            cycle_y = 50
-            text_to_display = f"{self.direction_text} | Cycles: {self.count}"
-            draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
-
-            # knee_info_x = 50
-            # knee_info_y = 200
-            # knee_text = f"Left Knee: {average_left_knee_angle:.2f} degrees | Right Knee: {average_right_knee_angle:.2f} degrees"
-            # # show per frame values
-            # # knee_text = f"Left Knee: {left_knee_angle:.2f} degrees | Right Knee: {right_knee_angle:.2f} degrees"
-            # draw_text(frame, (knee_info_x, knee_info_y), knee_text)
-
-            knee_angle_text = f"{knee_angle:.2f} degrees"
-            draw_text(frame, knee_loc, knee_angle_text)
-            _, knee_text_height = cv2.getTextSize(knee_angle_text, cv2.FONT_HERSHEY_SIMPLEX, 2, thickness=2)[0]
-
-            # Update previous Y positions
-            prev_left_shoulder_y = left_shoulder_y
-            prev_right_shoulder_y = right_shoulder_y
-
-            # Process the frame with AttnLSTM model
-            frame = self.inference_process(AttnLSTM, frame, results)
-            # frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                              color=(0, 0, 255))
+
+            # only frames with a person are timed, an empty scene says nothing about the cost of a squat
+            if self.quality is not None and self.quality.update(time.monotonic(), time.perf_counter() - process_start):
+                self.level = self.quality.level
+                self.pose = self.pose_graphs.get(self.level.model_complexity)
         else:
             frame = self.prob_viz(np.zeros(len(self.actions)), frame)
 
         # Display the direction text on the frame
         cycle_x = 0
         cycle_y = 50
-        text_to_display = f"{self.direction_text} | Cycles: {self.count}"
+        text_to_display = f"{self.rep_classifier.counter.direction_text} | Cycles: {self.rep_classifier.counter.count}"
         draw_text(frame, (cycle_x, cycle_y), text_to_display, color=(255, 255, 255))
 
         return frame
             
 
+    def on_ended(self):
+        """
+        Called by streamlit_webrtc when the webcam stream ends
+        """
+        # writes a profile still running when the stream stops
+        self.profiler.close()
+        self.pose_graphs.close()
+        if self.quality is not None:
+            print(self.quality.stats_text())
+
     def recv(self, frame):
         """
         Receive and process video stream from webcam
@@ -390,9 +381,18 @@ class VideoProcessor :
         Returns:
             av.VideoFrame: processed video frame
         """
-        img = frame.to_ndarray(format="bgr24")
-        img = self.process(img)
-        return av.VideoFrame.from_ndarray(img, format="bgr24")
+        self.profiler.frame_start()
+        with self.metrics.span("decode"):
+            img = frame.to_ndarray(format="bgr24")
+        with self.metrics.span("process"):
+            img = self.process(img)
+        # frames the async processing skipped show up as gaps in the frame times
+        self.metrics.frame_done(frame.time)
+        if self.show_hud:
+            self.metrics.draw_hud(img, position=(img.shape[1] - 320, 30))
+        self.profiler.frame_end()
+        # img is the array of the decoded frame with everything drawn in place, wrapped without a copy
+        return to_video_frame(img)
         
 
 ## Stream Webcam Video and Run Model
@@ -0,0 +1,244 @@
+"""
+Frame copies per frame on the way from capture to display, before and after the reused frame buffers
+(utils/frame_buffers.py), on a test clip without a camera.
+
+Paths, each in the previous ("before") and the current ("after") version:
+    webrtc    VideoProcessor.recv of the realtime_upload apps: av.VideoFrame -> BGR array -> RGB for MediaPipe,
+              probability bars, back to an av.VideoFrame
+    opencv    camera_movement.py / camera_movement_record.py: cv2.VideoCapture.read -> RGB for MediaPipe,
+              probability bars, cv2.imshow
+    tkinter   tkinter_gui.py: read, mirror, resize, performance_eval.analysis, RGB PIL image for Tk
+    upload    exercise/rep_analysis.py and the upload feature extraction: decoded frames straight to MediaPipe
+
+Every step that writes a whole frame is counted: bytes written, colour conversions (besides the decoder
+output conversion every path has) and newly allocated frame arrays. Drawing the landmarks and text writes
+into the frame in place in both versions and is left out, MediaPipe is not run (it copies its input the same
+way in both).
+    python -m tests.frame_copy_benchmark [video.mp4] [--frames 200]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.frame_buffers import FrameBuffers, to_video_frame
+from utils.video_io import iter_timed_frames
+
+try:
+    import av
+except ImportError:
+    av = None
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TKINTER_SIZE = (1280, 720)
+COLORS = [(245, 117, 16), (117, 245, 16), (16, 117, 245), (255, 0, 0), (0, 0, 255), (255, 255, 0), (0, 255, 0)]
+
+
+class CopyMeter:
+    """
+    Whole frame writes of one frame: bytes, colour conversions and new allocations
+    """
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.copies = 0
+        self.conversions = 0
+        self.allocations = 0
+
+    def write(self, nbytes, conversion=False, allocated=False):
+        self.bytes += nbytes
+        self.copies += 1
+        self.conversions += conversion
+        self.allocations += allocated
+
+    def per_frame(self):
+        frames = max(self.frames, 1)
+        return {'mb': self.bytes / frames / 1e6, 'copies': self.copies / frames,
+                'conversions': self.conversions / frames, 'allocations': self.allocations / frames}
+
+
+def draw_bars(frame):
+    # prob_viz of the VideoProcessors
+    for num, color in enumerate(COLORS):
+        cv2.rectangle(frame, (0, 70 + num * 50), (450, 130 + num * 50), (0, 0, 0), -1)
+        cv2.rectangle(frame, (0, 70 + num * 50), (int(450 / (num + 1)), 130 + num * 50), color, -1)
+
+
+def webrtc_before(av_frame, meter, buffers):
+    img = av_frame.to_ndarray(format="bgr24")
+    meter.write(img.nbytes, allocated=True)  # decoder output
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    meter.write(rgb.nbytes, conversion=True, allocated=True)
+    img = img.copy()
+    meter.write(img.nbytes, allocated=True)  # prob_viz
+    draw_bars(img)
+    av.VideoFrame.from_ndarray(img, format="bgr24")
+    meter.write(img.nbytes, allocated=True)
+
+
+def webrtc_after(av_frame, meter, buffers):
+    img = av_frame.to_ndarray(format="bgr24")
+    meter.write(img.nbytes, allocated=True)  # decoder output
+    rgb = buffers.to_rgb(img)
+    meter.write(rgb.nbytes, conversion=True)
+    draw_bars(img)
+    out = to_video_frame(img)
+    if not np.shares_memory(np.frombuffer(out.planes[0], np.uint8), img):
+        meter.write(img.nbytes, allocated=True)
+
+
+def opencv_before(cap, meter, buffers):
+    ret, frame = cap.read()
+    if not ret:
+        return False
+    meter.write(frame.nbytes, allocated=True)  # decode
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    meter.write(rgb.nbytes, conversion=True, allocated=True)
+    frame = frame.copy()
+    meter.write(frame.nbytes, allocated=True)  # prob_viz
+    draw_bars(frame)
+    return True
+
+
+def opencv_after(cap, meter, buffers):
+    previous = buffers.buffers.get("capture")
+    ret, frame = buffers.read(cap)
+    if not ret:
+        return False
+    meter.write(frame.nbytes, allocated=frame is not previous)  # decode
+    rgb = buffers.to_rgb(frame)
+    meter.write(rgb.nbytes, conversion=True)
+    draw_bars(frame)
+    return True
+
+
+def tkinter_before(cap, meter, buffers):
+    ret, frame = cap.read()
+    if not ret:
+        return False
+    meter.write(frame.nbytes, allocated=True)  # decode
+    frame = cv2.flip(frame, 1)
+    meter.write(frame.nbytes, allocated=True)
+    frame = cv2.resize(frame, TKINTER_SIZE)
+    meter.write(frame.nbytes, allocated=True)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    meter.write(rgb.nbytes, conversion=True, allocated=True)
+    frame = frame.copy()
+    meter.write(frame.nbytes, allocated=True)  # prob_viz
+    draw_bars(frame)
+    cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    meter.write(cv2image.nbytes, conversion=True, allocated=True)
+    Image.fromarray(cv2image)
+    meter.write(cv2image.nbytes, allocated=True)
+    return True
+
+
+def tkinter_after(cap, meter, buffers):
+    previous = buffers.buffers.get("capture")
+    ret, frame = buffers.read(cap)
+    if not ret:
+        return False
+    meter.write(frame.nbytes, allocated=frame is not previous)  # decode
+    resized = buffers.resize(frame, TKINTER_SIZE)
+    if resized is not frame:
+        meter.write(resized.nbytes)
+    frame = cv2.flip(resized, 1, dst=resized)
+    meter.write(frame.nbytes)
+    rgb = buffers.to_rgb(frame)
+    meter.write(rgb.nbytes, conversion=True)
+    draw_bars(frame)
+    cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("display", frame.shape))
+    meter.write(cv2image.nbytes, conversion=True)
+    Image.fromarray(cv2image)
+    meter.write(cv2image.nbytes, allocated=True)
+    return True
+
+
+def upload_before(frame, meter, buffers):
+    meter.write(frame.nbytes, allocated=True)  # decoder output, BGR
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    meter.write(rgb.nbytes, conversion=True, allocated=True)
+
+
+def upload_after(frame, meter, buffers):
+    meter.write(frame.nbytes, allocated=True)  # decoder output, already RGB
+
+
+def run_upload(video, step, frames):
+    meter, buffers = CopyMeter(), FrameBuffers()
+    with open(video, "rb") as f:
+        data = f.read()
+    # decoding is part of the path, the decoder writes RGB or BGR
+    fmt = "rgb24" if step is upload_after else "bgr24"
+    start = time.perf_counter()
+    for _, _, frame in iter_timed_frames(data, format=fmt):
+        step(frame, meter, buffers)
+        meter.frames += 1
+        if meter.frames >= frames:
+            break
+    return meter, time.perf_counter() - start
+
+
+def run_webrtc(video, step, frames):
+    meter, buffers = CopyMeter(), FrameBuffers()
+    elapsed = 0.0
+    with av.open(video) as container:
+        decoded = container.decode(video=0)
+        while meter.frames < frames:
+            av_frame = next(decoded, None)
+            if av_frame is None:
+                break
+            start = time.perf_counter()
+            step(av_frame, meter, buffers)
+            elapsed += time.perf_counter() - start
+            meter.frames += 1
+    return meter, elapsed
+
+
+def run_capture(video, step, frames):
+    meter, buffers = CopyMeter(), FrameBuffers()
+    elapsed = 0.0
+    cap = cv2.VideoCapture(video)
+    while meter.frames < frames:
+        start = time.perf_counter()
+        if not step(cap, meter, buffers):
+            break
+        elapsed += time.perf_counter() - start
+        meter.frames += 1
+    cap.release()
+    return meter, elapsed
+
+
+PATHS = {
+    'webrtc': (run_webrtc, webrtc_before, webrtc_after),
+    'opencv': (run_capture, opencv_before, opencv_after),
+    'tkinter': (run_capture, tkinter_before, tkinter_after),
+    'upload': (run_upload, upload_before, upload_after),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", default=os.path.join(TESTS_DIR, "test_head.mp4"))
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'path':8} {'version':8} {'MB/frame':>9} {'copies':>7} {'colour':>7} {'allocs':>7} {'ms/frame':>9}")
+    for name in args.paths:
+        run, before, after = PATHS[name]
+        if run is run_webrtc and av is None:
+            print(f"{name:8} skipped, PyAV not installed")
+            continue
+        for version, step in (("before", before), ("after", after)):
+            meter, elapsed = run(args.video, step, args.frames)
+            stats = meter.per_frame()
+            print(f"{name:8} {version:8} {stats['mb']:9.2f} {stats['copies']:7.1f} {stats['conversions']:7.1f} "
+                  f"{stats['allocations']:7.1f} {elapsed / max(meter.frames, 1) * 1000:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
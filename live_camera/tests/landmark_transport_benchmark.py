@@ -0,0 +1,160 @@
+"""
+Server work per frame of the two ways to show the overlay in the browser, on a test clip scaled to 1280x720:
+
+    video:     draw skeleton, knee angle, counter and probability bars into the frame (like the webcam apps)
+               and encode it with VP8 for the way back, the SENDRECV stream of realtime_upload.py
+    landmarks: pack the frame state into a data channel message (landmark_server.py, utils/landmark_message.py),
+               the browser draws the overlay on its own video
+
+MediaPipe Pose and the counter run once per frame beforehand, they are the same for both. Reports ms per frame
+of every stage and bytes per frame sent back, and checks that the message decodes to the landmarks it was made
+from:
+    python -m tests.landmark_transport_benchmark [video.mp4] [--bitrate 1000000]
+"""
+import argparse
+import os
+from fractions import Fraction
+
+import av
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.rep_segmentation import RepSegmenter
+from exercise.squat import process_shallow
+from utils.constant import KNEE_ANGLE_DEPTH, LANDMARK_SCALE
+from utils.draw_display import draw_text, draw_leg_landmarks
+from utils.landmark_message import pack_frame_state, unpack_frame_state
+from utils.mediapipe_helper import extract_keypoints
+from utils.stage_timer import StageTimer
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FPS = 30
+SIZE = (1280, 720)
+NUM_CLASSES = 6
+# bar colours of VideoProcessor.colors
+COLORS = [(245, 117, 16), (117, 245, 16), (16, 117, 245), (255, 0, 0), (0, 0, 255), (255, 255, 0)]
+
+
+def track_clip(video):
+    """
+    Runs Pose and the counter over the clip
+
+    Returns:
+        list: (BGR frame, results, keypoints or None, counter and knee state) per frame
+    """
+    mp_pose = mp.solutions.pose
+    segmenter = RepSegmenter(mp_pose)
+    frames = []
+    cap = cv2.VideoCapture(video)
+    with mp_pose.Pose() as pose:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame = cv2.resize(frame, SIZE)
+            results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            keypoints = None
+            if results.pose_landmarks:
+                keypoints = extract_keypoints(results)
+                segmenter.update(results, keypoints)
+            counter, knee_obj = segmenter.counter, segmenter.knee_obj
+            state = {'count': counter.count, 'direction_text': counter.direction_text, 'going_up': counter.going_up,
+                     'knee_angles': (knee_obj.left_angle, knee_obj.right_angle), 'left': knee_obj.left}
+            frames.append((frame, results, keypoints, state))
+    cap.release()
+    return frames
+
+
+def draw_overlay(frame, results, state, probabilities):
+    """
+    The overlay of camera_movement.py, drawn into the frame
+    """
+    counter = argparse.Namespace(**state)
+    knee_obj = argparse.Namespace(left=state['left'], left_angle=state['knee_angles'][0],
+                                  right_angle=state['knee_angles'][1])
+    drawing_utils = mp.solutions.drawing_utils
+    if results.pose_landmarks:
+        drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS,
+                                     drawing_utils.DrawingSpec(color=(245, 117, 66), thickness=15, circle_radius=5),
+                                     drawing_utils.DrawingSpec(color=(255, 255, 255), thickness=15, circle_radius=5))
+        draw_leg_landmarks(mp, frame, results,
+                           color=(0, 255, 0) if min(state['knee_angles']) < KNEE_ANGLE_DEPTH else (0, 0, 255))
+        process_shallow(frame, counter, knee_obj)
+    for num, prob in enumerate(probabilities):
+        cv2.rectangle(frame, (0, 100 + num * 60), (550, 150 + num * 60), (0, 0, 0), -1)
+        cv2.rectangle(frame, (0, 100 + num * 60), (int(prob * 550), 150 + num * 60), COLORS[num], -1)
+        cv2.putText(frame, f"class {num}", (0, 145 + num * 60), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 2,
+                    cv2.LINE_AA)
+    draw_text(frame, (0, 50), f"{state['direction_text']} | Cycles: {state['count']}", color=(255, 255, 255))
+
+
+def run_video(frames, probabilities, bitrate, timer):
+    """
+    Returns:
+        int: encoded bytes
+    """
+    encoder = av.CodecContext.create("libvpx", "w")
+    encoder.width, encoder.height = SIZE
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, FPS)
+    encoder.framerate = FPS
+    encoder.bit_rate = bitrate
+    # realtime settings, as for a WebRTC stream
+    encoder.options = {"deadline": "realtime", "cpu-used": "8", "lag-in-frames": "0"}
+
+    encoded = 0
+    for index, (frame, results, _, state) in enumerate(frames):
+        image = frame.copy()
+        with timer.stage("video: draw"):
+            draw_overlay(image, results, state, probabilities)
+        with timer.stage("video: encode"):
+            video_frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+            video_frame.pts = index
+            packets = encoder.encode(video_frame)
+        encoded += sum(packet.size for packet in packets)
+    encoded += sum(packet.size for packet in encoder.encode(None))
+    return encoded
+
+
+def run_landmarks(frames, probabilities, timer):
+    """
+    Returns:
+        tuple: (message bytes, largest landmark error after decoding)
+    """
+    sent, error = 0, 0.0
+    for index, (_, _, keypoints, state) in enumerate(frames):
+        counter = argparse.Namespace(**state)
+        with timer.stage("landmarks: pack"):
+            message = pack_frame_state(index / FPS, counter, keypoints, state['knee_angles'], probabilities,
+                                       go_lower=False)
+        sent += len(message)
+        if keypoints is not None:
+            landmarks = unpack_frame_state(message)['landmarks']
+            error = max(error, float(np.abs(landmarks[:, :2] - keypoints.reshape(33, 4)[:, :2]).max()))
+    return sent, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", default=os.path.join(TESTS_DIR, "test_head.mp4"))
+    parser.add_argument("--bitrate", type=int, default=1_000_000, help="VP8 bits per second of the video way back")
+    args = parser.parse_args()
+
+    frames = track_clip(args.video)
+    probabilities = np.full(NUM_CLASSES, 1 / NUM_CLASSES)
+    timer = StageTimer()
+    video_bytes = run_video(frames, probabilities, args.bitrate, timer)
+    landmark_bytes, error = run_landmarks(frames, probabilities, timer)
+
+    print(f"{len(frames)} frames at {SIZE[0]}x{SIZE[1]}, "
+          f"{sum(keypoints is not None for _, _, keypoints, _ in frames)} with a person\n")
+    print(f"{'stage':18} {'mean ms':>8} {'p95 ms':>8}")
+    for name, stage in timer.summary().items():
+        print(f"{name:18} {stage['mean_ms']:8.3f} {stage['p95_ms']:8.3f}")
+    print(f"\nbytes per frame sent back: video {video_bytes / len(frames):.0f}, landmarks {landmark_bytes / len(frames):.0f}")
+    print(f"largest landmark error after decoding: {error:.1e} image units (1 / {LANDMARK_SCALE} quantisation)")
+
+
+if __name__ == "__main__":
+    main()
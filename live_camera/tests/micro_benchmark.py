@@ -0,0 +1,245 @@
+"""
+Micro-benchmarks of the per-frame helpers in utils/ and exercise/, no camera, model or GPU needed.
+
+Inputs are synthetic landmark arrays (seeded) and MediaPipe results recorded once from a test clip
+into tests/micro_benchmark_landmarks.npz (re-record with --record, needs MediaPipe Pose on the CPU).
+
+Groups:
+    angles      calculate_angle_3d*, calculate_knee_angles, vectorized joint_angles
+    keypoints   extract_keypoints, extract_keypoints_no_arm, landmarks_from_results
+    rules       LandmarkData rolling averages, Counter.update_counter, RuleEngine.evaluate, rolling_mean
+    draw        draw_text, draw_leg_landmarks, the full skeleton, process_shallow on a 1280x720 frame
+
+Every case is timed timeit style (best of --repeats runs), reported per frame, written as JSON and compared
+with a saved baseline; the run fails when a case is slower than the baseline by more than --tolerance, or
+when there is no baseline to compare with (timings are machine specific, record one on the machine first):
+    python -m tests.micro_benchmark --save-baseline       # record tests/micro_benchmark_baseline.json
+    python -m tests.micro_benchmark [--groups angles rules]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.base import RuleEngine, joint_angles, landmarks_from_results, rolling_mean
+from exercise.squat import SQUAT, Counter, process_shallow
+from utils.angles import calculate_angle_3d, calculate_angle_3d_1, calculate_angle_3d_2, calculate_knee_angles
+from utils.constant import NUM_FRAMES_SHOULDER, NUM_FRAMES_KNEE
+from utils.draw_display import draw_text, draw_leg_landmarks
+from utils.landmark_data import LandmarkData
+from utils.mediapipe_helper import extract_keypoints, extract_keypoints_no_arm, results_from_landmarks
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+RECORDED = os.path.join(TESTS_DIR, "micro_benchmark_landmarks.npz")
+GROUPS = ['angles', 'keypoints', 'rules', 'draw']
+
+
+def record_landmarks(video, path, max_frames):
+    """
+    Runs MediaPipe Pose on the first max_frames frames of video, keeps the frames with a person
+    """
+    cap = cv2.VideoCapture(video)
+    landmarks = []
+    with mp.solutions.pose.Pose() as pose:
+        while len(landmarks) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if results.pose_landmarks:
+                landmarks.append(landmarks_from_results(results))
+    cap.release()
+    np.savez_compressed(path, landmarks=np.stack(landmarks).astype('float32'),
+                        video=os.path.basename(video))
+    print(f"recorded {len(landmarks)} frames of {os.path.basename(video)} to {path}")
+
+
+def synthetic_landmarks(frames, sessions=None, seed=0):
+    """
+    Random standing-ish poses with a squat-like vertical motion, shape ([sessions,] frames, 33, 4)
+    """
+    rng = np.random.default_rng(seed)
+    shape = (frames, 33) if sessions is None else (sessions, frames, 33)
+    landmarks = np.empty(shape + (4,))
+    landmarks[..., 0] = rng.uniform(0.3, 0.7, shape)
+    landmarks[..., 1] = rng.uniform(0.1, 0.9, shape)
+    landmarks[..., 2] = rng.uniform(-0.5, 0.5, shape)
+    landmarks[..., 3] = rng.uniform(0.5, 1.0, shape)
+    landmarks[..., 1] += 0.1 * np.sin(np.linspace(0, 6 * np.pi, frames))[:, None]
+    return landmarks
+
+
+def build_cases(recorded, groups):
+    """
+    Returns:
+        dict: name -> (frames per call, function running them)
+    """
+    mp_pose = mp.solutions.pose
+    drawing_utils = mp.solutions.drawing_utils
+    results = [results_from_landmarks(frame_landmarks) for frame_landmarks in recorded]
+    n_recorded = len(results)
+
+    synthetic = synthetic_landmarks(1000)
+    triples = [(tuple(frame[23, :2]), tuple(frame[25, :2]), tuple(frame[27, :2])) for frame in synthetic]
+    sessions = synthetic_landmarks(300, sessions=32, seed=1)
+    cases = {}
+
+    if 'angles' in groups:
+        cases['calculate_angle_3d'] = (len(triples), lambda: [calculate_angle_3d(*t) for t in triples])
+        cases['calculate_angle_3d_1'] = (len(triples), lambda: [calculate_angle_3d_1(*t) for t in triples])
+        cases['calculate_angle_3d_2'] = (len(triples), lambda: [calculate_angle_3d_2(*t) for t in triples])
+        cases['calculate_knee_angles'] = (n_recorded, lambda: [calculate_knee_angles(r, mp_pose) for r in results])
+        cases['joint_angles_batch'] = (len(synthetic), lambda: joint_angles(synthetic[:, [23, 24], :2],
+                                                                            synthetic[:, [25, 26], :2],
+                                                                            synthetic[:, [27, 28], :2]))
+
+    if 'keypoints' in groups:
+        cases['extract_keypoints'] = (n_recorded, lambda: [extract_keypoints(r) for r in results])
+        cases['extract_keypoints_no_arm'] = (n_recorded, lambda: [extract_keypoints_no_arm(r) for r in results])
+        cases['landmarks_from_results'] = (n_recorded, lambda: [landmarks_from_results(r) for r in results])
+
+    if 'rules' in groups:
+        knee_angles = [calculate_knee_angles(r, mp_pose) for r in results]
+
+        def landmark_data():
+            knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, NUM_FRAMES_KNEE)
+            for r, angles in zip(results, knee_angles):
+                knee_obj.update_values(r)
+                knee_obj.update_angles(*angles)
+
+        def counter():
+            # the counting part of the live loop, landmark averages included
+            shoulder_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER,
+                                        NUM_FRAMES_SHOULDER)
+            knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, NUM_FRAMES_KNEE)
+            squat_counter = Counter()
+            for r, angles in zip(results, knee_angles):
+                shoulder_obj.update_values(r)
+                knee_obj.update_values(r)
+                knee_obj.update_angles(*angles)
+                squat_counter.update_counter(shoulder_obj, knee_obj)
+
+        engine = RuleEngine(SQUAT)
+        values = sessions[..., 11, 1]
+        cases['landmark_data_averages'] = (n_recorded, landmark_data)
+        cases['counter_update'] = (n_recorded, counter)
+        cases['rule_engine_session'] = (n_recorded, lambda: engine.evaluate(recorded))
+        cases['rule_engine_batch'] = (sessions.shape[0] * sessions.shape[1], lambda: engine.evaluate(sessions))
+        cases['rolling_mean_batch'] = (values.size, lambda: rolling_mean(values, NUM_FRAMES_SHOULDER))
+
+    if 'draw' in groups:
+        frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, NUM_FRAMES_KNEE)
+        knee_obj.update_values(results[0])
+        knee_obj.update_angles(*calculate_knee_angles(results[0], mp_pose))
+        squat_counter = Counter()
+        landmark_spec = drawing_utils.DrawingSpec(color=(245, 117, 66), thickness=15, circle_radius=5)
+        connection_spec = drawing_utils.DrawingSpec(color=(255, 255, 255), thickness=15, circle_radius=5)
+
+        cases['draw_text'] = (1, lambda: draw_text(frame, (0, 50), "DOWN | Cycles: 12", color=(255, 255, 255)))
+        cases['draw_leg_landmarks'] = (n_recorded, lambda: [draw_leg_landmarks(mp, frame, r) for r in results])
+        cases['draw_skeleton'] = (n_recorded, lambda: [drawing_utils.draw_landmarks(frame, r.pose_landmarks,
+                                                                                    mp_pose.POSE_CONNECTIONS,
+                                                                                    landmark_spec, connection_spec)
+                                                       for r in results])
+        cases['process_shallow'] = (1, lambda: process_shallow(frame, squat_counter, knee_obj))
+
+    return cases
+
+
+def time_case(function, frames, repeats, min_time):
+    """
+    Returns:
+        dict: best and median microseconds per frame over the repeats, calls per repeat
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    # autorange to at least min_time per repeat
+    while timer.timeit(number) < min_time:
+        number *= 2
+    runs = np.asarray(timer.repeat(repeat=repeats, number=number)) / number / frames * 1e6
+    return {'best_us': float(runs.min()), 'median_us': float(np.median(runs)), 'number': number}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of the best time of every case against the baseline
+
+    Returns:
+        list: cases slower than the baseline by more than tolerance (fraction)
+    """
+    regressions = []
+    print(f"\n{'case':26} {'us/frame':>10} {'base':>10} {'change':>8}")
+    for case, current in results['cases'].items():
+        base = baseline['cases'].get(case)
+        if base is None:
+            print(f"{case:26} {current['best_us']:10.2f} {'-':>10} {'new':>8}")
+            continue
+        change = current['best_us'] / base['best_us'] - 1 if base['best_us'] else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        print(f"{case:26} {current['best_us']:10.2f} {base['best_us']:10.2f} {100 * change:+7.1f}%{flag}")
+        if change > tolerance:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS)
+    parser.add_argument("--output", default=os.path.join(TESTS_DIR, "micro_benchmark_results.json"))
+    parser.add_argument("--baseline", default=os.path.join(TESTS_DIR, "micro_benchmark_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown against the baseline")
+    parser.add_argument("--repeats", type=int, default=7, help="timed runs per case, the best one counts")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed run")
+    parser.add_argument("--record", metavar="VIDEO", default=None,
+                        help="record the MediaPipe landmarks of VIDEO as the recorded input first")
+    parser.add_argument("--record-frames", type=int, default=120)
+    args = parser.parse_args()
+
+    if args.record or not os.path.exists(RECORDED):
+        record_landmarks(args.record or os.path.join(TESTS_DIR, "test_head.mp4"), RECORDED, args.record_frames)
+    recorded = np.load(RECORDED)['landmarks'].astype(np.float64)
+
+    cases = build_cases(recorded, args.groups)
+    results = {
+        'recorded_frames': len(recorded),
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+                    'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                    'mediapipe': mp.__version__},
+        'cases': {},
+    }
+
+    print(f"{'case':26} {'frames':>7} {'best us':>10} {'median us':>10}")
+    for case, (frames, function) in cases.items():
+        stats = time_case(function, frames, args.repeats, args.min_time)
+        results['cases'][case] = {'frames': frames, **stats}
+        print(f"{case:26} {frames:7d} {stats['best_us']:10.2f} {stats['median_us']:10.2f}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(f"no baseline at {args.baseline}, record one with --save-baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
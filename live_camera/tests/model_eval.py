@@ -0,0 +1,227 @@
+"""
+Accuracy vs. latency of every registered model variant (utils/model_registry.py) on one labeled set of clips.
+
+The clip folder holds one sub folder per class, named like the model classes (case and '_' do not matter):
+    clips/Good/*.mp4, clips/Bad_Inward_Knee/*.mp4, ...
+
+Keypoints are extracted once per clip (MediaPipe Pose on every frame) and cached by clip content in --cache-dir,
+then every model gets the same keypoints, resampled onto its own window length and feature set. Compact models
+cover only a short part of a squat: they classify windows every --stride frames at their own frame rate, as
+in training, and a clip is scored on the mean of its window probabilities.
+Every model runs in its own process so load time and resident memory are measured cleanly.
+
+Reports per-class accuracy, confusion matrices, latency per window at batch sizes 1 / 8 / 32, model load time
+and resident memory, written as a markdown table to keep under version control:
+    python -m tests.model_eval path/to/clips [--output tests/model_eval.md] [--models meg_owndata ...]
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from utils.clip_dataset import find_clips, extract_clip_keypoints, clip_frames, clip_windows
+from utils.model_registry import MODEL_VARIANTS, label_index, normalize_label
+from utils.resample import resample_window
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BATCH_SIZES = (1, 8, 32)
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def evaluate_model(name, windows_path, repeats, queue):
+    """
+    Runs in a fresh process: loads one model, classifies all windows, times batches
+    """
+    variant = MODEL_VARIANTS[name]
+    cached = np.load(windows_path)
+    windows, clip_ids = cached['windows'], cached['clip_ids']
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    try:
+        model = variant.load()
+    except Exception as e:
+        queue.put({'skipped': f"{type(e).__name__}: {e}"})
+        return
+    load_time = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    predictions = model.predict(windows, verbose=0) if len(windows) else np.zeros((0, len(variant.class_labels)))
+    # one prediction per clip, the mean over its windows
+    predictions = np.stack([predictions[clip_ids == clip].mean(axis=0) for clip in np.unique(clip_ids)])
+
+    latency_ms = {}
+    for batch_size in BATCH_SIZES:
+        batch = windows[np.arange(batch_size) % len(windows)]
+        model.predict(batch, verbose=0)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.predict(batch, verbose=0)
+        latency_ms[batch_size] = (time.perf_counter() - start) / repeats / batch_size * 1000
+
+    queue.put({
+        'predicted': np.argmax(predictions, axis=1).tolist(),
+        'output_classes': int(predictions.shape[-1]),
+        'load_time_s': load_time,
+        'model_rss_mb': rss_loaded - rss_before,
+        'peak_rss_mb': rss_mb(),
+        'latency_ms': latency_ms,
+    })
+
+
+def markdown_report(results, clips_folder, num_clips):
+    lines = ["# Model evaluation", "",
+             f"{num_clips} clips from `{os.path.basename(os.path.normpath(clips_folder))}`, "
+             f"latency is per window (model.predict), memory is RSS after loading.", "",
+             "| model | window | clips | accuracy | load s | model RSS MB | "
+             + " | ".join(f"ms/window @{b}" for b in BATCH_SIZES) + " |",
+             "|---|---|---|---|---|---|" + "---|" * len(BATCH_SIZES)]
+    for name, result in results.items():
+        if 'skipped' in result:
+            lines.append(f"| {name} | - | - | skipped: {result['skipped']} | | |" + " |" * len(BATCH_SIZES))
+            continue
+        lines.append(f"| {name} | {result['sequence_length']} | {result['evaluated']} | {result['accuracy']:.3f} | "
+                     f"{result['load_time_s']:.1f} | {result['model_rss_mb']:.0f} | "
+                     + " | ".join(f"{result['latency_ms'][b]:.2f}" for b in BATCH_SIZES) + " |")
+
+    for name, result in results.items():
+        if 'skipped' in result:
+            continue
+        labels = result['class_labels']
+        lines += ["", f"## {name}", ""]
+        if result['not_in_model']:
+            lines += [f"Clips of classes the model does not have (left out): {result['not_in_model']}", ""]
+
+        lines += ["| class | clips | accuracy |", "|---|---|---|"]
+        for label, (count, accuracy) in result['per_class'].items():
+            lines.append(f"| {label} | {count} | {accuracy:.3f} |" if count else f"| {label} | 0 | - |")
+
+        lines += ["", "Confusion matrix (rows: true class, columns: predicted)", "",
+                  "| true \\ predicted | " + " | ".join(labels) + " |",
+                  "|---|" + "---|" * len(labels)]
+        for label, row in zip(labels, result['confusion']):
+            lines.append(f"| {label} | " + " | ".join(str(value) for value in row) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="folder with one sub folder of clips per class")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_VARIANTS), choices=list(MODEL_VARIANTS))
+    parser.add_argument("--cache-dir", default=os.path.join(TESTS_DIR, ".keypoint_cache"))
+    parser.add_argument("--output", default=os.path.join(TESTS_DIR, "model_eval.md"))
+    parser.add_argument("--json", default=None, help="also write the raw results as JSON")
+    parser.add_argument("--repeats", type=int, default=20, help="timed predict calls per batch size")
+    parser.add_argument("--workers", type=int, default=1, help="processes for the keypoint extraction of a clip")
+    parser.add_argument("--stride", type=int, default=3,
+                        help="frames between the ends of two windows of a compact model")
+    args = parser.parse_args()
+
+    clips = find_clips(args.clips)
+    print(f"{len(clips)} clips in {len({label for _, label in clips})} classes")
+
+    # Keypoint extraction runs once, every model reads the same rows
+    extracted = []
+    for path, label in clips:
+        print(f"keypoints: {os.path.relpath(path, args.clips)}")
+        extracted.append((label,) + extract_clip_keypoints(path, args.cache_dir, args.workers))
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for name in args.models:
+        variant = MODEL_VARIANTS[name]
+        if not variant.available():
+            results[name] = {'skipped': f"models/{name} not found"}
+            print(f"{name}: skipped, folder not found")
+            continue
+
+        # clips of classes the model was not trained on can not be scored
+        windows, clip_ids, targets, not_in_model = [], [], [], set()
+        for label, timestamps, keypoints in extracted:
+            target = label_index(variant, label)
+            if target is None:
+                not_in_model.add(label)
+                continue
+            if variant.features == 'compact':
+                # windows of the live frame rate, compact features include velocities within the window
+                frames = clip_frames(timestamps, keypoints, variant.model_fps)
+                if len(frames) < variant.sequence_length:
+                    print(f"{name}: clip of {label} shorter than one window, left out")
+                    continue
+                clip = variant.select_features(clip_windows(frames, [variant.sequence_length], args.stride)[0])
+            else:
+                # the whole clip resampled onto one window
+                clip = variant.select_features(resample_window(timestamps, keypoints, variant.sequence_length))[None]
+            windows.extend(clip.astype('float32'))
+            clip_ids.extend([len(targets)] * len(clip))
+            targets.append(target)
+        if not windows:
+            results[name] = {'skipped': "no clips of the model classes"}
+            continue
+
+        windows_path = os.path.join(args.cache_dir, f"windows_{name}.npz")
+        np.savez(windows_path, windows=np.stack(windows), clip_ids=np.asarray(clip_ids))
+
+        print(f"{name}: {len(windows)} windows of {len(targets)} clips")
+        queue = ctx.Queue()
+        process = ctx.Process(target=evaluate_model, args=(name, windows_path, args.repeats, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if 'skipped' in result:
+            results[name] = result
+            print(f"{name}: skipped, {result['skipped']}")
+            continue
+
+        labels = variant.class_labels
+        if result['output_classes'] != len(labels):
+            print(f"{name}: model has {result['output_classes']} outputs but {len(labels)} registered labels")
+            labels = (labels + [f"class {i}" for i in range(len(labels), result['output_classes'])])[
+                     :result['output_classes']]
+
+        predicted = np.asarray(result['predicted'])
+        targets = np.asarray(targets)
+        confusion = np.zeros((len(labels), len(labels)), dtype=int)
+        for target, prediction in zip(targets, predicted):
+            if target < len(labels):
+                confusion[target, prediction] += 1
+
+        per_class = {}
+        for index, label in enumerate(labels):
+            count = int(confusion[index].sum())
+            per_class[label] = (count, confusion[index, index] / count if count else 0.0)
+
+        result.update({
+            'sequence_length': variant.sequence_length,
+            'class_labels': labels,
+            'evaluated': len(targets),
+            'accuracy': float(np.mean(predicted == targets)),
+            'per_class': per_class,
+            'confusion': confusion.tolist(),
+            'not_in_model': sorted(normalize_label(label) for label in not_in_model),
+        })
+        results[name] = result
+
+    report = markdown_report(results, args.clips, len(clips))
+    with open(args.output, "w") as f:
+        f.write(report)
+    print(report)
+    print(f"written to {args.output}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Offline pose extraction time against the number of worker processes (utils/parallel_pose.py).
+
+A long video is made by playing a test clip forwards and backwards --repeats times. It is extracted once
+sequentially (one Pose graph in this process, like the upload analysis) and then with every worker count
+in --workers, in tracking mode (all frames, one time range per worker) and in static image mode
+(every --stride th frame). Reports seconds, frames per second, speedup over one worker and the scaling
+efficiency, and how far the landmarks are from the sequential run (ranges restart tracking at their
+first frame, so a few frames can differ).
+
+    python -m tests.parallel_pose_benchmark [video.mp4] [--repeats 8] [--workers 1 2 4 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.base import landmarks_from_results
+from utils.parallel_pose import extract_video_landmarks
+from utils.video_io import iter_timed_frames
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_long_video(video, repeats, path):
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for i in range(repeats):
+        for frame in (frames if i % 2 == 0 else frames[::-1]):
+            writer.write(frame)
+    writer.release()
+    return len(frames) * repeats
+
+
+def sequential(data, frame_indices=None):
+    landmarks = []
+    with mp.solutions.pose.Pose(static_image_mode=frame_indices is not None) as pose:
+        for _, _, frame in iter_timed_frames(data, frame_indices, format="rgb24"):
+            landmarks.append(landmarks_from_results(pose.process(frame)))
+    return np.stack(landmarks)
+
+
+def agreement(landmarks, reference):
+    """
+    Returns:
+        tuple: (frames where only one run found a person, median landmark distance in image units)
+    """
+    found, found_reference = ~np.isnan(landmarks[:, 0, 0]), ~np.isnan(reference[:, 0, 0])
+    both = found & found_reference
+    distance = np.linalg.norm(landmarks[both, :, :2] - reference[both, :, :2], axis=-1)
+    return int(np.sum(found != found_reference)), float(np.median(distance)) if distance.size else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", default=os.path.join(TESTS_DIR, "test_head.mp4"))
+    parser.add_argument("--repeats", type=int, default=8, help="forward / backward plays of the clip")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count()}))
+    parser.add_argument("--stride", type=int, default=3, help="frame step of the static image mode run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "long.mp4")
+        num_frames = make_long_video(args.video, args.repeats, path)
+        with open(path, "rb") as f:
+            data = f.read()
+        print(f"{num_frames} frames, {os.cpu_count()} CPUs")
+
+        for mode, frame_indices in (("tracking", None), ("static", list(range(0, num_frames, args.stride)))):
+            start = time.perf_counter()
+            reference = sequential(data, frame_indices)
+            sequential_time = time.perf_counter() - start
+            print(f"\n{mode}: {len(reference)} frames, sequential {sequential_time:.1f} s "
+                  f"({len(reference) / sequential_time:.1f} fps)")
+            print(f"{'workers':>8} {'seconds':>8} {'fps':>7} {'speedup':>8} {'efficiency':>11} "
+                  f"{'detect diff':>12} {'median dist':>12}")
+
+            single = None
+            for workers in args.workers:
+                start = time.perf_counter()
+                _, landmarks = extract_video_landmarks(data, frame_indices, workers=workers)
+                elapsed = time.perf_counter() - start
+                single = single or elapsed
+                mismatched, distance = agreement(landmarks, reference)
+                print(f"{workers:8d} {elapsed:8.1f} {len(landmarks) / elapsed:7.1f} {single / elapsed:7.2f}x "
+                      f"{single / elapsed / workers:10.0%} {mismatched:12d} {distance:12.5f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+CPU time of a live loop with and without the presence detector (utils/presence.py) in front of MediaPipe Pose.
+
+The scene is made from a test clip: the empty part of its first frame (the person is cut away, see --empty-crop)
+with camera noise for --idle seconds, then the clip itself (someone steps in front of the camera), then the empty
+scene again. Every frame goes through Pose once on every frame and once behind the detector.
+
+Reports Pose calls, CPU ms per frame while the scene is empty and while the person is there, the cost of the
+detector itself, and the frames on which Pose found the person but the detector skipped it:
+    python -m tests.presence_benchmark [video.mp4] [--idle 10]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from utils.presence import PresenceDetector
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FPS = 30
+
+
+def make_scene(video, idle_seconds, empty_crop, size, noise, seed=0):
+    """
+    Returns:
+        list: (phase, BGR frame) with phase 'empty' or 'person'
+    """
+    cap = cv2.VideoCapture(video)
+    clip = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        clip.append(cv2.resize(frame, size))
+    cap.release()
+
+    first = clip[0]
+    x0, x1 = int(empty_crop[0] * first.shape[1]), int(empty_crop[1] * first.shape[1])
+    empty = cv2.resize(first[:, x0:x1], size)
+
+    rng = np.random.default_rng(seed)
+
+    def noisy(frame):
+        return np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+
+    idle = [('empty', noisy(empty)) for _ in range(int(idle_seconds * FPS))]
+    return idle + [('person', frame) for frame in clip] + [('empty', noisy(empty)) for _ in range(len(idle))]
+
+
+def run(scene, detector=None):
+    """
+    Returns:
+        tuple: (found per frame or None when skipped, CPU seconds per phase, frames per phase, detector seconds)
+    """
+    found, cpu, frames = [], {'empty': 0.0, 'person': 0.0}, {'empty': 0, 'person': 0}
+    detector_time = 0.0
+    rgb = np.empty_like(scene[0][1])
+    with mp.solutions.pose.Pose() as pose:
+        for index, (phase, frame) in enumerate(scene):
+            start = time.process_time()
+            if detector is not None:
+                detector_start = time.perf_counter()
+                check = detector.check(frame, index / FPS)
+                detector_time += time.perf_counter() - detector_start
+            else:
+                check = True
+            if check:
+                results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb))
+                person = results.pose_landmarks is not None
+                if detector is not None:
+                    detector.report(person)
+                found.append(person)
+            else:
+                found.append(None)
+            cpu[phase] += time.process_time() - start
+            frames[phase] += 1
+    return found, cpu, frames, detector_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", default=os.path.join(TESTS_DIR, "test_head.mp4"))
+    parser.add_argument("--idle", type=float, default=10.0, help="seconds of empty scene before and after the clip")
+    parser.add_argument("--empty-crop", type=float, nargs=2, default=(0.0, 0.5),
+                        help="horizontal part of the first frame without the person, as fractions of the width")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--noise", type=float, default=2.0, help="camera noise, grey levels")
+    args = parser.parse_args()
+
+    first = cv2.VideoCapture(args.video).read()[1]
+    size = (args.width, int(args.width * first.shape[0] / first.shape[1]))
+    scene = make_scene(args.video, args.idle, args.empty_crop, size, args.noise)
+    print(f"{len(scene)} frames at {size[0]}x{size[1]}, {sum(phase == 'person' for phase, _ in scene)} with the person")
+
+    reference, cpu, frames, _ = run(scene)
+    detector = PresenceDetector()
+    gated, gated_cpu, _, detector_time = run(scene, detector)
+
+    missed = sum(1 for ref, gate in zip(reference, gated) if ref and gate is None)
+    print(f"\n{'':14} {'pose calls':>10} {'empty ms/frame':>15} {'person ms/frame':>16}")
+    for name, found, phase_cpu in (("every frame", reference, cpu), ("presence", gated, gated_cpu)):
+        calls = sum(1 for value in found if value is not None)
+        print(f"{name:14} {calls:10d} {phase_cpu['empty'] / frames['empty'] * 1000:15.2f} "
+              f"{phase_cpu['person'] / frames['person'] * 1000:16.2f}")
+    print(f"\ndetector {detector_time / len(scene) * 1e6:.0f} us per frame, skipped {detector.skipped_ratio():.0%} "
+          f"of the frames; frames with a person that were skipped: {missed} of {sum(map(bool, reference))}")
+
+
+if __name__ == "__main__":
+    main()
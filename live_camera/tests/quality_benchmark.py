@@ -0,0 +1,183 @@
+"""
+Convergence of the adaptive quality controller (utils/quality.py) under a throttled CPU.
+
+The bundled test clips are played in a loop at 1280x720 through the per-frame work of camera_movement.py
+(Pose input resize and RGB conversion, Pose, counter, classification of every finished repetition, overlay at
+the render detail of the level) at the level the controller picks. The CPU is throttled by
+spinning --slowdown - 1 times as long as the work of every frame took, as on a machine that many times slower.
+Decoding is not timed, like waiting for the camera.
+
+For every slowdown the level changes are printed as they happen, then a timeline of level, fps and ms per
+frame, and a summary: level reached, when the last change was, fps over the last seconds against the target:
+    python -m tests.quality_benchmark [--target-fps 20] [--slowdown 1 2 4] [--seconds 30]
+The repetitions are only segmented, not classified, when TensorFlow is not installed or with --no-model.
+"""
+import argparse
+import glob
+import itertools
+import os
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.rep_segmentation import RepClassifier, RepSegmenter
+from exercise.squat import process_shallow
+from utils.constant import KNEE_ANGLE_DEPTH, QUALITY_TARGET_LATENCY
+from utils.draw_display import draw_text, draw_leg_landmarks
+from utils.frame_buffers import FrameBuffers
+from utils.mediapipe_helper import extract_keypoints
+from utils.quality import QualityController, PoseGraphs
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FOLDER = os.path.join(TESTS_DIR, os.pardir, 'models', 'meg_owndata')
+SIZE = (1280, 720)
+# seconds at the end of a run the final fps is measured over
+FINAL_SECONDS = 5.0
+
+
+def load_model():
+    try:
+        from keras.models import load_model
+    except ImportError:
+        print("TensorFlow / Keras not installed, skipping the predict stage")
+        return None
+    return load_model(MODEL_FOLDER)
+
+
+def clip_frames(videos):
+    """
+    Endless 1280x720 BGR frames of the clips, one after the other
+    """
+    for video in itertools.cycle(videos):
+        cap = cv2.VideoCapture(video)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield cv2.resize(frame, SIZE)
+        cap.release()
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def run(videos, model, target_fps, target_latency, slowdown, seconds, mp_pose, pose_graphs):
+    """
+    Returns:
+        tuple: (QualityController, list of (seconds since the start, level index, frame seconds) per frame,
+                seconds since the start of the last level change or 0)
+    """
+    quality = QualityController(target_fps, target_latency=target_latency,
+                                log=lambda text: print(f"  {time.monotonic() - start:6.1f} s  {text}"))
+    # the model runs once per repetition, as in camera_movement.py
+    classifier = RepClassifier(model, mp_pose) if model is not None else None
+    segmenter = classifier.segmenter if classifier is not None else RepSegmenter(mp_pose)
+    buffers = FrameBuffers()
+    drawing_utils = mp.solutions.drawing_utils
+
+    frames = []
+    start = time.monotonic()
+    for frame in clip_frames(videos):
+        level = quality.level
+        pose = pose_graphs.get(level.model_complexity)
+        work_start = time.perf_counter()
+
+        results = pose.process(buffers.to_rgb(buffers.resize(frame, level.pose_size(frame))))
+        if results.pose_landmarks:
+            keypoints = extract_keypoints(results)
+            if classifier is not None:
+                classifier.update(results, keypoints)
+            else:
+                segmenter.update(results, keypoints)
+            counter, knee_obj = segmenter.counter, segmenter.knee_obj
+
+            if level.draws('full'):
+                drawing_utils.draw_landmarks(frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
+                                             drawing_utils.DrawingSpec(color=(245, 117, 66), thickness=15,
+                                                                       circle_radius=5),
+                                             drawing_utils.DrawingSpec(color=(255, 255, 255), thickness=15,
+                                                                       circle_radius=5))
+            if level.draws('basic'):
+                knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
+                draw_leg_landmarks(mp, frame, results,
+                                   color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
+                process_shallow(frame, counter, knee_obj)
+            draw_text(frame, (0, 50), f"{counter.direction_text} | Cycles: {counter.count}", color=(255, 255, 255))
+
+        work = time.perf_counter() - work_start
+        # a CPU slowdown times slower
+        spin(work * (slowdown - 1))
+        frame_seconds = time.perf_counter() - work_start
+
+        now = time.monotonic()
+        frames.append((now - start, quality.index, frame_seconds))
+        if results.pose_landmarks:
+            quality.update(now, frame_seconds)
+        if now - start > seconds:
+            break
+    settled = quality.changes[-1][0] - start if quality.changes else 0.0
+    return quality, frames, settled
+
+
+def timeline(frames, interval=2.0):
+    """
+    Level, fps and mean ms per frame per interval seconds
+    """
+    rows = []
+    times = np.array([frame[0] for frame in frames])
+    for begin in np.arange(0, times[-1], interval):
+        selected = [frame for frame in frames if begin <= frame[0] < begin + interval]
+        if selected:
+            durations = np.array([frame[2] for frame in selected])
+            rows.append((begin, selected[-1][1], 1 / durations.mean(), durations.mean() * 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="videos to play, defaults to the bundled test clips")
+    parser.add_argument("--target-fps", type=float, default=20.0)
+    parser.add_argument("--target-latency", type=float, default=QUALITY_TARGET_LATENCY * 1000, help="ms")
+    parser.add_argument("--slowdown", type=float, nargs="+", default=[1.0, 2.0, 4.0],
+                        help="CPU throttle factors, one run each")
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of every run")
+    parser.add_argument("--no-model", action="store_true", help="skip the repetition classification")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob(os.path.join(TESTS_DIR, "*.mp4")))
+    model = None if args.no_model else load_model()
+    mp_pose = mp.solutions.pose
+    # the graphs are loaded once, not inside the timed runs
+    pose_graphs = PoseGraphs(mp_pose)
+
+    summary = []
+    for slowdown in args.slowdown:
+        print(f"\nslowdown {slowdown:g}x, target {args.target_fps:g} fps / p95 {args.target_latency:g} ms")
+        quality, frames, settled = run(videos, model, args.target_fps, args.target_latency / 1000, slowdown,
+                                       args.seconds, mp_pose, pose_graphs)
+        print(f"\n  {'time s':>6} {'level':>5} {'fps':>6} {'ms/frame':>9}")
+        for begin, level, fps, ms in timeline(frames):
+            print(f"  {begin:6.0f} {level:5d} {fps:6.1f} {ms:9.1f}")
+
+        end = frames[-1][0]
+        final = np.array([frame[2] for frame in frames if frame[0] > end - FINAL_SECONDS])
+        summary.append((slowdown, quality.index, len(quality.changes), settled, 1 / final.mean(),
+                        np.percentile(final, 95) * 1000))
+    if pose_graphs.unavailable:
+        print(f"\nmodel_complexity {sorted(pose_graphs.unavailable)} could not be loaded, "
+              f"those levels ran the complexity 1 model")
+
+    print(f"\n{'slowdown':>8} {'level':>5} {'changes':>7} {'settled at s':>12} "
+          f"{'fps last ' + str(int(FINAL_SECONDS)) + ' s':>14} {'p95 ms':>7} {'target met':>10}")
+    for slowdown, level, changes, settled, fps, p95 in summary:
+        met = fps >= args.target_fps and p95 <= args.target_latency
+        print(f"{slowdown:8g} {level:5d} {changes:7d} {settled:12.1f} {fps:14.1f} {p95:7.1f} {str(met):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Checks that the vectorized squat rules (exercise/base.py RuleEngine, exercise/squat.py SQUAT) and the scalar
+Counter of the live and upload paths (exercise/rep_segmentation.py RepSegmenter) agree, so the two copies of
+the rules can not drift apart.
+
+MediaPipe Pose runs over the bundled test clips (or the given videos); the frames with a person go through
+both, the direction (UP / DOWN / STABLE) of every frame and the repetition count of every clip are compared.
+Exits 1 on any difference:
+    python -m tests.rule_engine_check [videos ...]
+"""
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.base import RuleEngine, going_up_state, landmarks_from_results
+from exercise.rep_segmentation import RepSegmenter
+from exercise.squat import SQUAT
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def scalar_directions(video, pose, mp_pose):
+    """
+    Returns:
+        tuple: (landmarks (frames, 33, 4), Counter direction_text per frame, Counter count), frames with a person
+    """
+    segmenter = RepSegmenter(mp_pose)
+    landmarks, directions = [], []
+    cap = cv2.VideoCapture(video)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if results.pose_landmarks:
+            segmenter.update(results, None)
+            landmarks.append(landmarks_from_results(results))
+            directions.append(segmenter.counter.direction_text)
+    cap.release()
+    return np.array(landmarks).reshape(-1, 33, 4), directions, segmenter.counter.count
+
+
+def engine_directions(engine, landmarks):
+    """
+    Returns:
+        tuple: (direction per frame as the Counter names it, repetition count)
+    """
+    _, phases = engine.evaluate(landmarks)
+    up, down = phases[SQUAT.up_phase], phases[SQUAT.down_phase]
+    _, counted = going_up_state(up, down)
+    # UP wins over DOWN, as in Counter.update_counter
+    directions = np.where(up, "UP", np.where(down, "DOWN", "STABLE"))
+    return list(directions), int(counted.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="videos to check, defaults to the bundled test clips")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob(os.path.join(TESTS_DIR, "*.mp4")))
+    mp_pose = mp.solutions.pose
+    engine = RuleEngine(SQUAT)
+
+    failed = False
+    print(f"{'clip':32} {'frames':>6} {'count':>5} {'engine':>6} {'differing frames':>16}")
+    for video in videos:
+        # a fresh graph per clip, tracking must not carry over from the previous clip
+        with mp_pose.Pose() as pose:
+            landmarks, directions, count = scalar_directions(video, pose, mp_pose)
+        engine_dirs, engine_count = engine_directions(engine, landmarks)
+        differing = [index for index, (a, b) in enumerate(zip(directions, engine_dirs)) if a != b]
+        print(f"{os.path.basename(video):32} {len(directions):6d} {count:5d} {engine_count:6d} {len(differing):16d}")
+        for index in differing[:5]:
+            print(f"    frame {index}: Counter {directions[index]}, RuleEngine {engine_dirs[index]}")
+        failed |= bool(differing) or count != engine_count
+
+    if failed:
+        print("\nthe RuleEngine and the Counter disagree")
+        sys.exit(1)
+    print("\nthe RuleEngine and the Counter agree on every frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Rep detection latency and miscount rate of the squat counter with the default moving averages
+(NUM_FRAMES_SHOULDER / NUM_FRAMES_KNEE) against smoothed landmarks with the shorter SMOOTHED_NUM_FRAMES_* windows.
+
+Every clip is played forward and backward --repeats times (a squat played backwards is still a squat),
+so one clip gives several repetitions. The reference repetitions come from an offline, zero-phase smoothed
+knee angle; latency is the time from the reference bottom of a repetition to the frame the counter counts it.
+--noise and --drop add landmark jitter and frames without a detection on top of the clips.
+
+Run from the live_camera folder:
+    python -m tests.smoothing_benchmark [--repeats 4] [--noise 0.005] [--drop 0.1] [video.mp4 ...]
+"""
+import argparse
+import glob
+import os
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from exercise.base import landmarks_from_results, joint_angles
+from exercise.rep_segmentation import RepSegmenter
+from utils.constant import NUM_FRAMES_SHOULDER, NUM_FRAMES_KNEE, SMOOTHED_NUM_FRAMES_SHOULDER, SMOOTHED_NUM_FRAMES_KNEE
+from utils.landmark_data import LandmarkData
+from utils.mediapipe_helper import results_from_landmarks
+from utils.smoothing import OneEuroFilter, ConstantVelocityKalman
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (name, filter factory, shoulder window, knee window)
+CONFIGS = [
+    ("raw 25/15", None, NUM_FRAMES_SHOULDER, NUM_FRAMES_KNEE),
+    ("raw short", None, SMOOTHED_NUM_FRAMES_SHOULDER, SMOOTHED_NUM_FRAMES_KNEE),
+    ("one euro short", OneEuroFilter, SMOOTHED_NUM_FRAMES_SHOULDER, SMOOTHED_NUM_FRAMES_KNEE),
+    ("kalman short", ConstantVelocityKalman, SMOOTHED_NUM_FRAMES_SHOULDER, SMOOTHED_NUM_FRAMES_KNEE),
+]
+
+
+def extract_landmarks(video):
+    """
+    Returns:
+        tuple: (landmarks (T, 33, 4) with NaN rows for frames without a person, fps)
+    """
+    mp_pose = mp.solutions.pose
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    landmarks = []
+    with mp_pose.Pose() as pose:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            landmarks.append(landmarks_from_results(pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))))
+    cap.release()
+    return np.stack(landmarks), fps
+
+
+def ping_pong(landmarks, repeats):
+    return np.concatenate([landmarks if i % 2 == 0 else landmarks[::-1] for i in range(repeats)])
+
+
+def reference_bottoms(landmarks, timestamps):
+    """
+    Bottoms of the repetitions from the knee angle smoothed over 9 frames centered on every frame
+
+    """
+    valid = ~np.isnan(landmarks[:, 0, 0])
+    hip, knee, ankle = (landmarks[:, [23, 24]], landmarks[:, [25, 26]], landmarks[:, [27, 28]])
+    angle = np.min(joint_angles(hip[..., :2], knee[..., :2], ankle[..., :2]), axis=1)
+    angle = np.interp(timestamps, timestamps[valid], angle[valid])
+    angle = np.convolve(np.pad(angle, 4, mode='edge'), np.ones(9) / 9, mode='valid')
+
+    top, bottom = angle.max(), angle.min()
+    if top - bottom < 30:
+        return []
+    low = top - 0.6 * (top - bottom)
+    high = top - 0.3 * (top - bottom)
+
+    bottoms = []
+    start = None
+    for i, value in enumerate(angle):
+        if start is None and value < low:
+            start = i
+        elif start is not None and value > high:
+            bottoms.append(timestamps[start + np.argmin(angle[start:i])])
+            start = None
+    return bottoms
+
+
+def count_times(landmarks, timestamps, landmark_filter, shoulder_frames, knee_frames):
+    mp_pose = mp.solutions.pose
+    segmenter = RepSegmenter(mp_pose, landmark_filter=landmark_filter)
+    segmenter.shoulder_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_SHOULDER, mp_pose.PoseLandmark.RIGHT_SHOULDER,
+                                          shoulder_frames)
+    segmenter.knee_obj = LandmarkData(mp_pose.PoseLandmark.LEFT_KNEE, mp_pose.PoseLandmark.RIGHT_KNEE, knee_frames)
+
+    counted = []
+    for frame_landmarks, timestamp in zip(landmarks, timestamps):
+        count_before = segmenter.counter.count
+        segmenter.update(results_from_landmarks(frame_landmarks), None, timestamp=timestamp)
+        if segmenter.counter.count != count_before:
+            counted.append(timestamp)
+    return counted
+
+
+def match_latencies(reference, counted):
+    """
+    Pairs every reference bottom with the first count after it (before the next bottom)
+
+    """
+    latencies = []
+    for i, bottom in enumerate(reference):
+        next_bottom = reference[i + 1] if i + 1 < len(reference) else np.inf
+        after = [t for t in counted if bottom <= t < next_bottom]
+        if after:
+            latencies.append(after[0] - bottom)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="videos to test, defaults to the bundled test clips")
+    parser.add_argument("--repeats", type=int, default=4, help="forward / backward plays of every clip")
+    parser.add_argument("--noise", type=float, default=0.005, help="landmark jitter std in normalized image units")
+    parser.add_argument("--drop", type=float, default=0.1, help="fraction of frames without a detection")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob(os.path.join(TESTS_DIR, "*.mp4")))
+    rng = np.random.default_rng(args.seed)
+
+    clips = []
+    for video in videos:
+        landmarks, fps = extract_landmarks(video)
+        landmarks = ping_pong(landmarks, args.repeats)
+        timestamps = np.arange(len(landmarks)) / fps
+        reference = reference_bottoms(landmarks, timestamps)
+
+        noisy = landmarks.copy()
+        noisy[..., :3] += rng.normal(0, args.noise, noisy[..., :3].shape)
+        noisy[rng.random(len(noisy)) < args.drop] = np.nan
+        clips.append((os.path.basename(video), timestamps, reference, {"clean": landmarks, "noisy": noisy}))
+        print(f"{os.path.basename(video):32} {len(reference)} reference reps in {timestamps[-1]:.1f} s")
+
+    print(f"\n{'config':16} {'input':6} {'ref reps':>8} {'counted':>8} {'miscount %':>10} "
+          f"{'latency ms':>10} {'p95 ms':>8}")
+    for name, filter_factory, shoulder_frames, knee_frames in CONFIGS:
+        for condition in ("clean", "noisy"):
+            total_reference = total_counted = total_error = 0
+            latencies = []
+            for _, timestamps, reference, inputs in clips:
+                landmark_filter = filter_factory() if filter_factory else None
+                counted = count_times(inputs[condition], timestamps, landmark_filter, shoulder_frames, knee_frames)
+                total_reference += len(reference)
+                total_counted += len(counted)
+                total_error += abs(len(counted) - len(reference))
+                latencies += match_latencies(reference, counted)
+
+            miscount = 100 * total_error / max(total_reference, 1)
+            latency = 1000 * np.mean(latencies) if latencies else float('nan')
+            latency_p95 = 1000 * np.percentile(latencies, 95) if latencies else float('nan')
+            print(f"{name:16} {condition:6} {total_reference:8d} {total_counted:8d} {miscount:10.1f} "
+                  f"{latency:10.0f} {latency_p95:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
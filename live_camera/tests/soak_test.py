@@ -0,0 +1,286 @@
+"""
+Soak test: replays a test clip in a loop through the processing path of every frontend and watches memory.
+
+Frontends:
+    camera_movement   per-frame path of camera_movement.py (pose, rep classification, drawing, overlay)
+    tkinter           performance_eval.analysis as called by tkinter_gui.py, plus the PIL / PhotoImage conversion
+    upload            the Streamlit upload path, in-memory decode and analyze_video_reps for every replay
+    upload_no_arm     the same with the no-arm model and features of realtime_upload_no_arms.py
+
+Every frontend runs in its own process. RSS and the tracemalloc heap are sampled every --interval seconds;
+after --warmup seconds the growth per hour is fitted and the run fails when it exceeds --max-growth-mb-per-hour.
+The allocation sites that grew the most after the warmup are reported.
+
+Run from the live_camera folder:
+    python -m tests.soak_test --duration 600 [--frontends upload tkinter] [--dummy-model] [video.mp4]
+
+--dummy-model replaces the classifier with a constant output stand-in, to soak the pose / drawing / IO path
+on its own (or where TensorFlow is not installed).
+"""
+import argparse
+import gc
+import multiprocessing as mp
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTENDS = ['camera_movement', 'tkinter', 'upload', 'upload_no_arm']
+
+
+class ConstantModel:
+    """
+    Stand-in for the AttnLSTM with the same input shape, always predicts the uniform distribution
+    """
+    def __init__(self, num_classes=7, num_features=33 * 4):
+        self.num_classes = num_classes
+        self.input_shape = (None, 30, num_features)
+
+    def predict(self, windows, verbose=0):
+        return np.full((len(windows), self.num_classes), 1.0 / self.num_classes, dtype='float32')
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ClipReplay:
+    """
+    Frames of a video forever, rewinding at the end
+    """
+    def __init__(self, video):
+        import cv2
+        self.cv2 = cv2
+        self.cap = cv2.VideoCapture(video)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return frame
+
+
+def camera_movement_frontend(video, dummy_model):
+    import cv2
+    import mediapipe as mp_solutions
+    from camera_movement import VideoProcessor, create_model
+    from exercise.rep_segmentation import RepClassifier
+    from exercise.squat import process_shallow
+    from utils.constant import KNEE_ANGLE_DEPTH
+    from utils.draw_display import draw_text, draw_leg_landmarks
+    from utils.mediapipe_helper import extract_keypoints
+
+    model = ConstantModel() if dummy_model else create_model()
+    mp_pose = mp_solutions.solutions.pose
+    pose = mp_pose.Pose()
+    video_processor = VideoProcessor()
+    rep_classifier = RepClassifier(model, mp_pose)
+    replay = ClipReplay(video)
+
+    def step():
+        frame = replay.read()
+        results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if results.pose_landmarks:
+            mp_solutions.solutions.drawing_utils.draw_landmarks(frame, results.pose_landmarks,
+                                                                mp_pose.POSE_CONNECTIONS)
+            rep_classifier.update(results, extract_keypoints(results))
+            knee_obj = rep_classifier.segmenter.knee_obj
+            knee_angle = min(knee_obj.left_angle, knee_obj.right_angle)
+            draw_leg_landmarks(mp_solutions, frame, results,
+                               color=(0, 255, 0) if knee_angle < KNEE_ANGLE_DEPTH else (0, 0, 255))
+            process_shallow(frame, rep_classifier.counter, knee_obj)
+            draw_text(frame, (0, 50), f"{rep_classifier.counter.direction_text} | Cycles: "
+                                      f"{rep_classifier.counter.count}", color=(255, 255, 255))
+            video_processor.rep_inference_process(rep_classifier, frame)
+
+    return step
+
+
+def tkinter_frontend(video, dummy_model):
+    import cv2
+    from PIL import Image
+    from performance_eval import analysis, create_model, VideoProcessor
+
+    model = ConstantModel() if dummy_model else create_model()
+    video_processor = VideoProcessor()
+    replay = ClipReplay(video)
+
+    # PhotoImage needs a Tk display, without one only the PIL conversion is soaked
+    try:
+        import tkinter as tk
+        from PIL import ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        print(f"tkinter: no display ({e}), skipping PhotoImage")
+        ImageTk = None
+    state = {'imgtk': None}
+
+    def step():
+        frame = analysis(replay.read(), model, video_processor)
+        buffers = video_processor.buffers
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("display", frame.shape)))
+        if ImageTk is not None:
+            # same reuse as tkinter_gui.show_frame
+            if state['imgtk'] is None:
+                state['imgtk'] = ImageTk.PhotoImage(image=img)
+            else:
+                state['imgtk'].paste(img)
+
+    return step
+
+
+def upload_frontend(video, dummy_model, no_arm=False):
+    import mediapipe as mp_solutions
+    from exercise.rep_analysis import analyze_video_reps
+    from utils.mediapipe_helper import extract_keypoints, extract_keypoints_no_arm, NO_ARM_LANDMARKS
+    from utils.video_io import iter_sampled_frames
+
+    # model folder, classes and keypoints of realtime_upload.py / realtime_upload_no_arms.py
+    folder, num_classes = ('no_arm_our_0.001', 6) if no_arm else ('LSTM_model_0.0005', 7)
+    extract_fn = extract_keypoints_no_arm if no_arm else extract_keypoints
+    if dummy_model:
+        model = ConstantModel(num_classes, len(NO_ARM_LANDMARKS) * 4 if no_arm else 33 * 4)
+    else:
+        from keras.models import load_model
+        model = load_model(os.path.join(TESTS_DIR, os.pardir, 'models', folder))
+    mp_pose = mp_solutions.solutions.pose
+    class_labels = [f"class {i}" for i in range(num_classes)]
+    with open(video, "rb") as f:
+        data = f.read()
+
+    def step():
+        # single repetition path, then the multi-rep analysis with a fresh tracker as in the app
+        for _ in iter_sampled_frames(data, 30):
+            pass
+        with mp_pose.Pose() as pose:
+            analyze_video_reps(data, model, pose, mp_pose, class_labels, extract_fn=extract_fn)
+
+    return step
+
+
+def upload_no_arm_frontend(video, dummy_model):
+    return upload_frontend(video, dummy_model, no_arm=True)
+
+
+FRONTEND_FACTORIES = {
+    'camera_movement': camera_movement_frontend,
+    'tkinter': tkinter_frontend,
+    'upload': upload_frontend,
+    'upload_no_arm': upload_no_arm_frontend,
+}
+
+
+def run_frontend(name, video, duration, interval, warmup, dummy_model, top, queue):
+    try:
+        step = FRONTEND_FACTORIES[name](video, dummy_model)
+    except ImportError as e:
+        queue.put({'name': name, 'skipped': f"{type(e).__name__}: {e}"})
+        return
+
+    tracemalloc.start()
+    samples = []
+    warmup_snapshot = None
+    steps = 0
+    start = time.monotonic()
+    next_sample = start
+    while True:
+        now = time.monotonic()
+        if now >= next_sample:
+            gc.collect()
+            samples.append((now - start, rss_mb(), tracemalloc.get_traced_memory()[0] / 1e6))
+            next_sample += interval
+            if warmup_snapshot is None and now - start >= warmup:
+                warmup_snapshot = tracemalloc.take_snapshot()
+        if now - start >= duration:
+            break
+        step()
+        steps += 1
+
+    final_snapshot = tracemalloc.take_snapshot()
+    top_sites = []
+    if warmup_snapshot is not None:
+        grown = [stat for stat in final_snapshot.compare_to(warmup_snapshot, 'lineno') if stat.size_diff > 0]
+        for stat in grown[:top]:
+            top_sites.append(f"{stat.size_diff / 1e3:+10.1f} kB {stat.count_diff:+7d} blocks  {stat.traceback}")
+    queue.put({'name': name, 'steps': steps, 'samples': samples, 'top_sites': top_sites})
+
+
+def growth_per_hour(samples, warmup, windows=4):
+    """
+    Memory growth (MB per hour) after the warmup, fitted through the lowest RSS and heap of each of `windows`
+    consecutive time windows. Allocator and garbage collector noise moves memory up and down, a leak raises
+    the floor it comes back down to.
+    """
+    steady = [sample for sample in samples if sample[0] >= warmup]
+    if len(steady) < 2 * windows:
+        return None, None
+
+    floors = []
+    for window in np.array_split(np.asarray(steady), windows):
+        floors.append((window[:, 0].mean(), window[:, 1].min(), window[:, 2].min()))
+    t, rss, heap = np.asarray(floors).T
+    return np.polyfit(t, rss, 1)[0] * 3600, np.polyfit(t, heap, 1)[0] * 3600
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?", default=os.path.join(TESTS_DIR, "test_head.mp4"))
+    parser.add_argument("--frontends", nargs="+", choices=FRONTENDS, default=FRONTENDS)
+    parser.add_argument("--duration", type=float, default=600, help="seconds per frontend")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between memory samples")
+    parser.add_argument("--warmup", type=float, default=60, help="seconds before growth is measured")
+    parser.add_argument("--max-growth-mb-per-hour", type=float, default=50.0)
+    parser.add_argument("--top", type=int, default=10, help="allocation sites to report")
+    parser.add_argument("--dummy-model", action="store_true", help="constant output classifier instead of the model")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    failed = []
+    for name in args.frontends:
+        print(f"\n=== {name}: {args.duration:.0f} s on {os.path.basename(args.video)}")
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_frontend, args=(name, args.video, args.duration, args.interval,
+                                                          args.warmup, args.dummy_model, args.top, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+
+        if 'skipped' in result:
+            print(f"skipped: {result['skipped']}")
+            continue
+
+        print(f"{'time s':>8} {'RSS MB':>9} {'heap MB':>9}")
+        for t, rss, heap in result['samples']:
+            print(f"{t:8.0f} {rss:9.1f} {heap:9.2f}")
+
+        rss_growth, heap_growth = growth_per_hour(result['samples'], args.warmup)
+        if rss_growth is None:
+            print("not enough samples after the warmup to measure growth")
+            continue
+        status = "FAIL" if rss_growth > args.max_growth_mb_per_hour else "ok"
+        print(f"{result['steps']} steps | RSS growth {rss_growth:+.1f} MB/h | heap growth {heap_growth:+.1f} MB/h "
+              f"| limit {args.max_growth_mb_per_hour:.0f} MB/h | {status}")
+        if result['top_sites']:
+            print("top allocation growth since the warmup:")
+            for line in result['top_sites']:
+                print(f"  {line}")
+        if status == "FAIL":
+            failed.append(name)
+
+    if failed:
+        print(f"\nmemory growth over the limit: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
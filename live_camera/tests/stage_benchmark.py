@@ -0,0 +1,148 @@
+"""
+Per-stage latency of the live pipeline of camera_movement.py on the bundled test clips, without cv2.imshow / waitKey.
+
+The clips run through camera_movement.FramePipeline itself, the per-frame processing of main(), so the timed
+stages are the ones of the app: decode, presence, bgr_to_rgb, pose, draw, counter_classify (counter, plus the
+AttnLSTM once per repetition) and overlay. The repetitions are only counted when TensorFlow is not installed
+or with --no-model.
+
+Results are written as JSON and compared with a saved baseline, the run fails without one:
+    python -m tests.stage_benchmark --save-baseline       # record tests/stage_benchmark_baseline.json
+    python -m tests.stage_benchmark                        # run and compare with it
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+
+import cv2
+import mediapipe as mp
+
+from camera_movement import FramePipeline, VideoProcessor, create_model
+from exercise.rep_segmentation import RepClassifier, RepSegmenter
+from utils.constant import LANDMARK_FILTER, PRESENCE_ENABLED, QUALITY_LEVELS, QUALITY_START_LEVEL
+from utils.presence import PresenceDetector
+from utils.quality import QualityLevel
+from utils.smoothing import create_filter
+from utils.stage_timer import StageTimer
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ['decode', 'presence', 'bgr_to_rgb', 'pose', 'draw', 'counter_classify', 'overlay']
+
+
+def load_model():
+    try:
+        return create_model()
+    except ImportError:
+        print("TensorFlow / Keras not installed, the repetitions are only counted")
+        return None
+
+
+def run_clip(video, timer, model, warmup):
+    mp_pose = mp.solutions.pose
+    # set up as in camera_movement.main, at the start quality level
+    rep_classifier = None
+    if model is not None:
+        rep_classifier = RepClassifier(model, mp_pose, landmark_filter=create_filter(LANDMARK_FILTER))
+        segmenter = rep_classifier.segmenter
+    else:
+        segmenter = RepSegmenter(mp_pose, landmark_filter=create_filter(LANDMARK_FILTER))
+    level = QualityLevel(*QUALITY_LEVELS[QUALITY_START_LEVEL])
+    presence = PresenceDetector() if PRESENCE_ENABLED else None
+
+    cap = cv2.VideoCapture(video)
+    frame_index = 0
+    with mp_pose.Pose(model_complexity=level.model_complexity) as pose:
+        pipeline = FramePipeline(mp_pose, pose, level, segmenter, VideoProcessor(), timer,
+                                 rep_classifier=rep_classifier, presence=presence)
+        while True:
+            # the first frames warm up the graph and the model, they are timed into a scratch timer
+            pipeline.metrics = timer if frame_index >= warmup else StageTimer()
+            ret, frame = pipeline.read(cap)
+            if not ret:
+                break
+            # the clip time stands in for the capture time of the presence detector
+            pipeline.process(frame, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            frame_index += 1
+    cap.release()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the p50 / p95 change of every stage against the baseline
+
+    Returns:
+        list: stages slower than the baseline by more than tolerance (fraction) at p50
+    """
+    regressions = []
+    print(f"\n{'stage':18} {'p50 ms':>9} {'base':>9} {'change':>8} {'p95 ms':>9} {'base':>9} {'change':>8}")
+    for stage, current in results['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None:
+            print(f"{stage:18} {current['p50_ms']:9.2f} {'-':>9} {'new':>8}")
+            continue
+        change_p50 = current['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        change_p95 = current['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        flag = "  REGRESSION" if change_p50 > tolerance else ""
+        print(f"{stage:18} {current['p50_ms']:9.2f} {base['p50_ms']:9.2f} {100 * change_p50:+7.1f}% "
+              f"{current['p95_ms']:9.2f} {base['p95_ms']:9.2f} {100 * change_p95:+7.1f}%{flag}")
+        if change_p50 > tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="videos to run, defaults to the bundled test clips")
+    parser.add_argument("--output", default=os.path.join(TESTS_DIR, "stage_benchmark_results.json"))
+    parser.add_argument("--baseline", default=os.path.join(TESTS_DIR, "stage_benchmark_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown against the baseline")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed frames at the start of every clip")
+    parser.add_argument("--no-model", action="store_true", help="only count the repetitions, no AttnLSTM")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob(os.path.join(TESTS_DIR, "*.mp4")))
+    model = None if args.no_model else load_model()
+
+    timer = StageTimer()
+    for video in videos:
+        print(f"running {os.path.basename(video)}")
+        run_clip(video, timer, model, args.warmup)
+
+    summary = timer.summary()
+    results = {
+        'videos': [os.path.basename(video) for video in videos],
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+                    'python': platform.python_version(), 'mediapipe': mp.__version__},
+        'stages': {stage: summary[stage] for stage in STAGES if stage in summary},
+    }
+
+    print(f"\n{'stage':18} {'frames':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'fps':>9}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:18} {stats['count']:7d} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+              f"{stats['p99_ms']:9.2f} {stats['fps']:9.1f}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(f"no baseline at {args.baseline}, record one with --save-baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
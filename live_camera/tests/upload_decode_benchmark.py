@@ -0,0 +1,160 @@
+"""
+Compares the old temp-file upload decoding against the in-memory decoder in utils/video_io.py.
+Reports latency, peak RSS and peak Python heap for every clip.
+
+Run from the live_camera folder:
+    python -m tests.upload_decode_benchmark [--repeats 10] [video.mp4 ...]
+"""
+import argparse
+import glob
+import io
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+
+from utils.video_io import iter_sampled_frames, sample_frame_indices
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SEQUENCE_LENGTH = 30
+
+
+def legacy_tempfile_decode(data, sequence_length=SEQUENCE_LENGTH):
+    """
+    Reproduces the original realtime_upload feature_extraction_data decoding (minus pose detection)
+
+    """
+    tfile = tempfile.NamedTemporaryFile(delete=False)
+    tfile.write(data)
+
+    video_stream = cv2.VideoCapture(tfile.name)
+    video_frames_count = int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = 0
+    for current_frame in sample_frame_indices(video_frames_count, sequence_length):
+        video_stream.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+        success, frame = video_stream.read()
+        if not success:
+            break
+        frames += 1
+
+    video_stream.release()
+    tfile.close()
+    # the original code leaks the file, clean up here so the benchmark does not fill the disk
+    os.unlink(tfile.name)
+    return frames
+
+
+def in_memory_decode(data, sequence_length=SEQUENCE_LENGTH):
+    return sum(1 for _ in iter_sampled_frames(data, sequence_length))
+
+
+METHODS = {
+    "tempfile+cv2": legacy_tempfile_decode,
+    "in-memory": in_memory_decode,
+}
+
+
+def make_long_clip(data, repeats):
+    """
+    Re-encodes a clip back to back `repeats` times into an in-memory mp4 to simulate a large upload
+
+    """
+    import av
+
+    out = io.BytesIO()
+    with av.open(out, mode="w", format="mp4") as container:
+        stream = None
+        for _ in range(repeats):
+            # decode the source again on every pass so the parent process never holds the raw frames
+            with av.open(io.BytesIO(data)) as source:
+                in_stream = source.streams.video[0]
+                for frame in source.decode(in_stream):
+                    if stream is None:
+                        stream = container.add_stream("mpeg4", rate=in_stream.average_rate or 30)
+                        stream.height, stream.width = frame.height, frame.width
+                        stream.pix_fmt = "yuv420p"
+                    # fresh frame without the source timestamps, they restart on every repeat
+                    out_frame = av.VideoFrame.from_ndarray(frame.to_ndarray(format="bgr24"), format="bgr24")
+                    for packet in stream.encode(out_frame):
+                        container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return out.getvalue()
+
+
+def _peak_rss_mb():
+    # VmHWM belongs to the current address space, ru_maxrss on Linux survives exec and reports the parent's peak
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measure(method_name, data, queue):
+    rss_before = _peak_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    frames = METHODS[method_name](data)
+    latency = time.perf_counter() - start
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    queue.put({
+        "frames": frames,
+        "latency_s": latency,
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": _peak_rss_mb() - rss_before,
+        "heap_peak_mb": heap_peak / (1024 * 1024),
+    })
+
+
+def measure(method_name, data):
+    """
+    Runs one decoding method in a fresh process so peak RSS is not polluted by the other method
+
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure, args=(method_name, data, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="videos to decode, defaults to the bundled test clips")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="re-encode every clip back to back this many times to simulate large uploads")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob(os.path.join(TESTS_DIR, "*.mp4")))
+
+    print(f"{'video':32} {'method':14} {'size MB':>8} {'frames':>6} {'latency s':>10} "
+          f"{'peak RSS MB':>12} {'RSS growth MB':>14} {'heap peak MB':>13}")
+    for video in videos:
+        with open(video, "rb") as f:
+            data = f.read()
+        if args.repeats > 1:
+            data = make_long_clip(data, args.repeats)
+
+        for method_name in METHODS:
+            result = measure(method_name, data)
+            print(f"{os.path.basename(video):32} {method_name:14} {len(data) / 1e6:8.1f} {result['frames']:6d} "
+                  f"{result['latency_s']:10.3f} {result['peak_rss_mb']:12.1f} {result['rss_growth_mb']:14.1f} "
+                  f"{result['heap_peak_mb']:13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from PIL import ImageTk, Image
 import customtkinter
 
 from performance_eval import analysis, create_model, VideoProcessor
+from utils.profiling import profiler_from_env
 
 def open_camera():
     global cap
@@ -25,6 +26,20 @@ def open_camera():
     # Reconfigure the grid to move imageFrame to the left
     imageFrame.grid(row=0, column=0, padx=10, pady=2, sticky='w')  # Stick to the left
 
+    # Side panel, created once here instead of on every frame
+    # Create a label for the text on the right edge
+    instructions = tk.Label(root_window, text="Instructions: \n Place your whole body in-frame and face forwards", font=('Helvetica', 16), wraplength=220)
+    instructions.grid(row=0, column=1, padx=0, pady=30, sticky='n')  # Adjust padding as needed
+
+    counter = tk.Label(root_window, text="Counter: 1", font=('Helvetica', 20))
+    counter.grid(row=0, column=1, padx=0, pady=150, sticky='n')  # Adjust padding as needed
+
+    feedback = tk.Label(root_window, text="Top 3 Errors: \n 1. Squat too shallow \n 2. Squat very shallow \n 3. What are you even doing", font=('Helvetica', 18), wraplength=240)
+    feedback.grid(row=0, column=1, padx=0, pady=240, sticky='n')  # Adjust padding as needed
+
+    end_button = customtkinter.CTkButton(root_window,text="End",command=show_popup)
+    end_button.grid(row=0, column=1, padx=20, pady=20, sticky='se')
+
     show_frame()  # Start displaying frames
 
 def show_popup():
@@ -32,6 +47,7 @@ def show_popup():
     if response == 'yes':
         if cap is not None:
             cap.release()  # Release the camera capture
+        profiler.close()
 
         # Display a summary messagebox
         summary_message = f"Summary\nDuration: 5:00\nCount: 3\nMost Common error: Shallow"
@@ -45,38 +61,34 @@ def show_popup():
 
 def show_frame():
     if cap is not None:
+        profiler.frame_start()
 
-        ret, frame = cap.read()
+        # capture, resize and display conversion write into the same arrays every frame
+        buffers = video_processor.buffers
+        ret, frame = buffers.read(cap)
         if not ret:
             print("frame empty after cap.read")
-        frame = cv2.flip(frame, 1)
-        frame = cv2.resize(frame, (int(0.8*root_window.winfo_screenwidth()), int(0.8*root_window.winfo_screenheight())))  # Resize the frame
+        frame = buffers.resize(frame, (int(0.8*root_window.winfo_screenwidth()), int(0.8*root_window.winfo_screenheight())))  # Resize the frame
+        frame = cv2.flip(frame, 1, dst=frame)  # mirrored in place
         frame = analysis(frame, AttnLSTM, video_processor)
         if frame is None:
             print("frame empty after analysis")
-        cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Tk needs RGB, the frame is drawn in BGR
+        cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffers.get("display", frame.shape))
         img = Image.fromarray(cv2image)
-        imgtk = ImageTk.PhotoImage(image=img)
 
-        # Update lmain with the new image
-        lmain.imgtk = imgtk
-        lmain.configure(image=imgtk)
+        # Update lmain with the new image, the PhotoImage is created once and its pixels replaced every frame
+        imgtk = getattr(lmain, 'imgtk', None)
+        if imgtk is None or (imgtk.width(), imgtk.height()) != img.size:
+            imgtk = ImageTk.PhotoImage(image=img)
+            lmain.imgtk = imgtk
+            lmain.configure(image=imgtk)
+        else:
+            imgtk.paste(img)
+        profiler.frame_end()
 
         # Schedule the next frame update
         lmain.after(5, show_frame)
-
-        # Create a label for the text on the right edge
-        instructions = tk.Label(root_window, text="Instructions: \n Place your whole body in-frame and face forwards", font=('Helvetica', 16), wraplength=220)
-        instructions.grid(row=0, column=1, padx=0, pady=30, sticky='n')  # Adjust padding as needed
-
-        counter = tk.Label(root_window, text="Counter: 1", font=('Helvetica', 20))
-        counter.grid(row=0, column=1, padx=0, pady=150, sticky='n')  # Adjust padding as needed
-
-        feedback = tk.Label(root_window, text="Top 3 Errors: \n 1. Squat too shallow \n 2. Squat very shallow \n 3. What are you even doing", font=('Helvetica', 18), wraplength=240)
-        feedback.grid(row=0, column=1, padx=0, pady=240, sticky='n')  # Adjust padding as needed
-
-        end_button = customtkinter.CTkButton(root_window,text="End",command=show_popup)
-        end_button.grid(row=0, column=1, padx=20, pady=20, sticky='se')
     else:
         print("Camera not open")
 
@@ -88,6 +100,8 @@ root_window.title('Fitness Vision')
 AttnLSTM = create_model()
 # Initialize Video Processor
 video_processor = VideoProcessor()
+# Opt-in profiling, FV_PROFILE=1 or FV_PROFILE_TRIGGER_MS=<ms>
+profiler = profiler_from_env("tkinter_gui")
 
 # Get the screen width and height
 screen_width = root_window.winfo_screenwidth()
@@ -131,6 +145,7 @@ def QueryWindow():
     if messagebox.showwarning("Warning","Data will not be saved"):
         if cap is not None:
             cap.release()  # Release the camera capture
+        profiler.close()
        
         root_window.destroy()
 
@@ -0,0 +1,119 @@
+"""
+Trains the first stage of the cascade classifier (utils/cascade.py) and reports accuracy against how often the
+AttnLSTM still runs, for a range of confidence thresholds, on a labeled set of clips.
+
+The clip folder is the one of tests/model_eval.py, one sub folder per class and one repetition per clip. Every
+clip is resampled to one window of the model sequence length, like a finished repetition in RepClassifier.
+Clips are split into training (first stage only) and validation; the model itself is not retrained.
+
+    python train_cascade.py path/to/clips [--variant meg_owndata] [--output models/cascade_meg_owndata.npz]
+
+Set CASCADE_CONFIDENCE in utils/constant.py from the table.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.cascade import LinearStage
+from utils.clip_dataset import find_clips, extract_clip_keypoints, split_clips, per_class_accuracy
+from utils.constant import CASCADE_MODEL_PATH, CASCADE_CONFIDENCE
+from utils.dtypes import feature_dtype
+from utils.model_registry import MODEL_VARIANTS, label_index
+from utils.resample import resample_window
+
+
+def rep_windows(clips, variant, cache_dir, workers):
+    """
+    Returns:
+        tuple: (windows (N, sequence_length, 33 * 4), targets in the model class order)
+    """
+    windows, targets = [], []
+    for path, label in clips:
+        timestamps, keypoints = extract_clip_keypoints(path, cache_dir, workers)
+        windows.append(resample_window(timestamps, keypoints.astype(feature_dtype, copy=False),
+                                       variant.sequence_length))
+        targets.append(label_index(variant, label))
+    return np.stack(windows), np.asarray(targets)
+
+
+def cascade_table(stage_probabilities, model_predictions, targets, thresholds):
+    """
+    Returns:
+        list: per threshold (threshold, model invocation rate, first stage accuracy on the repetitions it kept,
+            cascade accuracy)
+    """
+    stage_predictions = np.argmax(stage_probabilities, axis=1)
+    rows = []
+    for threshold in thresholds:
+        kept = stage_probabilities.max(axis=1) >= threshold
+        predictions = np.where(kept, stage_predictions, model_predictions)
+        kept_accuracy = float(np.mean(stage_predictions[kept] == targets[kept])) if kept.any() else float('nan')
+        rows.append((threshold, 1 - float(np.mean(kept)), kept_accuracy, float(np.mean(predictions == targets))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="folder with one sub folder of clips per class")
+    parser.add_argument("--variant", default="meg_owndata", choices=list(MODEL_VARIANTS),
+                        help="model behind the first stage")
+    parser.add_argument("--output", default=CASCADE_MODEL_PATH)
+    parser.add_argument("--cache-dir", default=os.path.join("tests", ".keypoint_cache"))
+    parser.add_argument("--workers", type=int, default=1, help="pose extraction processes per clip")
+    parser.add_argument("--val-fraction", type=float, default=0.3)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--thresholds", type=float, nargs="+",
+                        default=[0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    variant = MODEL_VARIANTS[args.variant]
+    if variant.features != 'full':
+        parser.error("the first stage reads extract_keypoints windows, pick a model with 'full' features")
+    clips = [(path, label) for path, label in find_clips(args.clips) if label_index(variant, label) is not None]
+    train_clips, val_clips = split_clips(clips, args.val_fraction, args.seed)
+    print(f"{len(train_clips)} training clips, {len(val_clips)} validation clips")
+
+    train_windows, train_targets = rep_windows(train_clips, variant, args.cache_dir, args.workers)
+    val_windows, val_targets = rep_windows(val_clips, variant, args.cache_dir, args.workers)
+
+    stage = LinearStage.fit(train_windows, train_targets, variant.class_labels, l2=args.l2)
+    stage.save(args.output)
+    print(f"saved {args.output}")
+    stage = LinearStage.load(args.output)
+
+    model = variant.load()
+    stage_probabilities = stage.predict(val_windows)
+    model_predictions = np.argmax(model.predict(val_windows, verbose=0), axis=1)
+
+    start = time.perf_counter()
+    for window in val_windows:
+        stage.predict(window[None])
+    stage_us = (time.perf_counter() - start) / len(val_windows) * 1e6
+    start = time.perf_counter()
+    for window in val_windows:
+        model.predict(window[None], verbose=0)
+    model_ms = (time.perf_counter() - start) / len(val_windows) * 1000
+
+    print(f"\n{len(val_targets)} validation repetitions: {args.variant} alone "
+          f"{np.mean(model_predictions == val_targets):.1%}, first stage alone "
+          f"{np.mean(np.argmax(stage_probabilities, axis=1) == val_targets):.1%}; "
+          f"first stage {stage_us:.0f} us, model {model_ms:.1f} ms per repetition\n")
+    print("| confidence | model runs on | first stage accuracy (kept) | cascade accuracy |")
+    print("|---|---|---|---|")
+    for threshold, rate, kept_accuracy, accuracy in cascade_table(stage_probabilities, model_predictions,
+                                                                  val_targets, args.thresholds):
+        marker = " (CASCADE_CONFIDENCE)" if threshold == CASCADE_CONFIDENCE else ""
+        print(f"| {threshold:.2f}{marker} | {rate:.0%} | {kept_accuracy:.1%} | {accuracy:.1%} |")
+
+    print("\nfirst stage accuracy per class")
+    for label, accuracy in per_class_accuracy(np.argmax(stage_probabilities, axis=1), val_targets,
+                                              variant.class_labels).items():
+        if accuracy is not None:
+            print(f"  {label}: {accuracy:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Trains the causal streaming classifier (utils/causal_model.py), exports it for camera_movement.py --streaming
+and compares it with the current AttnLSTM on the same held-out data.
+
+The clip folder is the one of tests/model_eval.py, one sub folder per class named like the classes of the
+reference model (utils/model_registry.py); classes the reference model does not have are skipped.
+Keypoints are extracted once per clip and cached in --cache-dir.
+
+Every clip is resampled onto MODEL_FPS and a window ends every --stride frames. The causal model gets the
+receptive field frames before that moment, the reference model its own sequence_length frames, so both are
+scored on the same moments of the same clips. Clips, not windows, are split into training and validation.
+
+Reports validation accuracy per class of both models, how far streaming one frame at a time is from the
+window predictions, and the time per frame of both models:
+    python train_causal_model.py path/to/clips [--reference meg_owndata] [--output models/causal_tcn.npz]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.causal_model import CausalClassifier, create_causal_model, export_causal_model
+from utils.clip_dataset import find_clips, clip_windows, split_clips, window_dataset, per_class_accuracy
+from utils.constant import CAUSAL_MODEL_PATH, CAUSAL_FILTERS
+from utils.model_registry import MODEL_VARIANTS, label_index
+
+
+def streaming_error(model, streams, stride):
+    """
+    Largest difference between stepping the frames through the model one at a time and predict() on the
+    window ending at the same frame
+    """
+    error = 0.0
+    for _, frames in streams:
+        model.reset()
+        stepped = [model.step(frame) for frame in frames]
+        window_predictions = model.predict(clip_windows(frames, [model.receptive_field], stride)[0])
+        ends = range(model.receptive_field - 1, len(frames), stride)
+        error = max(error, float(np.max(np.abs(np.stack([stepped[end] for end in ends]) - window_predictions))))
+    return error
+
+
+def time_per_frame(function, runs):
+    function()
+    start = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="folder with one sub folder of clips per class")
+    parser.add_argument("--reference", default="meg_owndata", choices=list(MODEL_VARIANTS),
+                        help="model to compare with, its classes are the classes of the causal model")
+    parser.add_argument("--output", default=CAUSAL_MODEL_PATH)
+    parser.add_argument("--cache-dir", default=os.path.join("tests", ".keypoint_cache"))
+    parser.add_argument("--workers", type=int, default=1, help="pose extraction processes per clip")
+    parser.add_argument("--stride", type=int, default=3, help="frames between the ends of two windows")
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--filters", type=int, default=CAUSAL_FILTERS)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from keras.callbacks import EarlyStopping
+    from keras.optimizers import Adam
+
+    reference = MODEL_VARIANTS[args.reference]
+    clips = [(path, label) for path, label in find_clips(args.clips) if label_index(reference, label) is not None]
+    skipped = sorted({label for _, label in find_clips(args.clips)} - {label for _, label in clips})
+    if skipped:
+        print(f"no {args.reference} class for {', '.join(skipped)}, skipped")
+    train_clips, val_clips = split_clips(clips, args.val_fraction, args.seed)
+    print(f"{len(train_clips)} training clips, {len(val_clips)} validation clips")
+
+    model = create_causal_model(33 * 4, len(reference.class_labels), filters=args.filters)
+    causal_length = model.input_shape[1]
+    lengths = [causal_length, reference.sequence_length]
+    (train_windows, _), train_targets, _ = window_dataset(train_clips, reference, lengths, args.stride,
+                                                         args.cache_dir, args.workers)
+    (val_windows, reference_windows), val_targets, val_streams = window_dataset(
+        val_clips, reference, lengths, args.stride, args.cache_dir, args.workers)
+
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    model.fit(train_windows, train_targets, validation_data=(val_windows, val_targets),
+              epochs=args.epochs, batch_size=args.batch_size, shuffle=True, verbose=2,
+              callbacks=[EarlyStopping(patience=10, restore_best_weights=True)])
+    export_causal_model(model, args.output, reference.class_labels)
+    print(f"exported {args.output}")
+
+    # the exported model is the one that is scored, so the export is checked too
+    causal = CausalClassifier.load(args.output)
+    causal_predictions = np.argmax(causal.predict(val_windows), axis=1)
+    reference_model = reference.load()
+    reference_windows = reference.select_features(reference_windows)
+    reference_predictions = np.argmax(reference_model.predict(reference_windows, verbose=0), axis=1)
+
+    frame = val_windows[0, -1]
+    window = reference_windows[:1]
+    causal_ms = time_per_frame(lambda: causal.step(frame), 1000)
+    reference_ms = time_per_frame(lambda: reference_model.predict(window, verbose=0), 50)
+
+    causal_accuracy = per_class_accuracy(causal_predictions, val_targets, reference.class_labels)
+    reference_accuracy = per_class_accuracy(reference_predictions, val_targets, reference.class_labels)
+    print(f"\n| class | {args.reference} | causal |")
+    print("|---|---|---|")
+    for label in reference.class_labels:
+        if causal_accuracy[label] is not None:
+            print(f"| {label} | {reference_accuracy[label]:.1%} | {causal_accuracy[label]:.1%} |")
+    print(f"| **all ({len(val_targets)} windows)** | {np.mean(reference_predictions == val_targets):.1%} "
+          f"| {np.mean(causal_predictions == val_targets):.1%} |")
+    print(f"| ms per frame | {reference_ms:.2f} (whole window) | {causal_ms:.3f} (one step) |")
+    print(f"\nstreaming vs. window predictions, largest difference: {streaming_error(causal, val_streams, args.stride):.2e}")
+
+
+if __name__ == "__main__":
+    main()
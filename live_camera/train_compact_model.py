@@ -0,0 +1,114 @@
+"""
+Trains the compact classifier on engineered features (utils/pose_features.py) and compares it with the model
+whose classes it takes over, on the same held-out data.
+
+Per frame the compact model gets joint angles, trunk lean, positions relative to the hip centre and velocities
+instead of the 132 raw landmark values, over a shorter window (COMPACT_SEQUENCE_LENGTH frames at COMPACT_FPS).
+It is saved as models/<variant> like the other models and registered in utils/model_registry.py, so
+tests/model_eval.py picks it up.
+
+The clip folder is the one of tests/model_eval.py, one sub folder per class. Every clip is resampled onto
+MODEL_FPS and a window ends every --stride frames; both models get their own window ending at the same frame.
+Clips, not windows, are split into training and validation.
+
+Reports validation accuracy per class, input values and FLOPs per window and time per window of both models:
+    python train_compact_model.py path/to/clips [--variant compact_meg_owndata] [--reference meg_owndata]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.clip_dataset import find_clips, split_clips, window_dataset, per_class_accuracy
+from utils.constant import MODEL_FPS
+from utils.model_registry import MODEL_VARIANTS, label_index, count_flops
+from utils.pose_features import create_compact_model
+
+
+def time_per_window(model, window, runs=50):
+    model.predict(window, verbose=0)
+    start = time.perf_counter()
+    for _ in range(runs):
+        model.predict(window, verbose=0)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    compact_variants = [name for name, variant in MODEL_VARIANTS.items() if variant.features == 'compact']
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="folder with one sub folder of clips per class")
+    parser.add_argument("--variant", default=compact_variants[0], choices=compact_variants,
+                        help="registered compact model to train, saved to models/<variant>")
+    parser.add_argument("--reference", default="meg_owndata", choices=list(MODEL_VARIANTS),
+                        help="model to compare with, must have the same classes")
+    parser.add_argument("--cache-dir", default=os.path.join("tests", ".keypoint_cache"))
+    parser.add_argument("--workers", type=int, default=1, help="pose extraction processes per clip")
+    parser.add_argument("--stride", type=int, default=3, help="frames between the ends of two windows")
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--filters", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from keras.callbacks import EarlyStopping
+    from keras.optimizers import Adam
+
+    variant, reference = MODEL_VARIANTS[args.variant], MODEL_VARIANTS[args.reference]
+    if variant.class_labels != reference.class_labels:
+        parser.error(f"{args.variant} and {args.reference} have different classes")
+
+    clips = [(path, label) for path, label in find_clips(args.clips) if label_index(variant, label) is not None]
+    train_clips, val_clips = split_clips(clips, args.val_fraction, args.seed)
+    print(f"{len(train_clips)} training clips, {len(val_clips)} validation clips")
+
+    # the compact window takes every MODEL_FPS / model_fps th frame of the grid
+    lengths = [variant.sequence_length, reference.sequence_length]
+    steps = [int(round(MODEL_FPS / variant.model_fps)), int(round(MODEL_FPS / reference.model_fps))]
+    (train_windows, _), train_targets, _ = window_dataset(train_clips, variant, lengths, args.stride,
+                                                         args.cache_dir, args.workers, steps)
+    (val_windows, reference_windows), val_targets, _ = window_dataset(val_clips, variant, lengths, args.stride,
+                                                                      args.cache_dir, args.workers, steps)
+    train_features = variant.select_features(train_windows)
+    val_features = variant.select_features(val_windows)
+
+    model = create_compact_model(len(variant.class_labels), variant.sequence_length, filters=args.filters)
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    model.fit(train_features, train_targets, validation_data=(val_features, val_targets),
+              epochs=args.epochs, batch_size=args.batch_size, shuffle=True, verbose=2,
+              callbacks=[EarlyStopping(patience=20, restore_best_weights=True)])
+    model.save(variant.folder)
+    print(f"saved {variant.folder}")
+
+    # the saved model is the one that is scored
+    compact = variant.load()
+    reference_model = reference.load()
+    reference_windows = reference.select_features(reference_windows)
+    compact_predictions = np.argmax(compact.predict(val_features, verbose=0), axis=1)
+    reference_predictions = np.argmax(reference_model.predict(reference_windows, verbose=0), axis=1)
+
+    compact_accuracy = per_class_accuracy(compact_predictions, val_targets, variant.class_labels)
+    reference_accuracy = per_class_accuracy(reference_predictions, val_targets, variant.class_labels)
+    print(f"\n| | {args.reference} | {args.variant} |")
+    print("|---|---|---|")
+    for label in variant.class_labels:
+        if compact_accuracy[label] is not None:
+            print(f"| {label} | {reference_accuracy[label]:.1%} | {compact_accuracy[label]:.1%} |")
+    print(f"| **all ({len(val_targets)} windows)** | {np.mean(reference_predictions == val_targets):.1%} "
+          f"| {np.mean(compact_predictions == val_targets):.1%} |")
+    print(f"| input values per window | {np.prod(reference_windows.shape[1:])} | {np.prod(val_features.shape[1:])} |")
+    print(f"| MFLOPs per window | {count_flops(reference_model) / 1e6:.2f} | {count_flops(compact) / 1e6:.2f} |")
+    print(f"| parameters | {reference_model.count_params()} | {compact.count_params()} |")
+    start = time.perf_counter()
+    for _ in range(50):
+        variant.select_features(val_windows[:1])
+    features_ms = (time.perf_counter() - start) / 50 * 1000
+    print(f"| ms per window | {time_per_window(reference_model, reference_windows[:1]):.2f} "
+          f"| {time_per_window(compact, val_features[:1]):.2f} + {features_ms:.2f} features |")
+
+
+if __name__ == "__main__":
+    main()
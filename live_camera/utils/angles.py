@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 
@@ -54,20 +56,42 @@ def calculate_angle_3d_2(a, b, c):
 
 
 def calculate_angle_3d(a, b, c):
-    vector_ab = np.array(a) - np.array(b)
-    vector_bc = np.array(c) - np.array(b)
+    # plain float math on the coordinate tuples, no numpy array is built per call
+    vector_ab = [a_i - b_i for a_i, b_i in zip(a, b)]
+    vector_bc = [c_i - b_i for c_i, b_i in zip(c, b)]
 
-    dot_product = np.dot(vector_ab, vector_bc)
-    magnitude_ab = np.linalg.norm(vector_ab)
-    magnitude_bc = np.linalg.norm(vector_bc)
+    dot_product = sum(ab_i * bc_i for ab_i, bc_i in zip(vector_ab, vector_bc))
+    magnitude_ab = math.hypot(*vector_ab)
+    magnitude_bc = math.hypot(*vector_bc)
 
+    if magnitude_ab == 0 or magnitude_bc == 0:
+        return math.nan
     cos_theta = dot_product / (magnitude_ab * magnitude_bc)
-    angle_radians = np.arccos(np.clip(cos_theta, -1.0, 1.0))
-    angle_degrees = np.degrees(angle_radians)
+    angle_radians = math.acos(min(max(cos_theta, -1.0), 1.0))
+    angle_degrees = math.degrees(angle_radians)
 
     return angle_degrees
 
 
+def joint_angles(a, b, c):
+    """
+    calculate_angle_3d over arrays of points, e.g. one joint over all frames of a window
+
+    Args:
+        a, b, c (numpy array): first, mid and end points, shape (..., dimensions)
+
+    Returns:
+        numpy array: angles at b in degrees, shape (...), NaN where a segment has no length (like
+            calculate_angle_3d, so no rule holds on such a frame)
+    """
+    vector_ab = a - b
+    vector_bc = c - b
+    magnitudes = np.linalg.norm(vector_ab, axis=-1) * np.linalg.norm(vector_bc, axis=-1)
+    dot_product = np.sum(vector_ab * vector_bc, axis=-1)
+    cos_theta = np.divide(dot_product, magnitudes, out=np.full_like(dot_product, np.nan), where=magnitudes > 0)
+    return np.degrees(np.arccos(np.clip(cos_theta, -1.0, 1.0)))
+
+
 def calculate_knee_angles(results, mp_pose):
     left_hip = (results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_HIP].x,
                 results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_HIP].y)
@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from utils.constant import SERVER_BATCH_SIZE, SERVER_BATCH_WAIT, SERVER_MAX_PENDING
+from utils.dtypes import check_array
+
+
+class BatchedClassifier:
+    """
+    Owns the classification model for many streams. Windows submitted from any thread are
+    collected into batches of up to max_batch (waiting at most max_wait seconds for the batch to fill)
+    and classified with one predict call on a single model thread.
+
+    At most max_pending windows wait, a window submitted to a full queue is dropped. A failing predict or
+    callback is printed, the model thread goes on with the next batch.
+
+    """
+    def __init__(self, model, max_batch=SERVER_BATCH_SIZE, max_wait=SERVER_BATCH_WAIT, max_pending=SERVER_MAX_PENDING):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.stopped = threading.Event()
+
+        self.batches = 0
+        self.windows = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._run, name="batched-classifier", daemon=True)
+        self.thread.start()
+
+    def submit(self, window, callback):
+        """
+        Queues one (sequence_length, features) window, callback(prediction) is called from the model thread
+
+        Returns:
+            bool: False when the queue was full and the window was dropped
+        """
+        try:
+            self.queue.put_nowait((check_array(window, self.model.input_shape[1:], name="window"), callback))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self.stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            try:
+                predictions = self.model.predict(np.stack([window for window, _ in batch]), verbose=0)
+            except Exception:
+                self.errors += 1
+                print(f"[classifier] predict of a batch of {len(batch)} windows failed:")
+                traceback.print_exc()
+                continue
+            self.batches += 1
+            self.windows += len(batch)
+            for (_, callback), prediction in zip(batch, predictions):
+                try:
+                    callback(prediction)
+                except Exception:
+                    self.errors += 1
+                    print("[classifier] prediction callback failed:")
+                    traceback.print_exc()
+
+    def stats_text(self):
+        mean_batch = self.windows / self.batches if self.batches else 0.0
+        text = f"{self.windows} windows in {self.batches} predict calls (mean batch {mean_batch:.1f})"
+        if self.dropped or self.errors:
+            text += f", {self.dropped} dropped, {self.errors} errors"
+        return text
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
@@ -0,0 +1,125 @@
+import numpy as np
+
+from utils.constant import CASCADE_CONFIDENCE, CASCADE_DEPTH_RULE, KNEE_ANGLE_DEPTH
+from utils.dtypes import feature_dtype, check_array
+from utils.model_registry import normalize_label
+from utils.pose_features import rep_summary_features
+
+# columns of the two knee angles in the summary minimums (compact_features starts with them, scaled by 180)
+_KNEE_MIN_COLUMNS = slice(None, 2)
+
+
+def _softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class LinearStage:
+    """
+    Cascade first stage: multinomial logistic regression on rep_summary_features, a fraction of a millisecond
+    per repetition, plus the depth rule of process_shallow for models that have a shallow class.
+
+    Args:
+        weights (numpy array): (NUM_SUMMARY_FEATURES, classes)
+        bias (numpy array): (classes,)
+        mean, scale (numpy array): feature standardisation of the training set
+        class_labels (list): class names, in the output order of the model the stage sits in front of
+        depth_rule (bool): repetitions that never go below KNEE_ANGLE_DEPTH are shallow with certainty
+    """
+    def __init__(self, weights, bias, mean, scale, class_labels, depth_rule=CASCADE_DEPTH_RULE):
+        self.weights = np.asarray(weights, dtype=feature_dtype)
+        self.bias = np.asarray(bias, dtype=feature_dtype)
+        self.mean = np.asarray(mean, dtype=feature_dtype)
+        self.scale = np.asarray(scale, dtype=feature_dtype)
+        self.class_labels = list(class_labels)
+        labels = [normalize_label(label) for label in self.class_labels]
+        self.shallow_index = labels.index('bad shallow') if depth_rule and 'bad shallow' in labels else None
+
+    @classmethod
+    def fit(cls, windows, targets, class_labels, l2=1e-3, steps=2000, learning_rate=0.5, depth_rule=CASCADE_DEPTH_RULE):
+        """
+        Trains the logistic regression by full batch gradient descent
+
+        Args:
+            windows (numpy array): (N, frames, 33 * 4) repetition windows
+            targets (numpy array): class index of every window
+        """
+        features = rep_summary_features(windows).astype(np.float64)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        x = (features - mean) / scale
+        one_hot = np.eye(len(class_labels))[targets]
+
+        weights = np.zeros((x.shape[1], len(class_labels)))
+        bias = np.zeros(len(class_labels))
+        for _ in range(steps):
+            error = (_softmax(x @ weights + bias) - one_hot) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        return cls(weights, bias, mean, scale, class_labels, depth_rule)
+
+    @classmethod
+    def load(cls, path, depth_rule=CASCADE_DEPTH_RULE):
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], data['mean'], data['scale'],
+                       [str(label) for label in data['class_labels']], depth_rule)
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale,
+                 class_labels=np.asarray(self.class_labels))
+
+    def predict(self, windows):
+        """
+        Returns:
+            numpy array: (N, classes) class probabilities
+        """
+        features = rep_summary_features(windows)
+        probabilities = _softmax(((features - self.mean) / self.scale) @ self.weights + self.bias)
+        if self.shallow_index is not None:
+            num_pose = features.shape[1] // 3
+            deepest = features[:, num_pose:2 * num_pose][:, _KNEE_MIN_COLUMNS].min(axis=1) * 180
+            shallow = deepest > KNEE_ANGLE_DEPTH
+            probabilities[shallow] = np.eye(len(self.class_labels))[self.shallow_index]
+        return probabilities
+
+
+class CascadeClassifier:
+    """
+    Two stage repetition classifier that stands in for the AttnLSTM wherever a Keras model is used
+    (RepClassifier, classify_reps, BatchedClassifier): the linear first stage classifies every window, the
+    model only gets the windows whose first stage probability stays below confidence.
+
+    Args:
+        model: the AttnLSTM classification model
+        stage (LinearStage): first stage with the class order of the model
+        confidence (float): first stage probability that is accepted without the model
+    """
+    def __init__(self, model, stage, confidence=CASCADE_CONFIDENCE):
+        self.model = model
+        self.stage = stage
+        self.confidence = confidence
+        self.input_shape = model.input_shape
+
+        self.windows = 0
+        self.model_windows = 0
+
+    def predict(self, windows, verbose=0):
+        check_array(windows, (None,) + tuple(self.input_shape[1:]), name="windows")
+        probabilities = self.stage.predict(windows)
+        unsure = np.flatnonzero(probabilities.max(axis=1) < self.confidence)
+        if len(unsure):
+            probabilities[unsure] = self.model.predict(windows[unsure], verbose=verbose)
+
+        self.windows += len(windows)
+        self.model_windows += len(unsure)
+        return probabilities
+
+    def invocation_rate(self):
+        """
+        Share of the windows that went to the model
+        """
+        return self.model_windows / self.windows if self.windows else 0.0
+
+    def stats_text(self):
+        return f"model ran on {self.model_windows} of {self.windows} repetitions ({self.invocation_rate():.0%})"
@@ -0,0 +1,200 @@
+import numpy as np
+
+from utils.constant import (MODEL_FPS, CAUSAL_FILTERS, CAUSAL_KERNEL_SIZE, CAUSAL_DILATIONS, STREAM_MAX_GAP)
+from utils.dtypes import feature_dtype, check_array
+from utils.resample import StreamResampler
+
+
+def receptive_field(kernel_size=CAUSAL_KERNEL_SIZE, dilations=CAUSAL_DILATIONS):
+    """
+    Frames the last output of the causal conv stack depends on
+
+    """
+    return 1 + (kernel_size - 1) * sum(dilations)
+
+
+def create_causal_model(num_features, num_classes, filters=CAUSAL_FILTERS, kernel_size=CAUSAL_KERNEL_SIZE,
+                        dilations=CAUSAL_DILATIONS, dropout=0.3):
+    """
+    Keras temporal conv classifier that only looks back in time, the streaming counterpart of the AttnLSTM.
+
+    Stacked causal Conv1D layers with growing dilation (residual once the channel count matches) and a softmax
+    on the last time step. The window is exactly the receptive field, so the output the streaming model
+    computes every frame (CausalClassifier.step) is the one the model is trained on.
+
+    Args:
+        num_features (int): features per frame, 33 * 4 for extract_keypoints
+        num_classes (int): model outputs
+        filters (int): channels of every conv layer
+        kernel_size (int): taps of every conv layer
+        dilations (tuple): dilation of every conv layer
+        dropout (float): dropout after every conv layer while training
+
+    Returns:
+        keras Model with input shape (None, receptive field, num_features)
+    """
+    from keras.layers import Input, Conv1D, Dropout, Add, Cropping1D, Flatten, Dense
+    from keras.models import Model
+
+    sequence_length = receptive_field(kernel_size, dilations)
+    inputs = Input(shape=(sequence_length, num_features))
+    x = inputs
+    for i, dilation in enumerate(dilations):
+        y = Conv1D(filters, kernel_size, padding='causal', dilation_rate=dilation, activation='relu',
+                   name=f'causal_conv_{i}')(x)
+        y = Dropout(dropout)(y)
+        x = Add()([x, y]) if i > 0 else y
+
+    # only the last time step has seen the whole window
+    x = Flatten()(Cropping1D((sequence_length - 1, 0))(x))
+    outputs = Dense(num_classes, activation='softmax', name='causal_output')(x)
+    return Model(inputs=[inputs], outputs=outputs)
+
+
+def export_causal_model(model, path, class_labels, model_fps=MODEL_FPS):
+    """
+    Saves the weights of a trained create_causal_model() model as .npz for CausalClassifier, no Keras needed
+    to run it
+
+    """
+    arrays = {}
+    for i, layer in enumerate(layer for layer in model.layers if layer.name.startswith('causal_conv_')):
+        kernel, bias = layer.get_weights()
+        arrays[f'kernel_{i}'] = kernel.astype(feature_dtype)
+        arrays[f'bias_{i}'] = bias.astype(feature_dtype)
+        arrays[f'dilation_{i}'] = np.int64(layer.dilation_rate[0])
+    output_kernel, output_bias = model.get_layer('causal_output').get_weights()
+    np.savez(path, output_kernel=output_kernel.astype(feature_dtype), output_bias=output_bias.astype(feature_dtype),
+             class_labels=np.asarray(class_labels), model_fps=np.float64(model_fps), **arrays)
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class CausalClassifier:
+    """
+    NumPy runtime of an exported causal conv classifier (export_causal_model).
+
+    step() takes one frame at MODEL_FPS and updates the model in constant time: every conv layer keeps its last
+    (kernel size - 1) * dilation + 1 inputs in a ring buffer and computes only the newest output, one
+    matrix-vector product per layer. The history starts as zeros, the same as the causal padding in Keras,
+    so once receptive_field frames have gone in every step equals predict() on the window of those frames.
+
+    update() takes camera frames at any rate and resamples them onto MODEL_FPS first (StreamResampler).
+    predict() runs whole windows like a Keras model, so the classifier also works where an AttnLSTM does.
+
+    Args:
+        kernels (list): conv kernels, (kernel size, input channels, output channels)
+        biases (list): conv biases
+        dilations (list): dilation of every conv layer
+        output_kernel, output_bias: softmax layer
+        class_labels (list): class names in output order
+        model_fps (float): frame rate of the model input
+        max_gap (float): seconds without frames after which the state starts over
+    """
+    def __init__(self, kernels, biases, dilations, output_kernel, output_bias, class_labels,
+                 model_fps=MODEL_FPS, max_gap=STREAM_MAX_GAP):
+        self.kernels = [np.asarray(kernel, dtype=feature_dtype) for kernel in kernels]
+        self.biases = [np.asarray(bias, dtype=feature_dtype) for bias in biases]
+        self.dilations = [int(dilation) for dilation in dilations]
+        self.output_kernel = np.asarray(output_kernel, dtype=feature_dtype)
+        self.output_bias = np.asarray(output_bias, dtype=feature_dtype)
+        self.class_labels = list(class_labels)
+
+        kernel_size, num_features = self.kernels[0].shape[:2]
+        self.receptive_field = receptive_field(kernel_size, self.dilations)
+        self.input_shape = (None, self.receptive_field, num_features)
+        # all taps of a layer in one matrix-vector product
+        self.flat_kernels = [kernel.reshape(-1, kernel.shape[2]) for kernel in self.kernels]
+        self.spans = [(kernel.shape[0] - 1) * dilation + 1 for kernel, dilation in zip(self.kernels, self.dilations)]
+        self.lags = [np.arange(kernel.shape[0] - 1, -1, -1) * dilation
+                     for kernel, dilation in zip(self.kernels, self.dilations)]
+
+        self.resampler = StreamResampler(model_fps, max_gap)
+        self.reset()
+
+    @classmethod
+    def load(cls, path, max_gap=STREAM_MAX_GAP):
+        with np.load(path) as data:
+            num_layers = sum(1 for key in data.files if key.startswith('kernel_'))
+            return cls([data[f'kernel_{i}'] for i in range(num_layers)],
+                       [data[f'bias_{i}'] for i in range(num_layers)],
+                       [data[f'dilation_{i}'] for i in range(num_layers)],
+                       data['output_kernel'], data['output_bias'], [str(label) for label in data['class_labels']],
+                       model_fps=float(data['model_fps']), max_gap=max_gap)
+
+    def reset(self):
+        """
+        Forgets the stream, e.g. when the person leaves the frame
+        """
+        self.resampler.reset()
+        self.reset_state()
+
+    def reset_state(self):
+        self.history = [np.zeros((span, kernel.shape[1]), dtype=feature_dtype)
+                        for span, kernel in zip(self.spans, self.kernels)]
+        self.frames_seen = 0
+        self.last_prediction = None
+
+    def step(self, frame):
+        """
+        Args:
+            frame (numpy array): FEATURE_DTYPE features of one frame at the model frame rate
+
+        Returns:
+            numpy array: class probabilities, None until receptive_field frames have gone in
+        """
+        check_array(frame, self.input_shape[2:], name="frame")
+        x = frame
+        for i, (history, span, lags) in enumerate(zip(self.history, self.spans, self.lags)):
+            history[self.frames_seen % span] = x
+            taps = history[(self.frames_seen - lags) % span]
+            y = np.maximum(taps.reshape(-1) @ self.flat_kernels[i] + self.biases[i], 0)
+            x = x + y if i > 0 else y
+        self.frames_seen += 1
+
+        if self.frames_seen >= self.receptive_field:
+            self.last_prediction = softmax(x @ self.output_kernel + self.output_bias)
+        return self.last_prediction
+
+    def update(self, timestamp, keypoints):
+        """
+        Feeds one camera frame
+
+        Args:
+            timestamp (float): capture time in seconds
+            keypoints (numpy array): FEATURE_DTYPE features of the frame
+
+        Returns:
+            numpy array: class probabilities after the frame, None until the model has seen a whole window
+        """
+        restarted, frames = self.resampler.push(timestamp, keypoints)
+        if restarted:
+            self.reset_state()
+        for frame in frames:
+            self.step(frame)
+        return self.last_prediction
+
+    def predict(self, windows, verbose=0):
+        """
+        Class probabilities of whole windows, like keras Model.predict
+
+        Args:
+            windows (numpy array): (N, receptive_field, features) FEATURE_DTYPE
+
+        Returns:
+            numpy array: (N, classes)
+        """
+        check_array(windows, (None,) + self.input_shape[1:], name="windows")
+        x = windows
+        length = windows.shape[1]
+        for i, (kernel, dilation) in enumerate(zip(self.kernels, self.dilations)):
+            pad = (kernel.shape[0] - 1) * dilation
+            padded = np.concatenate([np.zeros((len(x), pad, x.shape[2]), dtype=x.dtype), x], axis=1)
+            y = self.biases[i] + sum(padded[:, j * dilation:j * dilation + length] @ kernel[j]
+                                     for j in range(kernel.shape[0]))
+            y = np.maximum(y, 0)
+            x = x + y if i > 0 else y
+        return softmax(x[:, -1] @ self.output_kernel + self.output_bias)
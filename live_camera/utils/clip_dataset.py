@@ -0,0 +1,149 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from utils.constant import MODEL_FPS
+from utils.dtypes import feature_dtype
+from utils.model_registry import label_index
+from utils.resample import resample_to_grid
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.webm')
+
+
+def find_clips(folder):
+    """
+    Returns:
+        list: (clip path, class folder name), sorted
+    """
+    clips = []
+    for label in sorted(os.listdir(folder)):
+        label_dir = os.path.join(folder, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for path in sorted(glob.glob(os.path.join(label_dir, "*"))):
+            if path.lower().endswith(VIDEO_EXTENSIONS):
+                clips.append((path, label))
+    return clips
+
+
+def extract_clip_keypoints(path, cache_dir, workers=1):
+    """
+    Full extract_keypoints rows and timestamps of every frame, cached by clip content.
+    With several workers the clip is split into ranges that run on worker processes (utils/parallel_pose.py).
+
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    cache_path = os.path.join(cache_dir, hashlib.sha256(data).hexdigest() + ".npz")
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        return cached['timestamps'], cached['keypoints']
+
+    if workers > 1:
+        from utils.parallel_pose import extract_video_landmarks
+        timestamps, landmarks = extract_video_landmarks(data, workers=workers)
+        # same rows as extract_keypoints, zeros for frames without a person
+        keypoints = np.nan_to_num(landmarks, nan=0.0).reshape(len(landmarks), 33 * 4)
+    else:
+        import mediapipe as mp_solutions
+        from utils.mediapipe_helper import extract_keypoints
+        from utils.video_io import iter_timed_frames
+
+        timestamps, keypoints = [], []
+        with mp_solutions.solutions.pose.Pose() as pose:
+            for _, timestamp, frame in iter_timed_frames(data, format="rgb24"):
+                results = pose.process(frame)
+                timestamps.append(timestamp)
+                keypoints.append(extract_keypoints(results))
+
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    keypoints = np.asarray(keypoints, dtype='float32')
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez_compressed(cache_path, timestamps=timestamps, keypoints=keypoints)
+    return timestamps, keypoints
+
+
+def clip_frames(timestamps, keypoints, model_fps=MODEL_FPS):
+    """
+    Keypoints of a whole clip on the model frame rate grid, like the live window and the streaming model see them
+
+    """
+    grid = np.arange(timestamps[0], timestamps[-1] + 1e-9, 1.0 / model_fps)
+    return resample_to_grid(timestamps, keypoints.astype(feature_dtype, copy=False), grid)
+
+
+def clip_windows(frames, lengths, stride, steps=None):
+    """
+    Windows over the frames of one clip, a window of every length ends every stride frames
+
+    Args:
+        frames (numpy array): (T, features) on the model frame rate grid (clip_frames)
+        lengths (list): frames per window, one entry per model
+        stride (int): frames between the ends of two windows
+        steps (list): frames between two window frames for every length, 1 by default; 2 takes every
+            other frame, for a model at half the frame rate
+
+    Returns:
+        list: (N, length, features) windows for every length, all ending on the same frames
+    """
+    steps = steps or [1] * len(lengths)
+    spans = [(length - 1) * step + 1 for length, step in zip(lengths, steps)]
+    ends = range(max(spans) - 1, len(frames), stride)
+    return [np.stack([frames[end - span + 1:end + 1:step] for end in ends]).reshape(-1, length, frames.shape[1])
+            for length, step, span in zip(lengths, steps, spans)]
+
+
+def split_clips(clips, val_fraction, seed):
+    """
+    Per class, val_fraction of the clips (at least one when the class has two) go to validation
+
+    Returns:
+        tuple: (training clips, validation clips)
+    """
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    for label in sorted({label for _, label in clips}):
+        class_clips = [clip for clip in clips if clip[1] == label]
+        rng.shuffle(class_clips)
+        num_val = max(int(round(val_fraction * len(class_clips))), 1 if len(class_clips) > 1 else 0)
+        val.extend(class_clips[:num_val])
+        train.extend(class_clips[num_val:])
+    return train, val
+
+
+def window_dataset(clips, variant, lengths, stride, cache_dir, workers=1, steps=None):
+    """
+    Windows of every clip (clip_windows) with the class of the clip as the target
+
+    Args:
+        clips (list): (clip path, class folder name), only classes of variant
+        variant (ModelVariant): model whose output order the targets follow
+
+    Returns:
+        tuple: (windows per length, targets, (class, frames) of every clip for streaming)
+    """
+    windows = [[] for _ in lengths]
+    targets, streams = [], []
+    spans = [(length - 1) * step + 1 for length, step in zip(lengths, steps or [1] * len(lengths))]
+    for path, label in clips:
+        timestamps, keypoints = extract_clip_keypoints(path, cache_dir, workers)
+        frames = clip_frames(timestamps, keypoints)
+        if len(frames) < max(spans):
+            print(f"skipped {path}: shorter than one window")
+            continue
+        for arrays, clip in zip(windows, clip_windows(frames, lengths, stride, steps)):
+            arrays.append(clip)
+        targets.extend([label_index(variant, label)] * len(windows[0][-1]))
+        streams.append((label, frames))
+    return [np.concatenate(arrays) for arrays in windows], np.asarray(targets), streams
+
+
+def per_class_accuracy(predictions, targets, class_labels):
+    """
+    Returns:
+        dict: class name -> share of its windows predicted right, None without windows of the class
+    """
+    return {label: float(np.mean(predictions[targets == i] == i)) if np.any(targets == i) else None
+            for i, label in enumerate(class_labels)}
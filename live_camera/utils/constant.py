@@ -1,7 +1,179 @@
 NUM_FRAMES_SHOULDER = 25
 NUM_FRAMES_KNEE = 15
+# shorter moving averages used when the landmarks are already smoothed by utils/smoothing.py
+SMOOTHED_NUM_FRAMES_SHOULDER = 8
+SMOOTHED_NUM_FRAMES_KNEE = 5
 KNEE_ANGLE_DEPTH = 120
 
 ############# TIME CONSTANTS ####################
 ERROR_DISPLAY_TIME = 1.5
 MOVEMENT_THR = 0.001
+# frame rate the classifiers were trained at, live windows are resampled to it
+MODEL_FPS = 30
+
+############# UPLOAD CONSTANTS ####################
+PREDICTION_CACHE_SIZE = 128
+# longest repetition kept in memory by the multi-rep analysis (frames)
+MAX_REP_FRAMES = 300
+# repetitions classified together in one predict call
+REP_BATCH_SIZE = 16
+# sampled upload frames further apart than this (seconds) are reached by seeking instead of decoding through
+UPLOAD_SEEK_GAP = 2.0
+
+############# MULTI PERSON CONSTANTS ####################
+MAX_PEOPLE = 6
+# frames between two runs of the person detector, pose landmarks keep the boxes updated in between
+DETECT_EVERY_N_FRAMES = 15
+TRACK_IOU_THR = 0.3
+# frames a track may go without landmarks before it is dropped
+TRACK_MAX_MISSED = 30
+
+############# SERVER CONSTANTS ####################
+# classifier windows batched into one predict call
+SERVER_BATCH_SIZE = 8
+# longest a window waits for others to fill the batch (seconds)
+SERVER_BATCH_WAIT = 0.02
+# windows waiting for the model at most, newer ones are dropped while the model can not keep up
+SERVER_MAX_PENDING = 64
+# frames between two sliding window classifications of a stream
+SERVER_WINDOW_STRIDE = 5
+# seconds between two per-stream stats reports
+STATS_INTERVAL = 5.0
+
+############# SMOOTHING CONSTANTS ####################
+# landmark filter of the live counter: 'kalman', 'one_euro' or 'none' (see tests/smoothing_benchmark.py)
+LANDMARK_FILTER = 'kalman'
+# One Euro filter, cutoffs in Hz, beta scales the cutoff with the speed (normalized image units / s)
+ONE_EURO_MIN_CUTOFF = 3.0
+ONE_EURO_BETA = 10.0
+ONE_EURO_D_CUTOFF = 1.0
+# constant velocity Kalman filter, acceleration noise density and landmark measurement variance
+KALMAN_PROCESS_NOISE = 0.3
+KALMAN_MEASUREMENT_NOISE = 1e-4
+# seconds without a detection after which a filter starts over
+SMOOTHING_MAX_GAP = 0.5
+
+############# METRICS CONSTANTS ####################
+# timing spans around the live loop stages, off by default
+METRICS_ENABLED = False
+# fps, dropped frames and stage ms drawn on the frame (needs METRICS_ENABLED)
+SHOW_HUD = False
+# export targets, None to disable: a local file (*.json or Prometheus text), a POST url, a local /metrics port
+METRICS_FILE = None
+METRICS_URL = None
+METRICS_PORT = None
+# seconds between two exports
+METRICS_INTERVAL = 10.0
+# upper bounds of the stage latency histogram buckets (ms)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+############# PROFILING CONSTANTS ####################
+# length of one profile, frames and / or seconds (None for no limit)
+PROFILE_FRAMES = 300
+PROFILE_SECONDS = None
+PROFILE_DIR = 'profiles'
+# seconds between two stack samples of the flame graph sampler
+PROFILE_SAMPLE_INTERVAL = 0.005
+# seconds after a profile before a slow frame may trigger the next one, and profiles per session
+PROFILE_TRIGGER_COOLDOWN = 60.0
+PROFILE_MAX_DUMPS = 5
+
+############# OFFLINE POSE CONSTANTS ####################
+# worker processes of the offline pose extraction (utils/parallel_pose.py), None for all CPUs
+OFFLINE_POSE_WORKERS = None
+# frames decoded ahead into shared memory for every worker
+OFFLINE_SLOTS_PER_WORKER = 4
+
+############# DTYPE CONSTANTS ####################
+# dtype of the landmark -> feature -> model path (extract_keypoints, windows, model input)
+FEATURE_DTYPE = 'float32'
+# dtype of stored keypoint buffers (live windows, repetitions in progress), 'float16' halves their memory;
+# they are cast back to FEATURE_DTYPE when a window is built for the model
+BUFFER_DTYPE = 'float32'
+
+############# CAUSAL MODEL CONSTANTS ####################
+# exported causal classifier (train_causal_model.py), takes one frame per update (camera_movement.py --streaming)
+CAUSAL_MODEL_PATH = 'models/causal_tcn.npz'
+# causal conv layers: filters, kernel size and one dilation per layer. The receptive field,
+# 1 + (kernel size - 1) * sum(dilations) frames at MODEL_FPS, is the window length the model is trained on
+CAUSAL_FILTERS = 64
+CAUSAL_KERNEL_SIZE = 3
+CAUSAL_DILATIONS = (1, 2, 4, 8)
+# seconds between two frames the stream is interpolated over, a longer gap restarts the causal model
+STREAM_MAX_GAP = 0.5
+
+############# COMPACT MODEL CONSTANTS ####################
+# engineered per-frame features (utils/pose_features.py) instead of the 132 raw landmark values;
+# window of the compact classifier (train_compact_model.py): about one second at a lower frame rate
+COMPACT_SEQUENCE_LENGTH = 15
+COMPACT_FPS = 15
+
+############# MOTION GATE CONSTANTS ####################
+# sliding window classification of camera_server.py --classify window is frozen while the user stands still
+# (utils/motion_gate.py); the per-repetition and causal classifiers are not gated
+MOTION_GATE_ENABLED = True
+# seconds of landmark velocity averaged by the gate
+MOTION_WINDOW = 0.5
+# mean landmark speed in image units per second: below MOTION_STOP_SPEED (MOVEMENT_THR per frame at MODEL_FPS)
+# the user counts as still, above MOTION_START_SPEED as moving again
+MOTION_STOP_SPEED = MOVEMENT_THR * MODEL_FPS
+MOTION_START_SPEED = 2 * MOTION_STOP_SPEED
+# seconds the speed has to stay below MOTION_STOP_SPEED before the classifier is frozen
+MOTION_STILL_TIME = 1.0
+
+############# PRESENCE CONSTANTS ####################
+# skip MediaPipe while nobody is in front of the camera and the scene does not change (utils/presence.py)
+PRESENCE_ENABLED = True
+# width of the grayscale frame the presence detector compares, the height follows the aspect ratio
+PRESENCE_WIDTH = 64
+# grey level difference from the background that counts a pixel as changed
+PRESENCE_PIXEL_THR = 20
+# share of changed pixels that counts as motion in the scene
+PRESENCE_MOTION_THR = 0.01
+# weight of a new frame in the running background average while the scene is empty
+PRESENCE_BACKGROUND_RATE = 0.05
+# seconds MediaPipe keeps running after it last found a person
+PRESENCE_HOLD = 1.0
+# seconds between forced MediaPipe checks of an empty, static scene (a person standing still)
+PRESENCE_CHECK_INTERVAL = 2.0
+
+############# CASCADE CONSTANTS ####################
+# first stage of the repetition classifier (utils/cascade.py, train_cascade.py), the AttnLSTM only runs on
+# repetitions the first stage is less sure about than CASCADE_CONFIDENCE
+CASCADE_MODEL_PATH = 'models/cascade_meg_owndata.npz'
+CASCADE_CONFIDENCE = 0.9
+# a repetition whose deepest knee angle stays above KNEE_ANGLE_DEPTH is shallow, for models with that class
+CASCADE_DEPTH_RULE = True
+
+############# LANDMARK TRANSPORT CONSTANTS ####################
+# landmark_server.py: the browser keeps its own video and draws the overlay, the server only sends the pose,
+# knee angles, counter and class probabilities of every frame over a WebRTC data channel (utils/landmark_message.py)
+LANDMARK_SERVER_PORT = 8080
+# label of the data channel the browser opens
+LANDMARK_CHANNEL = 'landmarks'
+# landmark x / y are sent as int16 in 1 / LANDMARK_SCALE image units, landmarks up to 4 images off screen fit
+LANDMARK_SCALE = 8192
+
+############# QUALITY CONTROLLER CONSTANTS ####################
+# quality levels of the adaptive controller (utils/quality.py), best first:
+# (MediaPipe model_complexity, pose input scale, frames between two window classifications, render detail)
+# render detail: 'full' skeleton and overlay, 'basic' legs and overlay, 'minimal' counter and bars only
+QUALITY_LEVELS = (
+    (2, 1.0, 1, 'full'),
+    (1, 1.0, 1, 'full'),
+    (1, 0.75, 2, 'full'),
+    (1, 0.5, 3, 'basic'),
+    (0, 0.5, 4, 'basic'),
+    (0, 0.35, 6, 'minimal'),
+)
+# level a session starts at, the default Pose() graph at full resolution
+QUALITY_START_LEVEL = 1
+# frames of processing time the controller averages, a new level is judged on a full window of its own frames
+QUALITY_WINDOW = 30
+# seconds of processing per frame (95th percentile) above which quality is stepped down, next to 1 / target fps
+QUALITY_TARGET_LATENCY = 0.1
+# quality is stepped up again when the frame time stays below this share of the budget ...
+QUALITY_UP_HEADROOM = 0.6
+# ... for this many seconds; doubled up to QUALITY_MAX_UP_WAIT after every step up that had to be taken back
+QUALITY_UP_WAIT = 3.0
+QUALITY_MAX_UP_WAIT = 60.0
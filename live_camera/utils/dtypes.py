@@ -0,0 +1,29 @@
+import numpy as np
+
+from utils.constant import FEATURE_DTYPE, BUFFER_DTYPE
+
+feature_dtype = np.dtype(FEATURE_DTYPE)
+buffer_dtype = np.dtype(BUFFER_DTYPE)
+
+
+def check_array(array, shape, dtype=feature_dtype, name="array"):
+    """
+    Checks an array at a module boundary instead of casting it silently
+
+    Args:
+        array (numpy array): array to check
+        shape (tuple): expected shape, None for any size along an axis
+        dtype: expected dtype
+        name (str): used in the error message
+
+    Returns:
+        numpy array: the array itself
+    """
+    if not isinstance(array, np.ndarray) or array.dtype != dtype:
+        found = array.dtype if isinstance(array, np.ndarray) else type(array).__name__
+        raise TypeError(f"{name} must be a {np.dtype(dtype)} array, got {found}")
+    if len(array.shape) != len(shape) or any(expected is not None and size != expected
+                                             for size, expected in zip(array.shape, shape)):
+        expected = tuple('*' if size is None else size for size in shape)
+        raise ValueError(f"{name} must have shape {expected}, got {array.shape}")
+    return array
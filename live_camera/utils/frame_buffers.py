@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+
+class FrameBuffers:
+    """
+    Frame sized arrays allocated once per stream and reused for every frame.
+
+    The working frame stays BGR, everything is drawn into it in place; the only colour conversion of a frame
+    is the RGB copy MediaPipe needs (to_rgb). A buffer is reallocated only when the frame size changes.
+
+    """
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+    def read(self, cap, name="capture"):
+        """
+        cv2.VideoCapture.read into the same array every frame
+
+        Returns:
+            tuple: (success, BGR frame)
+        """
+        ret, frame = cap.read(self.buffers.get(name))
+        if ret:
+            self.buffers[name] = frame
+        return ret, frame
+
+    def resize(self, frame, size, name="resized"):
+        """
+        cv2.resize into a reused buffer, size is (width, height)
+
+        """
+        if (frame.shape[1], frame.shape[0]) == tuple(size):
+            return frame
+        return cv2.resize(frame, tuple(size), dst=self.get(name, (size[1], size[0]) + frame.shape[2:]))
+
+    def to_rgb(self, frame):
+        """
+        RGB copy of a BGR frame for MediaPipe, written into the same buffer every frame
+
+        """
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.get("rgb", frame.shape))
+
+
+def to_video_frame(image):
+    """
+    av.VideoFrame of a bgr24 image for streamlit_webrtc. The frame shares the memory of the image when PyAV
+    supports it (VideoFrame.from_numpy_buffer), otherwise the image is copied.
+
+    Args:
+        image (numpy array): BGR image, e.g. drawn in place into the array of VideoFrame.to_ndarray
+    """
+    import av
+
+    if hasattr(av.VideoFrame, "from_numpy_buffer"):
+        try:
+            return av.VideoFrame.from_numpy_buffer(image, format="bgr24")
+        except ValueError:
+            # strides PyAV can not wrap
+            pass
+    return av.VideoFrame.from_ndarray(image, format="bgr24")
@@ -0,0 +1,48 @@
+from collections import deque
+
+
+class LandmarkData:
+    def __init__(self, landmark_left, landmark_right, max_frames):
+        self.landmark_left = landmark_left
+        self.landmark_right = landmark_right
+
+        # tracks x value (position[0] = left, position[1] = right)
+        self.x_queue = deque(maxlen=max_frames)
+        # tracks y value (position[0] = left, position[1] = right)
+        self.y_queue = deque(maxlen=max_frames)
+
+        # left and right contain both (x value, y value)
+        self.left = None
+        self.right = None
+        # average of y values
+        self.avg_val_left = None
+        self.avg_val_right = None
+
+        self.angles = deque(maxlen=max_frames)
+        self.left_angle = None
+        self.right_angle = None
+        self.avg_angle_left = None
+        self.avg_angle_right = None
+
+    def update_values(self, results, update_y=True):
+        self.left = results.pose_landmarks.landmark[self.landmark_left]
+        self.right = results.pose_landmarks.landmark[self.landmark_right]
+        if update_y:
+            self.y_queue.append((self.left.y, self.right.y))
+        else:
+            self.x_queue.append((self.left.x, self.right.x))
+
+        self.update_average(update_y=update_y)
+
+    def update_average(self, update_y=True):
+        queue = self.y_queue if update_y else self.x_queue
+
+        self.avg_val_left, self.avg_val_right = map(lambda x: sum(x) / len(x), zip(*queue))
+
+
+    def update_angles(self, left_angle, right_angle):
+        self.left_angle = left_angle
+        self.right_angle = right_angle
+        self.angles.append((self.left_angle, self.right_angle))
+
+        self.avg_angle_left, self.avg_angle_right = map(lambda x: sum(x) / len(x), zip(*self.angles))
@@ -0,0 +1,90 @@
+import json
+import struct
+
+import numpy as np
+
+from utils.constant import LANDMARK_SCALE
+
+MESSAGE_VERSION = 1
+# version, flags, repetition count, frame time (ms), left / right knee angle (0.1 degrees), direction,
+# number of class probabilities; little endian like the DataView reads of static/landmark_overlay.html
+_HEADER = struct.Struct('<BBHIHHBB')
+
+# flags
+PERSON = 1
+GO_LOWER = 2
+GOING_UP = 4
+
+# Counter.direction_text, sent as its index
+DIRECTIONS = ("STABLE", "UP", "DOWN")
+NUM_LANDMARKS = 33
+
+
+def hello_message(class_labels, knee_angle_depth):
+    """
+    First (text) message of a data channel, everything that does not change from frame to frame
+
+    Returns:
+        str: JSON with the message version, class labels and the depth threshold of the knee colour
+    """
+    return json.dumps({'version': MESSAGE_VERSION, 'classes': list(class_labels),
+                       'knee_angle_depth': knee_angle_depth})
+
+
+def pack_frame_state(frame_time, counter, keypoints=None, knee_angles=(0.0, 0.0), probabilities=(),
+                     go_lower=False):
+    """
+    Binary state of one frame for the client-side overlay: 14 byte header, one byte per class probability,
+    then, when a person was found, int16 x / y of the 33 landmarks (1 / LANDMARK_SCALE image units) and
+    their visibility as one byte each. 185 bytes with six classes.
+
+    Args:
+        frame_time (float): seconds, time of the video frame the state belongs to
+        counter (Counter): repetition count and direction
+        keypoints (numpy array): extract_keypoints row, None when nobody was found
+        knee_angles (tuple): left and right knee angle in degrees
+        probabilities (numpy array): class probabilities of the last prediction, empty before the first
+        go_lower (bool): show the "Go lower!" warning
+
+    Returns:
+        bytes: the message
+    """
+    flags = (PERSON if keypoints is not None else 0) | (GO_LOWER if go_lower else 0) | \
+            (GOING_UP if counter.going_up else 0)
+    left, right = (int(round(min(max(angle, 0.0), 180.0) * 10)) for angle in knee_angles)
+    probabilities = np.round(np.clip(np.asarray(probabilities, dtype=np.float32), 0, 1) * 255).astype(np.uint8)
+    message = _HEADER.pack(MESSAGE_VERSION, flags, min(counter.count, 0xFFFF), int(frame_time * 1000) & 0xFFFFFFFF,
+                           left, right, DIRECTIONS.index(counter.direction_text), len(probabilities))
+    message += probabilities.tobytes()
+
+    if keypoints is not None:
+        points = keypoints.reshape(NUM_LANDMARKS, 4)
+        positions = np.clip(np.round(points[:, :2] * LANDMARK_SCALE), -0x8000, 0x7FFF).astype('<i2')
+        visibility = np.round(np.clip(points[:, 3], 0, 1) * 255).astype(np.uint8)
+        message += positions.tobytes() + visibility.tobytes()
+    return message
+
+
+def unpack_frame_state(message):
+    """
+    Reverse of pack_frame_state, for tests and Python clients
+
+    Returns:
+        dict: the frame state, landmarks as a (33, 3) x / y / visibility array or None
+    """
+    version, flags, count, time_ms, left, right, direction, num_classes = _HEADER.unpack_from(message)
+    if version != MESSAGE_VERSION:
+        raise ValueError(f"landmark message version {version}, expected {MESSAGE_VERSION}")
+    offset = _HEADER.size
+    probabilities = np.frombuffer(message, np.uint8, num_classes, offset) / 255
+    offset += num_classes
+
+    landmarks = None
+    if flags & PERSON:
+        positions = np.frombuffer(message, '<i2', NUM_LANDMARKS * 2, offset).reshape(NUM_LANDMARKS, 2)
+        visibility = np.frombuffer(message, np.uint8, NUM_LANDMARKS, offset + NUM_LANDMARKS * 4)
+        landmarks = np.column_stack([positions / LANDMARK_SCALE, visibility / 255])
+
+    return {'frame_time': time_ms / 1000, 'count': count, 'direction': DIRECTIONS[direction],
+            'going_up': bool(flags & GOING_UP), 'go_lower': bool(flags & GO_LOWER),
+            'knee_angles': (left / 10, right / 10), 'probabilities': probabilities, 'landmarks': landmarks}
@@ -0,0 +1,62 @@
+import threading
+import time
+import traceback
+
+
+class LatestFrameQueue:
+    """
+    Hands the frames of one stream to a shared thread pool, newest first. Only one frame waits; a frame that
+    arrives while another is still waiting replaces it (on_drop is called). Frames of the stream are never
+    processed on two threads at once, and a stream with a frame waiting requeues itself behind the other
+    streams instead of looping, so one busy stream can not starve the pool.
+
+    An exception in process is printed and the stream goes on with the next frame.
+
+    Args:
+        pool: ThreadPoolExecutor shared by the streams
+        process (callable): called on a pool thread with the items of the offered tuple
+        on_drop (callable): called without arguments for every replaced frame
+        name (str): stream name in error messages
+    """
+    def __init__(self, pool, process, on_drop=None, name="stream"):
+        self.pool = pool
+        self.process = process
+        self.on_drop = on_drop
+        self.name = name
+
+        self.lock = threading.Lock()
+        self.pending = None
+        self.busy = False
+
+    def offer(self, item):
+        with self.lock:
+            if self.pending is not None and self.on_drop is not None:
+                self.on_drop()
+            self.pending = item
+            if self.busy:
+                return
+            self.busy = True
+        self.pool.submit(self._drain)
+
+    def _drain(self):
+        with self.lock:
+            item = self.pending
+            self.pending = None
+        try:
+            self.process(*item)
+        except Exception:
+            print(f"[{self.name}] frame processing failed:")
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                requeue = self.pending is not None
+                self.busy = requeue
+            if requeue:
+                self.pool.submit(self._drain)
+
+    def wait_idle(self, poll=0.01):
+        """
+        Blocks until no frame is waiting or processed, e.g. before closing what process uses
+        """
+        while self.busy:
+            time.sleep(poll)
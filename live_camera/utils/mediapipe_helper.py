@@ -3,46 +3,75 @@ import cv2
 # mp_drawing = mp.solutions.drawing_utils
 import numpy as np
 import math
+from types import SimpleNamespace
 
+from utils.dtypes import feature_dtype
+from utils.resample import resample_window
 
-def mediapipe_detection(image, model):
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    image.flags.writeable = False
-    results = model.process(image)  # Make prediction
-    image.flags.writeable = True
-    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+# landmarks kept by extract_keypoints_no_arm
+NO_ARM_LANDMARKS = tuple(range(13)) + tuple(range(23, 33))
+
+
+def mediapipe_detection(image, model, buffers=None):
+    # MediaPipe reads an RGB copy, the BGR image is returned unchanged instead of converted back
+    rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if buffers is None else buffers.to_rgb(image)
+    rgb_image.flags.writeable = False
+    results = model.process(rgb_image)  # Make prediction
+    rgb_image.flags.writeable = True
     return image, results
 
 
 def extract_keypoints(results):
-    # extract keypoints and convert to np array
-    pose = np.array([[res.x, res.y, res.z, res.visibility] for res in
-                     results.pose_landmarks.landmark]).flatten() if results.pose_landmarks else np.zeros(33 * 4)
-    return pose
+    # extract keypoints straight into one FEATURE_DTYPE array, no float64 array in between
+    if not results.pose_landmarks:
+        return np.zeros(33 * 4, dtype=feature_dtype)
+    return np.fromiter((value for res in results.pose_landmarks.landmark
+                        for value in (res.x, res.y, res.z, res.visibility)), dtype=feature_dtype, count=33 * 4)
 
 
 def extract_keypoints_no_arm(results):
     # Extract keypoints and convert to np array
-    if results.pose_landmarks:
-        pose = np.array([[res.x, res.y, res.z, res.visibility] for res in results.pose_landmarks.landmark])
-        # Remove landmarks 13-22 (indices 12 to 22, inclusive)
-        # Since landmarks are 0-indexed, landmark 13 starts at index 12*4=48 and landmark 22 ends at index 22*4=88
-        pose = np.concatenate((pose[:13], pose[23:]), axis=0)
-    else:
-        pose = np.zeros((33 - 10) * 4)  # Adjusted for the removal of 10 landmarks
-    
-    return pose.flatten()
-
-def feature_extraction_data(mp_pose, frame_list, width=1920, height=1080):
-  with mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5) as pose:
+    # Landmarks 13-22 (elbows, wrists, hands) are left out, 23 landmarks remain
+    if not results.pose_landmarks:
+        return np.zeros((33 - 10) * 4, dtype=feature_dtype)
+    kept = (results.pose_landmarks.landmark[index] for index in NO_ARM_LANDMARKS)
+    return np.fromiter((value for res in kept for value in (res.x, res.y, res.z, res.visibility)),
+                       dtype=feature_dtype, count=len(NO_ARM_LANDMARKS) * 4)
+
+
+def results_from_landmarks(landmarks):
+    """
+    Pose results with the landmarks of one (33, 4) array, to replay recorded landmarks through the per-frame code
+
+    Args:
+        landmarks: x, y, z, visibility per landmark, NaN when nobody was detected
+
+    Returns:
+        object: with pose_landmarks like the results of Pose.process, None when nobody was detected
+    """
+    from mediapipe.framework.formats import landmark_pb2
+
+    if np.isnan(landmarks[0, 0]):
+        return SimpleNamespace(pose_landmarks=None)
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in landmarks:
+        landmark_list.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return SimpleNamespace(pose_landmarks=landmark_list)
+
+
+def feature_extraction_data(mp_pose, frame_list, width=1920, height=1080, timestamps=None):
+    SEQUENCE_LENGTH = 30
+
+    # with capture times the keypoints are interpolated onto an even time grid, independent of the fps
+    if timestamps is not None:
+        return list(resample_window(timestamps, np.stack(frame_list), SEQUENCE_LENGTH))
+
     #initialize lists to store frame features and images.
     keypoint_list = []
 
     #get estimation of number of frames
     video_frames_count = len(frame_list)
 
-    SEQUENCE_LENGTH = 30
-
     frame_indices = [video_frames_count*i // SEQUENCE_LENGTH for i in range(SEQUENCE_LENGTH)]
 
     for current_frame in frame_indices:
@@ -0,0 +1,279 @@
+import bisect
+import json
+import os
+import threading
+import time
+import urllib.request
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from utils.constant import LATENCY_BUCKETS_MS, METRICS_INTERVAL
+
+METRIC_PREFIX = "fitness_vision"
+# weight of the newest sample in the moving averages shown on the HUD
+EWMA_WEIGHT = 0.1
+
+
+class LatencyHistogram:
+    """
+    Fixed-size latency histogram with cumulative Prometheus style buckets (milliseconds).
+    Recording is a bisect and a few additions, memory does not grow with the number of frames.
+
+    """
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.recent_ms = None
+        self.lock = threading.Lock()
+
+    def record(self, milliseconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, milliseconds)] += 1
+            self.count += 1
+            self.sum_ms += milliseconds
+            self.recent_ms = milliseconds if self.recent_ms is None else \
+                self.recent_ms + EWMA_WEIGHT * (milliseconds - self.recent_ms)
+
+    def quantile(self, q):
+        """
+        Estimated quantile in ms, linear inside the bucket it falls in
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+
+        rank = q * total
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets_ms[index - 1] if index > 0 else 0.0
+                upper = self.buckets_ms[index] if index < len(self.buckets_ms) else self.buckets_ms[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets_ms[-1]
+
+
+class _Span:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.record((time.perf_counter() - self.start) * 1000)
+
+
+class PipelineMetrics:
+    """
+    Timing spans, frame rate and dropped frames of a live loop:
+
+        with metrics.span("pose"):
+            results = pose.process(rgb_frame)
+        metrics.frame_done(capture_time)
+
+    Disabled metrics hand out one shared no-op context and return immediately everywhere,
+    so instrumented loops cost nothing measurable when metrics are off.
+
+    Args:
+        nominal_fps (float): camera frame rate, frame gaps longer than one interval are counted as dropped frames
+    """
+    def __init__(self, enabled=True, nominal_fps=None):
+        self.enabled = enabled
+        self.nominal_fps = nominal_fps
+        self.histograms = {}
+        self.frames = 0
+        self.dropped = 0
+        self.inferences = 0
+        self.skipped_inferences = 0
+        self.fps = 0.0
+        self.last_capture_time = None
+        self.lock = threading.Lock()
+        self._null_span = nullcontext()
+
+    def span(self, name):
+        if not self.enabled:
+            return self._null_span
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return _Span(histogram)
+
+    def frame_done(self, capture_time=None):
+        """
+        Counts one processed frame, capture_time (seconds, time.monotonic() when None) gives fps and drops
+        """
+        if not self.enabled:
+            return
+        capture_time = time.monotonic() if capture_time is None else capture_time
+        with self.lock:
+            self.frames += 1
+            if self.last_capture_time is not None:
+                interval = capture_time - self.last_capture_time
+                if interval > 0:
+                    current_fps = 1.0 / interval
+                    self.fps = current_fps if not self.fps else self.fps + EWMA_WEIGHT * (current_fps - self.fps)
+                    if self.nominal_fps:
+                        self.dropped += max(0, round(interval * self.nominal_fps) - 1)
+            self.last_capture_time = capture_time
+
+    def frame_dropped(self, count=1):
+        if self.enabled:
+            with self.lock:
+                self.dropped += count
+
+    def inference_done(self, skipped=False):
+        """
+        Counts one classifier run, or one run the motion gate skipped (utils/motion_gate.py)
+        """
+        if self.enabled:
+            with self.lock:
+                self.inferences += 1
+                self.skipped_inferences += skipped
+
+    def skipped_ratio(self):
+        return self.skipped_inferences / self.inferences if self.inferences else 0.0
+
+    def draw_hud(self, frame, position=(10, 30)):
+        """
+        Draws fps, dropped frames and the recent ms of every stage in the corner of the frame (in place)
+        """
+        if not self.enabled:
+            return frame
+        lines = [f"{self.fps:5.1f} fps | dropped {self.dropped}"]
+        if self.inferences:
+            lines.append(f"skipped inference {self.skipped_ratio():.0%}")
+        lines += [f"{name}: {histogram.recent_ms:6.1f} ms" for name, histogram in list(self.histograms.items())
+                  if histogram.recent_ms is not None]
+
+        x, y = position
+        for line in lines:
+            cv2.putText(frame, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 4, cv2.LINE_AA)
+            cv2.putText(frame, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+            y += 22
+        return frame
+
+    def to_dict(self):
+        stages = {}
+        for name, histogram in list(self.histograms.items()):
+            stages[name] = {
+                'count': histogram.count,
+                'mean_ms': histogram.sum_ms / histogram.count if histogram.count else 0.0,
+                'p50_ms': histogram.quantile(0.5),
+                'p95_ms': histogram.quantile(0.95),
+                'p99_ms': histogram.quantile(0.99),
+            }
+        return {'time': time.time(), 'frames': self.frames, 'dropped': self.dropped, 'fps': self.fps,
+                'inferences': self.inferences, 'skipped_inferences': self.skipped_inferences,
+                'skipped_inference_ratio': self.skipped_ratio(), 'stages': stages}
+
+    def prometheus_text(self):
+        lines = [
+            f"# TYPE {METRIC_PREFIX}_frames_total counter",
+            f"{METRIC_PREFIX}_frames_total {self.frames}",
+            f"# TYPE {METRIC_PREFIX}_dropped_frames_total counter",
+            f"{METRIC_PREFIX}_dropped_frames_total {self.dropped}",
+            f"# TYPE {METRIC_PREFIX}_fps gauge",
+            f"{METRIC_PREFIX}_fps {self.fps:.3f}",
+            f"# TYPE {METRIC_PREFIX}_inferences_total counter",
+            f"{METRIC_PREFIX}_inferences_total {self.inferences}",
+            f"# TYPE {METRIC_PREFIX}_skipped_inferences_total counter",
+            f"{METRIC_PREFIX}_skipped_inferences_total {self.skipped_inferences}",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds histogram",
+        ]
+        for name, histogram in list(self.histograms.items()):
+            with histogram.lock:
+                counts = list(histogram.counts)
+                total, sum_ms = histogram.count, histogram.sum_ms
+            cumulative = 0
+            for upper_ms, bucket_count in zip(histogram.buckets_ms + [None], counts):
+                cumulative += bucket_count
+                upper = "+Inf" if upper_ms is None else f"{upper_ms / 1000:g}"
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{name}",le="{upper}"}} {cumulative}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{name}"}} {sum_ms / 1000:.6f}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{name}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Exports PipelineMetrics every interval seconds from a background thread:
+    to a local file (JSON for *.json, Prometheus text otherwise, replaced atomically), by HTTP POST to a url,
+    and / or on a local port serving /metrics (Prometheus) and /metrics.json for scraping.
+
+    """
+    def __init__(self, metrics, path=None, url=None, port=None, interval=METRICS_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.url = url
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.server = None
+        if port is not None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+            threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+
+        self.thread = None
+        if path or url:
+            self.thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+            self.thread.start()
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus_text(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.to_dict()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, *args):
+                pass
+
+        return MetricsHandler
+
+    def export(self):
+        if self.path:
+            body = json.dumps(self.metrics.to_dict()) if self.path.endswith(".json") else self.metrics.prometheus_text()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(body)
+            os.replace(tmp_path, self.path)
+
+        if self.url:
+            request = urllib.request.Request(self.url, data=json.dumps(self.metrics.to_dict()).encode(),
+                                             headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=2).close()
+            except OSError as e:
+                print(f"Metrics export to {self.url} failed: {e}")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.export()
+        if self.server is not None:
+            self.server.shutdown()
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+
+from utils.constant import MODEL_FPS, COMPACT_SEQUENCE_LENGTH, COMPACT_FPS
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+
+# landmarks 13 - 22 (elbows, wrists, hands) are left out of the no-arm features, see extract_keypoints_no_arm
+ARM_LANDMARKS = range(13, 23)
+
+
+class ModelVariant:
+    """
+    A trained classifier and the input it expects
+
+    Args:
+        name (str): folder name under models/
+        sequence_length (int): frames per window
+        features (str): 'full' for extract_keypoints, 'no_arm' for extract_keypoints_no_arm,
+            'compact' for utils/pose_features.compact_features
+        class_labels (list): class names in model output order
+        model_fps (float): frame rate of the live window, sequence_length frames span
+            (sequence_length - 1) / model_fps seconds
+    """
+    def __init__(self, name, sequence_length, features, class_labels, model_fps=MODEL_FPS):
+        self.name = name
+        self.sequence_length = sequence_length
+        self.features = features
+        self.class_labels = class_labels
+        self.model_fps = model_fps
+
+    @property
+    def folder(self):
+        return os.path.join(MODELS_DIR, self.name)
+
+    def available(self):
+        return os.path.isdir(self.folder)
+
+    def load(self):
+        from keras.models import load_model
+        return load_model(self.folder)
+
+    def select_features(self, keypoints):
+        """
+        Model input features from full extract_keypoints rows, shape (..., 33 * 4).
+        Compact features include velocities, so they are taken from whole windows, shape (..., frames, 33 * 4)
+        """
+        if self.features == 'compact':
+            from utils.pose_features import compact_features
+            return compact_features(keypoints)
+        if self.features == 'no_arm':
+            landmarks = keypoints.reshape(*keypoints.shape[:-1], 33, 4)
+            keep = [i for i in range(33) if i not in ARM_LANDMARKS]
+            return landmarks[..., keep, :].reshape(*keypoints.shape[:-1], len(keep) * 4)
+        return keypoints
+
+
+MODEL_VARIANTS = {}
+
+
+def register_model(variant):
+    MODEL_VARIANTS[variant.name] = variant
+    return variant
+
+
+# labels as used by the app that loads each model
+register_model(ModelVariant('LSTM_model_0.0005', 30, 'full',
+                            ['Bad Head', 'Bad Back Round', 'Bad Back Warp', 'Bad Lifted Heels', 'Bad Inward Knee',
+                             'Bad Shallow', 'Good']))
+register_model(ModelVariant('meg_owndata', 30, 'full',
+                            ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Good']))
+register_model(ModelVariant('right_original_back_combined_0.001', 30, 'full',
+                            ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Bad Shallow', 'Good']))
+register_model(ModelVariant('60_frames_original_back_combined_0.001', 60, 'full',
+                            ['Bad Head', 'Bad Back', 'Bad Frontal Knees', 'Bad Inward Knee', 'Bad Shallow', 'Good']))
+register_model(ModelVariant('no_arm_our_0.001', 30, 'no_arm',
+                            ['Bad Head', 'Bad Back', 'Bad Frontal Knees', 'Bad Inward Knee', 'Bad Shallow', 'Good']))
+# trained by train_compact_model.py with the classes of meg_owndata
+register_model(ModelVariant('compact_meg_owndata', COMPACT_SEQUENCE_LENGTH, 'compact',
+                            ['Bad Head', 'Bad Back', 'Bad Lifted Heels', 'Bad Inward Knee', 'Good'],
+                            model_fps=COMPACT_FPS))
+
+
+def normalize_label(label):
+    """
+    Compares class names across models and folders: 'Bad_inward_knee' == 'Bad Inward Knee'
+    """
+    return " ".join(label.replace("_", " ").lower().split())
+
+
+def label_index(variant, label):
+    """
+    Output index of a class name in the model, None when the model has no such class
+    """
+    labels = [normalize_label(class_label) for class_label in variant.class_labels]
+    label = normalize_label(label)
+    return labels.index(label) if label in labels else None
+
+
+def count_flops(model):
+    """
+    Multiply-adds x 2 of one window through a Keras model, counted for the Dense, Conv1D and recurrent
+    layers (activations, pooling and attention products are left out, they are small next to them)
+
+    Returns:
+        int: FLOPs per window
+    """
+    flops = 0
+    for layer in model.layers:
+        inner = getattr(layer, 'forward_layer', None)
+        directions = 2 if inner is not None else 1
+        cell = inner or layer
+        kind = type(cell).__name__
+        input_shape = layer.input.shape
+        output_shape = layer.output.shape
+        if kind == 'Dense':
+            positions = int(np.prod(input_shape[1:-1])) if len(input_shape) > 2 else 1
+            flops += 2 * positions * input_shape[-1] * output_shape[-1]
+        elif kind == 'Conv1D':
+            flops += 2 * output_shape[1] * cell.kernel_size[0] * input_shape[-1] * cell.filters
+        elif kind in ('LSTM', 'GRU'):
+            gates = 4 if kind == 'LSTM' else 3
+            flops += directions * 2 * input_shape[1] * gates * cell.units * (input_shape[-1] + cell.units)
+    return int(flops)
@@ -0,0 +1,79 @@
+from collections import deque
+
+import numpy as np
+
+from utils.constant import MOTION_WINDOW, MOTION_STOP_SPEED, MOTION_START_SPEED, MOTION_STILL_TIME
+
+# shoulders, hips, knees and ankles, the landmarks that move in a squat
+GATE_LANDMARKS = (11, 12, 23, 24, 25, 26, 27, 28)
+
+
+class MotionGate:
+    """
+    Tells a live loop when the user moves, so the classifier can be frozen while they stand still.
+
+    The speed is the mean distance the gate landmarks moved from frame to frame over the last window seconds,
+    in image units per second. A moving user counts as still once the speed has stayed below stop_speed for
+    still_time seconds, a still user as moving again as soon as it goes above start_speed; between the two
+    thresholds the state is kept, so jitter around one threshold does not toggle the gate.
+
+    Frames without a person (all zero keypoints) do not change the speed or the state.
+
+    Args:
+        window (float): seconds the speed is averaged over
+        stop_speed (float): speed below which the user is still
+        start_speed (float): speed above which the user moves again
+        still_time (float): seconds below stop_speed before the gate closes
+    """
+    def __init__(self, window=MOTION_WINDOW, stop_speed=MOTION_STOP_SPEED, start_speed=MOTION_START_SPEED,
+                 still_time=MOTION_STILL_TIME):
+        self.window = window
+        self.stop_speed = stop_speed
+        self.start_speed = start_speed
+        self.still_time = still_time
+        self.reset()
+
+    def reset(self):
+        self.moves = deque()
+        self.distance = 0.0
+        self.last_time = None
+        self.last_points = None
+        self.slow_since = None
+        self.moving = True
+        self.speed = 0.0
+
+    def update(self, timestamp, keypoints):
+        """
+        Args:
+            timestamp (float): capture time in seconds
+            keypoints (numpy array): extract_keypoints row of the frame
+
+        Returns:
+            bool: True while the user moves and the classifier should run
+        """
+        points = keypoints.reshape(33, 4)[GATE_LANDMARKS, :2]
+        if not np.any(points):
+            return self.moving
+
+        if self.last_points is not None:
+            distance = float(np.mean(np.linalg.norm(points - self.last_points, axis=1)))
+            self.moves.append((self.last_time, timestamp, distance))
+            self.distance += distance
+            # moves that ended before the window are dropped, the speed is over the time the rest spans
+            while len(self.moves) > 1 and self.moves[0][1] <= timestamp - self.window:
+                self.distance -= self.moves.popleft()[2]
+            elapsed = timestamp - self.moves[0][0]
+            self.speed = self.distance / elapsed if elapsed > 0 else 0.0
+        self.last_time = timestamp
+        self.last_points = points
+
+        if self.speed > self.start_speed:
+            self.moving = True
+            self.slow_since = None
+        elif self.speed < self.stop_speed:
+            self.slow_since = timestamp if self.slow_since is None else self.slow_since
+            if timestamp - self.slow_since >= self.still_time:
+                self.moving = False
+        else:
+            self.slow_since = None
+        return self.moving
@@ -0,0 +1,216 @@
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.constant import OFFLINE_POSE_WORKERS, OFFLINE_SLOTS_PER_WORKER
+from utils.dtypes import feature_dtype
+from utils.video_io import iter_time_range, iter_timed_frames, time_span, upload_bytes
+
+# seconds the decoder waits for a free frame slot before it checks that the workers are still alive
+_SLOT_WAIT = 1.0
+
+
+def _pose_worker(shm_name, slots_shape, task_queue, free_queue, result_queue, static_image_mode, pose_options):
+    """
+    Runs in a worker process: MediaPipe Pose on the frames the decoder put in shared memory slots
+
+    Tasks are (slot, position, timestamp, reset), reset starts tracking over at the first frame of a range.
+    Results are (position, timestamp, landmarks (33, 4) FEATURE_DTYPE, NaN when nobody is detected).
+    """
+    import mediapipe as mp_solutions
+    from exercise.base import landmarks_from_results
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        with mp_solutions.solutions.pose.Pose(static_image_mode=static_image_mode, **pose_options) as pose:
+            while True:
+                task = task_queue.get()
+                if task is None:
+                    break
+                slot, position, timestamp, reset = task
+                if reset:
+                    pose.reset()
+                results = pose.process(frames[slot])
+                # MediaPipe copied the frame into its own packet, the slot can be refilled
+                free_queue.put(slot)
+                result_queue.put((position, timestamp, landmarks_from_results(results, feature_dtype)))
+    finally:
+        del frames
+        shm.close()
+
+
+class ParallelPoseExtractor:
+    """
+    MediaPipe Pose over a whole video on several worker processes, each with its own Pose graph.
+
+    The parent decodes the frames straight to RGB and copies each into a slot of one shared memory block,
+    workers read the slot in place, so no frame is pickled. Two ways to split the work:
+
+        ranges   (all frames) the video is cut into one time range per worker, decoded by one decoder each
+                 and tracked in video mode like a sequential run; tracking starts over once per range
+        sampled  (frame_indices) independent frames in static image mode, any free worker takes the next one
+
+    Results are merged back in frame order.
+
+    Args:
+        workers (int): worker processes, all CPUs when None
+        slots_per_worker (int): frames decoded ahead for each worker
+        pose_options: passed to mp.solutions.pose.Pose (model_complexity, min_detection_confidence, ...)
+    """
+    def __init__(self, workers=OFFLINE_POSE_WORKERS, slots_per_worker=OFFLINE_SLOTS_PER_WORKER, **pose_options):
+        self.workers = workers or mp.cpu_count()
+        self.slots_per_worker = slots_per_worker
+        self.pose_options = pose_options
+        self.ctx = mp.get_context("spawn")
+
+    def extract(self, uploaded_file, frame_indices=None):
+        """
+        Args:
+            uploaded_file: path, bytes, Streamlit UploadedFile or file-like object
+            frame_indices: frames to run in static image mode, all frames in tracking mode when None
+
+        Returns:
+            tuple: (timestamps (T,), landmarks (T, 33, 4) FEATURE_DTYPE with NaN rows for frames without a person)
+        """
+        if isinstance(uploaded_file, str):
+            with open(uploaded_file, "rb") as f:
+                data = f.read()
+        else:
+            data = upload_bytes(uploaded_file)
+
+        if frame_indices is not None:
+            indices = sorted(set(frame_indices))
+            lanes = [iter((index, timestamp, frame) for index, timestamp, frame
+                          in iter_timed_frames(data, indices, format="rgb24"))]
+            return self._run(lanes, static_image_mode=True)
+
+        span = time_span(data)
+        workers = self.workers if span is not None else 1
+        if workers == 1:
+            bounds = [(0.0, None)]
+        else:
+            edges = np.linspace(span[0], span[1], workers + 1)
+            bounds = [(0.0 if i == 0 else edges[i], None if i == workers - 1 else edges[i + 1])
+                      for i in range(workers)]
+        lanes = [iter((None, timestamp, frame) for timestamp, frame in iter_time_range(data, start, end, "rgb24"))
+                 for start, end in bounds]
+        return self._run(lanes, static_image_mode=False)
+
+    def _run(self, lanes, static_image_mode):
+        """
+        lanes: frame iterators, in tracking mode one per worker (a worker keeps its lane), in static mode a
+        single lane all workers take frames from
+        """
+        first = [next(lane, None) for lane in lanes]
+        if all(item is None for item in first):
+            return np.zeros(0), np.zeros((0, 33, 4), dtype=feature_dtype)
+        frame_shape = next(item for item in first if item is not None)[2].shape
+
+        workers = self.workers if static_image_mode else len(lanes)
+        slots_per_lane = self.slots_per_worker * (workers if static_image_mode else 1)
+        slots_shape = (slots_per_lane * len(lanes),) + frame_shape
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(slots_shape)))
+        slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+
+        task_queues = [self.ctx.Queue() for _ in lanes]
+        free_queues = [self.ctx.Queue() for _ in lanes]
+        result_queue = self.ctx.Queue()
+        for lane_index, free_queue in enumerate(free_queues):
+            for slot in range(lane_index * slots_per_lane, (lane_index + 1) * slots_per_lane):
+                free_queue.put(slot)
+
+        processes = []
+        for worker in range(workers):
+            lane_index = 0 if static_image_mode else worker
+            process = self.ctx.Process(target=_pose_worker, daemon=True,
+                                       args=(shm.name, slots_shape, task_queues[lane_index], free_queues[lane_index],
+                                             result_queue, static_image_mode, self.pose_options))
+            process.start()
+            processes.append(process)
+
+        results = []
+        try:
+            sent = self._feed(lanes, first, slots, task_queues, free_queues, result_queue, results, processes)
+            # one stop per worker of the lane
+            for task_queue in task_queues:
+                for _ in range(workers if static_image_mode else 1):
+                    task_queue.put(None)
+            while len(results) < sent:
+                results.append(self._get_result(result_queue, processes))
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            del slots
+            shm.close()
+            shm.unlink()
+
+        # positions are frame indices in static mode; ranges are merged by time
+        results.sort(key=lambda item: (item[1] if item[0] is None else item[0]))
+        timestamps = np.asarray([item[1] for item in results], dtype=np.float64)
+        landmarks = np.stack([item[2] for item in results])
+        return timestamps, landmarks
+
+    def _feed(self, lanes, first, slots, task_queues, free_queues, result_queue, results, processes):
+        """
+        Decodes the lanes round robin into free slots, returns the number of frames sent
+        """
+        sent = 0
+        pending = list(first)
+        starts = [True] * len(lanes)
+        active = [i for i, item in enumerate(pending) if item is not None]
+        while active:
+            for lane_index in list(active):
+                slot = self._get_slot(free_queues[lane_index], result_queue, results, processes)
+                position, timestamp, frame = pending[lane_index]
+                np.copyto(slots[slot], frame)
+                task_queues[lane_index].put((slot, position, timestamp, starts[lane_index]))
+                starts[lane_index] = False
+                sent += 1
+
+                pending[lane_index] = next(lanes[lane_index], None)
+                if pending[lane_index] is None:
+                    active.remove(lane_index)
+        return sent
+
+    def _get_slot(self, free_queue, result_queue, results, processes):
+        while True:
+            # results are collected while waiting, the result queue never backs up
+            while True:
+                try:
+                    results.append(result_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                return free_queue.get(timeout=_SLOT_WAIT)
+            except queue.Empty:
+                self._check_workers(processes)
+
+    def _get_result(self, result_queue, processes):
+        while True:
+            try:
+                return result_queue.get(timeout=_SLOT_WAIT)
+            except queue.Empty:
+                self._check_workers(processes)
+
+    @staticmethod
+    def _check_workers(processes):
+        for process in processes:
+            if process.exitcode not in (None, 0):
+                raise RuntimeError(f"pose worker {process.pid} exited with code {process.exitcode}")
+
+
+def extract_video_landmarks(uploaded_file, frame_indices=None, workers=OFFLINE_POSE_WORKERS, **pose_options):
+    """
+    Pose landmarks of every frame (tracking mode) or of frame_indices (static image mode) of a video,
+    extracted on worker processes, see ParallelPoseExtractor
+
+    Returns:
+        tuple: (timestamps (T,), landmarks (T, 33, 4) FEATURE_DTYPE with NaN rows for frames without a person)
+    """
+    return ParallelPoseExtractor(workers, **pose_options).extract(uploaded_file, frame_indices)
@@ -0,0 +1,160 @@
+import cv2
+import numpy as np
+
+
+def iou(box_a, box_b):
+    """
+    Intersection over union of two (x0, y0, x1, y1) pixel boxes
+
+    """
+    x0 = max(box_a[0], box_b[0])
+    y0 = max(box_a[1], box_b[1])
+    x1 = min(box_a[2], box_b[2])
+    y1 = min(box_a[3], box_b[3])
+    intersection = max(0, x1 - x0) * max(0, y1 - y0)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def pad_box(box, frame_shape, padding=0.15):
+    """
+    Grows a box by padding * its size on every side and clips it to the frame
+
+    """
+    frame_height, frame_width = frame_shape[:2]
+    x0, y0, x1, y1 = box
+    pad_x = (x1 - x0) * padding
+    pad_y = (y1 - y0) * padding
+    return (int(max(0, x0 - pad_x)), int(max(0, y0 - pad_y)),
+            int(min(frame_width, x1 + pad_x)), int(min(frame_height, y1 + pad_y)))
+
+
+class PersonDetector:
+    """
+    Lightweight person detector on a downscaled grayscale frame, OpenCV HOG people detector.
+    Only has to find people now and then, the pose landmarks keep the boxes up to date in between.
+
+    """
+    def __init__(self, detect_width=640, min_score=0.5):
+        self.detect_width = detect_width
+        self.min_score = min_score
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, frame):
+        """
+        Returns:
+            list: (x0, y0, x1, y1) person boxes in frame pixels
+        """
+        scale = min(1.0, self.detect_width / frame.shape[1])
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        rects, weights = self.hog.detectMultiScale(gray, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        boxes = []
+        for (x, y, w, h), weight in zip(rects, np.ravel(weights)):
+            if weight >= self.min_score:
+                boxes.append((x / scale, y / scale, (x + w) / scale, (y + h) / scale))
+        return boxes
+
+    def close(self):
+        # nothing to release, same interface as TilePoseDetector
+        pass
+
+
+class TilePoseDetector:
+    """
+    Finds people by running single person pose estimation on overlapping vertical tiles of the frame.
+    Slower than HOG but finds whoever MediaPipe can track, e.g. people side by side at squat racks.
+
+    """
+    def __init__(self, mp_pose, tile_columns=3, overlap=0.25, detect_width=960):
+        self.tile_columns = tile_columns
+        self.overlap = overlap
+        self.detect_width = detect_width
+        self.pose = mp_pose.Pose(static_image_mode=True)
+
+    def detect(self, frame):
+        scale = min(1.0, self.detect_width / frame.shape[1])
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else frame
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        height, width = rgb.shape[:2]
+
+        tile_width = width / (self.tile_columns - (self.tile_columns - 1) * self.overlap)
+        step = tile_width * (1 - self.overlap)
+        boxes = []
+        for column in range(self.tile_columns):
+            x0 = int(column * step)
+            x1 = int(min(width, x0 + tile_width))
+            results = self.pose.process(np.ascontiguousarray(rgb[:, x0:x1]))
+            if not results.pose_landmarks:
+                continue
+            landmarks_to_frame(results.pose_landmarks, (x0, 0, x1, height), rgb.shape)
+            box = landmark_box(results.pose_landmarks, rgb.shape)
+            # overlapping tiles see the same person twice
+            if box is not None and all(iou(box, other) < 0.5 for other in boxes):
+                boxes.append(box)
+
+        return [tuple(value / scale for value in box) for box in boxes]
+
+    def close(self):
+        self.pose.close()
+
+
+def match_boxes(track_boxes, detections, iou_threshold):
+    """
+    Greedy IoU matching of existing track boxes with new detections
+
+    Returns:
+        tuple: (list of (track index, detection index), unmatched track indices, unmatched detection indices)
+    """
+    pairs = sorted(((iou(track_box, detection), track_index, detection_index)
+                    for track_index, track_box in enumerate(track_boxes)
+                    for detection_index, detection in enumerate(detections)), reverse=True)
+
+    matches = []
+    used_tracks = set()
+    used_detections = set()
+    for overlap, track_index, detection_index in pairs:
+        if overlap < iou_threshold:
+            break
+        if track_index in used_tracks or detection_index in used_detections:
+            continue
+        matches.append((track_index, detection_index))
+        used_tracks.add(track_index)
+        used_detections.add(detection_index)
+
+    unmatched_tracks = [i for i in range(len(track_boxes)) if i not in used_tracks]
+    unmatched_detections = [i for i in range(len(detections)) if i not in used_detections]
+    return matches, unmatched_tracks, unmatched_detections
+
+
+def landmarks_to_frame(pose_landmarks, roi, frame_shape):
+    """
+    Maps landmarks normalized to a cropped ROI back to coordinates normalized to the full frame (in place),
+    so drawing, LandmarkData and keypoints work as with single person tracking
+
+    """
+    frame_height, frame_width = frame_shape[:2]
+    x0, y0, x1, y1 = roi
+    for landmark in pose_landmarks.landmark:
+        landmark.x = (x0 + landmark.x * (x1 - x0)) / frame_width
+        landmark.y = (y0 + landmark.y * (y1 - y0)) / frame_height
+        # z uses roughly the same scale as x
+        landmark.z = landmark.z * (x1 - x0) / frame_width
+
+
+def landmark_box(pose_landmarks, frame_shape, min_visibility=0.5):
+    """
+    Pixel bounding box of the visible landmarks (normalized to the full frame), None when too few are visible
+
+    """
+    frame_height, frame_width = frame_shape[:2]
+    points = [(landmark.x * frame_width, landmark.y * frame_height) for landmark in pose_landmarks.landmark
+              if landmark.visibility >= min_visibility]
+    if len(points) < 4:
+        return None
+    xs, ys = zip(*points)
+    return min(xs), min(ys), max(xs), max(ys)
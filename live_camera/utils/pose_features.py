@@ -0,0 +1,118 @@
+import numpy as np
+
+from utils.angles import joint_angles
+from utils.constant import COMPACT_SEQUENCE_LENGTH
+from utils.dtypes import feature_dtype, check_array
+
+# MediaPipe Pose landmark indices, see mp.solutions.pose.PoseLandmark
+LEFT_EAR, RIGHT_EAR = 7, 8
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+LEFT_HEEL, RIGHT_HEEL = 29, 30
+LEFT_FOOT_INDEX, RIGHT_FOOT_INDEX = 31, 32
+
+# (first, mid, end) landmarks of every joint angle
+JOINT_ANGLES = (
+    (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE), (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),  # knees
+    (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE), (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),  # hips
+    (LEFT_KNEE, LEFT_ANKLE, LEFT_FOOT_INDEX), (RIGHT_KNEE, RIGHT_ANKLE, RIGHT_FOOT_INDEX),  # ankles
+    (LEFT_EAR, LEFT_SHOULDER, LEFT_HIP), (RIGHT_EAR, RIGHT_SHOULDER, RIGHT_HIP),  # head to trunk
+)
+_FIRST, _MID, _END = (np.array(joints) for joints in zip(*JOINT_ANGLES))
+# landmarks whose position relative to the hip centre goes in
+POSITION_LANDMARKS = (LEFT_EAR, RIGHT_EAR, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP,
+                      LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE, LEFT_HEEL, RIGHT_HEEL)
+_POSITIONS = np.array(POSITION_LANDMARKS)
+
+# joint angles, trunk lean, x / y of the positions, then velocities of the angles and of the hip centre
+NUM_POSE_FEATURES = len(JOINT_ANGLES) + 1 + 2 * len(POSITION_LANDMARKS)
+NUM_COMPACT_FEATURES = NUM_POSE_FEATURES + len(JOINT_ANGLES) + 2
+# mean, min and max of the pose features over a repetition
+NUM_SUMMARY_FEATURES = 3 * NUM_POSE_FEATURES
+
+
+def compact_features(keypoints):
+    """
+    Compact per-frame squat features from extract_keypoints rows, for the small classifier
+
+    Angles are in the image plane (x, y) like calculate_knee_angles, scaled to [0, 1] by 180 degrees.
+    Positions are relative to the hip centre in torso lengths (hip centre to shoulder centre), so they do
+    not depend on where the user stands or how far from the camera. Velocities are the change from the
+    previous frame of the window (0 for the first frame), so windows are converted as a whole.
+    Frames without a person (all zero rows) give zero features.
+
+    Args:
+        keypoints (numpy array): (..., frames, 33 * 4) FEATURE_DTYPE
+
+    Returns:
+        numpy array: (..., frames, NUM_COMPACT_FEATURES) FEATURE_DTYPE
+    """
+    check_array(keypoints, (None,) * (keypoints.ndim - 1) + (33 * 4,), name="keypoints")
+    points = keypoints.reshape(*keypoints.shape[:-1], 33, 4)[..., :2]
+    present = np.any(keypoints != 0, axis=-1)
+
+    # 0 for an angle without a segment length, e.g. on frames without a person
+    angles = np.nan_to_num(joint_angles(points[..., _FIRST, :], points[..., _MID, :], points[..., _END, :]) / 180)
+
+    hip_centre = (points[..., LEFT_HIP, :] + points[..., RIGHT_HIP, :]) / 2
+    trunk = (points[..., LEFT_SHOULDER, :] + points[..., RIGHT_SHOULDER, :]) / 2 - hip_centre
+    torso_length = np.linalg.norm(trunk, axis=-1)
+    scale = np.divide(1, torso_length, out=np.zeros_like(torso_length), where=torso_length > 0)
+    # 0 upright, positive leaning to the right of the image; y grows downwards
+    trunk_lean = np.degrees(np.arctan2(trunk[..., 0], -trunk[..., 1]))[..., None] / 180
+
+    positions = (points[..., _POSITIONS, :] - hip_centre[..., None, :]) * scale[..., None, None]
+    positions = positions.reshape(*positions.shape[:-2], -1)
+
+    # the hip centre moves with the whole body, in torso lengths of the current frame
+    moving = np.concatenate([angles, hip_centre * scale[..., None]], axis=-1)
+    velocities = np.zeros_like(moving)
+    velocities[..., 1:, :] = np.diff(moving, axis=-2)
+    # no velocity from or to a frame without a person
+    velocities[..., 1:, :] *= (present[..., 1:] & present[..., :-1])[..., None]
+
+    features = np.concatenate([angles, trunk_lean, positions, velocities], axis=-1)
+    return np.where(present[..., None], features, 0).astype(feature_dtype, copy=False)
+
+
+def create_compact_model(num_classes, sequence_length=COMPACT_SEQUENCE_LENGTH, filters=32, dropout=0.3):
+    """
+    Small Keras classifier of compact_features windows: two Conv1D layers over time, average over the window,
+    one small Dense layer and the softmax. About 0.2 MFLOPs per window against about 60 for the AttnLSTM
+    (count_flops in utils/model_registry.py)
+
+    Args:
+        num_classes (int): model outputs, the class_labels of the model it replaces
+        sequence_length (int): frames per window
+        filters (int): channels of the conv layers
+        dropout (float): dropout before the output while training
+    """
+    from keras.layers import Input, Conv1D, GlobalAveragePooling1D, Dense, Dropout
+    from keras.models import Model
+
+    inputs = Input(shape=(sequence_length, NUM_COMPACT_FEATURES))
+    x = Conv1D(filters, 3, padding='same', activation='relu')(inputs)
+    x = Conv1D(filters, 3, padding='same', activation='relu')(x)
+    x = GlobalAveragePooling1D()(x)
+    x = Dense(filters, activation='relu')(x)
+    x = Dropout(dropout)(x)
+    outputs = Dense(num_classes, activation='softmax')(x)
+    return Model(inputs=[inputs], outputs=outputs)
+
+
+def rep_summary_features(windows):
+    """
+    Fixed size description of whole repetitions for the cascade first stage (utils/cascade.py): mean, minimum
+    and maximum over the window of the joint angles, trunk lean and relative positions of compact_features,
+    e.g. the deepest knee angle or how far the knees come in
+
+    Args:
+        windows (numpy array): (N, frames, 33 * 4) FEATURE_DTYPE, one repetition each
+
+    Returns:
+        numpy array: (N, NUM_SUMMARY_FEATURES) FEATURE_DTYPE
+    """
+    features = compact_features(windows)[..., :NUM_POSE_FEATURES]
+    return np.concatenate([features.mean(axis=1), features.min(axis=1), features.max(axis=1)], axis=-1)
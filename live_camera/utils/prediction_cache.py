@@ -0,0 +1,85 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def prediction_cache_key(data, model_name, **settings):
+    """
+    Builds a cache key from the video content hash, the model and every setting that changes the prediction
+
+    Args:
+        data (bytes): encoded video content
+        model_name (str): model folder or any name that identifies the classifier
+        settings: pose settings such as detection / tracking confidence
+
+    Returns:
+        tuple: hashable cache key
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    return (content_hash, model_name) + tuple(sorted(settings.items()))
+
+
+def session_cache_key(session_state, uploaded_file, model_name, **settings):
+    """
+    prediction_cache_key of an upload, hashed once per upload and settings of a Streamlit session.
+    Streamlit reruns the whole script on every widget interaction, the reruns find the key in session_state.
+
+    Args:
+        session_state: st.session_state
+        uploaded_file: Streamlit UploadedFile, file_id tells the uploads apart
+        model_name (str): as in prediction_cache_key
+        settings: as in prediction_cache_key
+
+    Returns:
+        tuple: (cache key, True when the upload or the settings are new to the session)
+    """
+    request = (uploaded_file.file_id, model_name) + tuple(sorted(settings.items()))
+    if session_state.get("prediction_request") == request:
+        return session_state["prediction_cache_key"], False
+    cache_key = prediction_cache_key(uploaded_file.getvalue(), model_name, **settings)
+    session_state["prediction_request"] = request
+    session_state["prediction_cache_key"] = cache_key
+    return cache_key, True
+
+
+class PredictionCache:
+    """
+    Bounded least recently used cache for prediction dicts.
+    One instance is shared by every Streamlit session through st.cache_resource, so access is locked.
+
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, count=True):
+        """
+        Args:
+            count (bool): count the lookup as a hit or miss, False for a rerun of a lookup already counted
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += count
+                return None
+            self.hits += count
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, prediction_dict):
+        with self._lock:
+            self._entries[key] = prediction_dict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats_text(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return f"Prediction cache: {self.hits} hits | {self.misses} misses | {hit_rate:.0f}% hit rate | " \
+               f"{len(self)}/{self.maxsize} videos"
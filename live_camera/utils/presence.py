@@ -0,0 +1,131 @@
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from utils.constant import (PRESENCE_WIDTH, PRESENCE_PIXEL_THR, PRESENCE_MOTION_THR, PRESENCE_BACKGROUND_RATE,
+                            PRESENCE_HOLD, PRESENCE_CHECK_INTERVAL)
+
+# results of a frame MediaPipe was not run on
+NO_POSE = SimpleNamespace(pose_landmarks=None, pose_world_landmarks=None)
+
+
+class PresenceDetector:
+    """
+    Cheap pre-filter in front of MediaPipe Pose for cameras that are often empty.
+
+    Every frame is shrunk to a small grayscale image and compared with a running average of the empty scene.
+    MediaPipe runs when
+        - it found a person within the last hold seconds (tracking continues as before)
+        - more than motion_thr of the pixels differ from the background (something moves or appeared)
+        - check_interval seconds passed since the last run (someone standing still, a missed detection)
+    otherwise the frame is skipped. The background is only updated while nobody was found, so a person
+    standing still does not fade into it.
+
+        if presence.check(frame):
+            results = pose.process(rgb_frame)
+            presence.report(results.pose_landmarks is not None)
+        else:
+            results = NO_POSE
+
+    Args:
+        width (int): width of the compared grayscale frame
+        pixel_thr (int): grey level difference of a changed pixel
+        motion_thr (float): share of changed pixels that counts as motion
+        background_rate (float): weight of a new frame in the background average
+        hold (float): seconds MediaPipe keeps running after the last person was found
+        check_interval (float): seconds between forced MediaPipe runs of a static scene
+    """
+    def __init__(self, width=PRESENCE_WIDTH, pixel_thr=PRESENCE_PIXEL_THR, motion_thr=PRESENCE_MOTION_THR,
+                 background_rate=PRESENCE_BACKGROUND_RATE, hold=PRESENCE_HOLD, check_interval=PRESENCE_CHECK_INTERVAL):
+        self.width = width
+        self.pixel_thr = pixel_thr
+        self.motion_thr = motion_thr
+        self.background_rate = background_rate
+        self.hold = hold
+        self.check_interval = check_interval
+
+        self.small = None
+        self.gray = None
+        self.background = None
+        self.diff = None
+        self.last_found = None
+        self.last_check = None
+        self.changed = 0.0
+        self.frames = 0
+        self.skipped = 0
+
+    def _gray(self, frame):
+        height = max(1, round(self.width * frame.shape[0] / frame.shape[1]))
+        if self.small is None or self.small.shape[:2] != (height, self.width):
+            self.small = np.empty((height, self.width, 3), dtype=np.uint8)
+            self.gray = np.empty((height, self.width), dtype=np.uint8)
+            self.diff = np.empty((height, self.width), dtype=np.float32)
+            self.background = None
+        # bilinear to the small size is ~100x cheaper than INTER_AREA on a full frame, the blur evens out the noise
+        cv2.resize(frame, (self.width, height), dst=self.small, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        return cv2.GaussianBlur(self.gray, (3, 3), 0, dst=self.gray)
+
+    def check(self, frame, timestamp=None):
+        """
+        Args:
+            frame (numpy array): BGR frame
+            timestamp (float): capture time in seconds, time.monotonic() when None
+
+        Returns:
+            bool: True when MediaPipe should run on the frame, report() the outcome afterwards
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        self.frames += 1
+        gray = self._gray(frame)
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return self._run(timestamp)
+
+        cv2.absdiff(gray.astype(np.float32), self.background, dst=self.diff)
+        self.changed = np.count_nonzero(self.diff > self.pixel_thr) / self.diff.size
+
+        if self.last_found is not None and timestamp - self.last_found < self.hold:
+            return self._run(timestamp)
+        # nobody was found lately, the frame is part of the empty scene
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+        if self.changed > self.motion_thr or timestamp - self.last_check >= self.check_interval:
+            return self._run(timestamp)
+
+        self.skipped += 1
+        return False
+
+    def _run(self, timestamp):
+        self.last_check = timestamp
+        return True
+
+    def report(self, found):
+        """
+        Whether MediaPipe found a person on the frame check() let through
+        """
+        if found:
+            self.last_found = self.last_check
+
+    def skipped_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+
+def detect_pose(pose, frame, buffers, presence=None, timestamp=None):
+    """
+    MediaPipe Pose on a BGR frame, NO_POSE without running it when the presence detector sees an empty scene
+
+    Args:
+        pose: mp.solutions.pose.Pose
+        frame (numpy array): BGR frame
+        buffers (FrameBuffers): holds the RGB copy for MediaPipe
+        presence (PresenceDetector): None runs Pose on every frame
+        timestamp (float): capture time in seconds
+    """
+    if presence is not None and not presence.check(frame, timestamp):
+        return NO_POSE
+    results = pose.process(buffers.to_rgb(frame))
+    if presence is not None:
+        presence.report(results.pose_landmarks is not None)
+    return results
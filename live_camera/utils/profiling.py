@@ -0,0 +1,167 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from utils.constant import (PROFILE_FRAMES, PROFILE_SECONDS, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL,
+                            PROFILE_TRIGGER_COOLDOWN, PROFILE_MAX_DUMPS)
+
+
+class StackSampler:
+    """
+    Samples the Python stack of one thread every interval seconds from a background thread.
+    The stacks are written in the collapsed format ("outer;inner;leaf count") read by flamegraph.pl,
+    speedscope and inferno.
+
+    """
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class SessionProfiler:
+    """
+    Opt-in profiling of a live session. Call frame_start() / frame_end() around the processing of every frame,
+    from the thread that processes the frames.
+
+    A profile runs for `frames` frames or `seconds` seconds, whichever comes first. It starts right away with
+    start_now, or automatically when one frame takes longer than trigger_ms (at most max_dumps times per session,
+    cooldown seconds apart). Every profile writes to output_dir:
+        <session>_<n>.prof       cProfile stats (snakeviz, pstats)
+        <session>_<n>.txt        summary of the functions with the highest cumulative time
+        <session>_<n>.collapsed  sampled stacks for flame graphs
+
+    A profiler that is neither started nor triggered only compares the frame time with the threshold.
+
+    """
+    def __init__(self, session, start_now=False, trigger_ms=None, frames=PROFILE_FRAMES, seconds=PROFILE_SECONDS,
+                 output_dir=PROFILE_DIR, cooldown=PROFILE_TRIGGER_COOLDOWN, max_dumps=PROFILE_MAX_DUMPS):
+        self.session = f"{session}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.trigger_ms = trigger_ms
+        self.frames = frames
+        self.seconds = seconds
+        self.output_dir = output_dir
+        self.cooldown = cooldown
+        self.max_dumps = max_dumps
+
+        # reason of the profile that starts with the next frame, None when nothing is pending
+        self.start_pending = "started with the session" if start_now else None
+        self.profile = None
+        self.sampler = None
+        self.profiled_frames = 0
+        self.profile_start = None
+        self.last_dump = None
+        self.dumps = 0
+        self.frame_start_time = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self, reason="requested"):
+        if self.active or self.dumps >= self.max_dumps:
+            return
+        print(f"Profiling {self.session} ({reason})")
+        self.sampler = StackSampler(threading.get_ident())
+        self.profile = cProfile.Profile()
+        self.profiled_frames = 0
+        self.profile_start = time.monotonic()
+        self.profile.enable()
+
+    def stop(self):
+        if not self.active:
+            return
+        self.profile.disable()
+        self.sampler.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.session}_{self.dumps}")
+        self.profile.dump_stats(f"{base}.prof")
+        self.sampler.write_collapsed(f"{base}.collapsed")
+
+        summary = io.StringIO()
+        summary.write(f"{self.profiled_frames} frames in {time.monotonic() - self.profile_start:.2f} s, "
+                      f"{sum(self.sampler.stacks.values())} stack samples\n\n")
+        pstats.Stats(self.profile, stream=summary).sort_stats("cumulative").print_stats(40)
+        with open(f"{base}.txt", "w") as f:
+            f.write(summary.getvalue())
+        print(f"Profile written to {base}.prof / .txt / .collapsed")
+
+        self.profile = None
+        self.sampler = None
+        self.dumps += 1
+        self.last_dump = time.monotonic()
+
+    def frame_start(self):
+        if self.start_pending is not None:
+            self.start(self.start_pending)
+            self.start_pending = None
+        self.frame_start_time = time.perf_counter()
+
+    def frame_end(self):
+        if self.frame_start_time is None:
+            return
+        frame_ms = (time.perf_counter() - self.frame_start_time) * 1000
+
+        if self.active:
+            self.profiled_frames += 1
+            elapsed = time.monotonic() - self.profile_start
+            if self.profiled_frames >= self.frames or (self.seconds is not None and elapsed >= self.seconds):
+                self.stop()
+        elif self.trigger_ms is not None and frame_ms > self.trigger_ms:
+            if self.last_dump is None or time.monotonic() - self.last_dump > self.cooldown:
+                # starts with the next frame, this one is already over
+                self.start_pending = f"frame took {frame_ms:.0f} ms, threshold {self.trigger_ms:.0f} ms"
+
+    def close(self):
+        self.stop()
+
+
+def profiler_from_env(session, start_now=False, trigger_ms=None):
+    """
+    SessionProfiler configured by environment variables, so any app can be profiled without code changes:
+
+        FV_PROFILE=1                profile from the first frame
+        FV_PROFILE_TRIGGER_MS=80    profile when a frame takes longer than 80 ms
+        FV_PROFILE_FRAMES, FV_PROFILE_SECONDS, FV_PROFILE_DIR   length and output folder of a profile
+
+    start_now / trigger_ms are the defaults of a CLI flag, the environment wins when it is set.
+    """
+    start_now = os.environ.get("FV_PROFILE", "1" if start_now else "0") not in ("", "0")
+    trigger_ms = os.environ.get("FV_PROFILE_TRIGGER_MS", trigger_ms)
+    frames = int(os.environ.get("FV_PROFILE_FRAMES", PROFILE_FRAMES))
+    seconds = os.environ.get("FV_PROFILE_SECONDS", PROFILE_SECONDS)
+
+    return SessionProfiler(session, start_now=start_now,
+                           trigger_ms=float(trigger_ms) if trigger_ms not in (None, "") else None,
+                           frames=frames,
+                           seconds=float(seconds) if seconds not in (None, "") else None,
+                           output_dir=os.environ.get("FV_PROFILE_DIR", PROFILE_DIR))
@@ -0,0 +1,196 @@
+from collections import deque
+
+import numpy as np
+
+from utils.constant import (QUALITY_LEVELS, QUALITY_START_LEVEL, QUALITY_WINDOW, QUALITY_TARGET_LATENCY,
+                            QUALITY_UP_HEADROOM, QUALITY_UP_WAIT, QUALITY_MAX_UP_WAIT)
+
+RENDER_DETAILS = ('minimal', 'basic', 'full')
+
+
+class QualityLevel:
+    """
+    Settings of one step of the quality ladder
+
+    Args:
+        model_complexity (int): MediaPipe Pose model 0, 1 or 2
+        pose_scale (float): the frame is shrunk by this factor before Pose, landmarks are relative to the frame
+        classify_stride (int): frames between two sliding window classifications
+        render_detail (str): 'full', 'basic' or 'minimal', see RENDER_DETAILS
+    """
+    def __init__(self, model_complexity, pose_scale, classify_stride, render_detail):
+        if render_detail not in RENDER_DETAILS:
+            raise ValueError(f"render_detail must be one of {RENDER_DETAILS}, got {render_detail!r}")
+        self.model_complexity = model_complexity
+        self.pose_scale = pose_scale
+        self.classify_stride = classify_stride
+        self.render_detail = render_detail
+
+    def pose_size(self, frame):
+        """
+        Returns:
+            tuple: (width, height) of the Pose input for a frame
+        """
+        height, width = frame.shape[:2]
+        return int(round(width * self.pose_scale)), int(round(height * self.pose_scale))
+
+    def draws(self, detail):
+        """
+        True when this level renders the elements of the given detail, e.g. level.draws('full') for the skeleton
+        """
+        return RENDER_DETAILS.index(self.render_detail) >= RENDER_DETAILS.index(detail)
+
+    def __str__(self):
+        return (f"model_complexity {self.model_complexity}, pose scale {self.pose_scale:g}, "
+                f"classify every {self.classify_stride} frames, {self.render_detail} render")
+
+
+class QualityController:
+    """
+    Holds a target frame rate and latency by stepping along a ladder of quality levels.
+
+    The processing time of every frame (everything but waiting for the camera) is fed to update. Once a
+    window of frames was processed at the current level:
+        - the mean above 1 / target_fps or the 95th percentile above target_latency steps one level down
+        - both below up_headroom of their budget for up_wait seconds step one level up
+    A level is only judged on frames processed at that level. A step up that has to be taken back within
+    up_wait doubles up_wait (up to max_up_wait), so a level that does not fit is not retried every few
+    seconds; a level that held longer resets it. Every change is printed and kept in changes.
+
+        level = controller.level
+        ...process the frame at level...
+        if controller.update(time.monotonic(), processing_seconds):
+            level = controller.level
+
+    Args:
+        target_fps (float): frames per second the processing has to keep up with
+        target_latency (float): seconds of processing per frame, 95th percentile
+        levels (list): QualityLevel or (model_complexity, pose_scale, classify_stride, render_detail), best first
+        start_level (int): index of the first level
+        window (int): frames per decision
+        up_headroom (float): share of the budget below which the level above is tried
+        up_wait (float): seconds below the headroom before a step up
+        max_up_wait (float): longest up_wait after failed steps up
+        log (callable): called with the text of every change, None for no output
+    """
+    def __init__(self, target_fps, target_latency=QUALITY_TARGET_LATENCY, levels=QUALITY_LEVELS,
+                 start_level=QUALITY_START_LEVEL, window=QUALITY_WINDOW, up_headroom=QUALITY_UP_HEADROOM,
+                 up_wait=QUALITY_UP_WAIT, max_up_wait=QUALITY_MAX_UP_WAIT, log=print):
+        self.frame_budget = 1.0 / target_fps
+        self.target_latency = target_latency
+        self.levels = [level if isinstance(level, QualityLevel) else QualityLevel(*level) for level in levels]
+        self.index = min(max(start_level, 0), len(self.levels) - 1)
+        self.up_headroom = up_headroom
+        self.base_up_wait = up_wait
+        self.up_wait = up_wait
+        self.max_up_wait = max_up_wait
+        self.log = log
+
+        self.samples = deque(maxlen=window)
+        # since when the frames stay below the headroom, None while they do not
+        self.fast_since = None
+        self.changed_at = None
+        self.last_step = 0
+        # (timestamp, old index, new index, reason)
+        self.changes = []
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def update(self, timestamp, frame_seconds):
+        """
+        Feeds the processing time of one frame
+
+        Args:
+            timestamp (float): seconds, e.g. time.monotonic() when the frame was done
+            frame_seconds (float): processing time of the frame
+
+        Returns:
+            bool: True when the level changed, the next frame is processed at controller.level
+        """
+        self.samples.append(frame_seconds)
+        if len(self.samples) < self.samples.maxlen:
+            return False
+
+        samples = np.asarray(self.samples)
+        mean, p95 = float(samples.mean()), float(np.percentile(samples, 95))
+        stats = f"mean {mean * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+
+        if self.last_step < 0 and timestamp - self.changed_at >= self.up_wait:
+            # the last step up held
+            self.up_wait = self.base_up_wait
+            self.last_step = 0
+
+        if mean > self.frame_budget or p95 > self.target_latency:
+            self.fast_since = None
+            if self.index == len(self.levels) - 1:
+                return False
+            if self.last_step < 0:
+                # the level above did not fit, wait longer before trying it again
+                self.up_wait = min(2 * self.up_wait, self.max_up_wait)
+            return self._step(timestamp, 1, f"{stats} over the budget")
+
+        if mean < self.up_headroom * self.frame_budget and p95 < self.up_headroom * self.target_latency:
+            if self.fast_since is None:
+                self.fast_since = timestamp
+            if self.index > 0 and timestamp - self.fast_since >= self.up_wait:
+                return self._step(timestamp, -1, f"{stats} below {self.up_headroom:.0%} of the budget "
+                                                 f"for {timestamp - self.fast_since:.1f} s")
+        else:
+            self.fast_since = None
+        return False
+
+    def _step(self, timestamp, step, reason):
+        old = self.index
+        self.index += step
+        self.changes.append((timestamp, old, self.index, reason))
+        self.changed_at = timestamp
+        self.last_step = step
+        # the next decision is made on frames of the new level only
+        self.samples.clear()
+        self.fast_since = None
+        if self.log is not None:
+            self.log(f"quality {'down' if step > 0 else 'up'} {old} -> {self.index} ({self.level}): {reason}")
+        return True
+
+    def stats_text(self):
+        return f"quality level {self.index} ({self.level}), {len(self.changes)} changes"
+
+
+class PoseGraphs:
+    """
+    One MediaPipe Pose graph per model complexity, created the first time a level needs it and kept, so
+    going back to a level does not load its model again. Tracking starts over after a switch.
+
+    Only the complexity 1 model comes with the mediapipe package, the others are downloaded on first use;
+    a complexity whose model can not be loaded is replaced by complexity 1.
+
+    Args:
+        mp_pose: mp.solutions.pose
+        **kwargs: further Pose arguments, e.g. min_detection_confidence
+    """
+    def __init__(self, mp_pose, **kwargs):
+        self.mp_pose = mp_pose
+        self.kwargs = kwargs
+        self.graphs = {}
+        self.unavailable = set()
+
+    def get(self, model_complexity):
+        if model_complexity in self.unavailable:
+            model_complexity = 1
+        if model_complexity not in self.graphs:
+            try:
+                self.graphs[model_complexity] = self.mp_pose.Pose(model_complexity=model_complexity, **self.kwargs)
+            except OSError as e:
+                if model_complexity == 1:
+                    raise
+                print(f"Pose model_complexity {model_complexity} not available ({e}), using 1 instead")
+                self.unavailable.add(model_complexity)
+                return self.get(1)
+        return self.graphs[model_complexity]
+
+    def close(self):
+        for graph in self.graphs.values():
+            graph.close()
+        self.graphs = {}
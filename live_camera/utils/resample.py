@@ -0,0 +1,135 @@
+from collections import deque
+
+import numpy as np
+
+from utils.constant import MODEL_FPS
+from utils.dtypes import feature_dtype, buffer_dtype, check_array
+
+
+def time_grid(start, end, sequence_length):
+    """
+    Fixed time grid of sequence_length points from start to end (seconds)
+
+    """
+    return np.linspace(start, end, sequence_length)
+
+
+def resample_to_grid(timestamps, values, grid):
+    """
+    Linearly interpolates per-frame landmark arrays onto a time grid, all features at once
+
+    Args:
+        timestamps: increasing frame times in seconds, shape (T,)
+        values: per-frame feature arrays, shape (T, F)
+        grid: times to sample, shape (N,)
+
+    Returns:
+        numpy array: resampled features, shape (N, F). Grid points outside the recorded
+        range take the first / last frame.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values)
+    grid = np.asarray(grid, dtype=np.float64)
+
+    if len(timestamps) == 1:
+        return np.repeat(values, len(grid), axis=0)
+
+    # index of the frame at or before every grid point, so the pair (idx, idx + 1) brackets it
+    idx = np.clip(np.searchsorted(timestamps, grid, side='right') - 1, 0, len(timestamps) - 2)
+    t0 = timestamps[idx]
+    dt = timestamps[idx + 1] - t0
+    weight = np.clip(np.divide(grid - t0, dt, out=np.zeros_like(grid), where=dt > 0), 0.0, 1.0)
+
+    v0 = values[idx]
+    return v0 + (values[idx + 1] - v0) * weight[:, None].astype(values.dtype)
+
+
+def resample_window(timestamps, values, sequence_length):
+    """
+    Resamples a whole recording (e.g. one repetition) onto sequence_length points evenly spaced in time
+
+    """
+    return resample_to_grid(timestamps, values, time_grid(timestamps[0], timestamps[-1], sequence_length))
+
+
+class TimestampedWindow:
+    """
+    Sliding window of the most recent frames for live classification.
+    Frames are kept with their capture time and the model gets sequence_length frames
+    evenly spaced over the last sequence_length / MODEL_FPS seconds, whatever the camera fps
+    or the number of dropped frames.
+
+    Keypoints go in as FEATURE_DTYPE, are kept as BUFFER_DTYPE and windows come out as FEATURE_DTYPE.
+
+    """
+    def __init__(self, sequence_length, model_fps=MODEL_FPS):
+        self.sequence_length = sequence_length
+        self.duration = (sequence_length - 1) / model_fps
+        # bounded in frames too, so a very fast camera can not grow the window without limit
+        self.timestamps = deque(maxlen=4 * sequence_length)
+        self.frames = deque(maxlen=4 * sequence_length)
+        self.num_features = None
+
+    def append(self, timestamp, keypoints):
+        check_array(keypoints, (self.num_features,), name="keypoints")
+        self.num_features = keypoints.shape[0]
+        self.timestamps.append(timestamp)
+        self.frames.append(keypoints.astype(buffer_dtype, copy=False))
+
+        # drop frames that are no longer needed to interpolate the oldest grid point
+        while len(self.timestamps) > 2 and self.timestamps[1] <= timestamp - self.duration:
+            self.timestamps.popleft()
+            self.frames.popleft()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def is_full(self):
+        return len(self.timestamps) > 1 and self.timestamps[-1] - self.timestamps[0] >= self.duration
+
+    def window(self):
+        end = self.timestamps[-1]
+        grid = time_grid(end - self.duration, end, self.sequence_length)
+        return resample_to_grid(self.timestamps, np.stack(self.frames).astype(feature_dtype, copy=False), grid)
+
+
+class StreamResampler:
+    """
+    Resamples a stream of frames onto the model frame rate as the frames arrive, for models that take one frame
+    at a time (utils/causal_model.py). Every grid point between the previous and the current frame is
+    interpolated when the current frame comes in, so a frame yields no, one or several model frames.
+
+    A gap longer than max_gap is not interpolated over: the stream starts over at the new frame and push()
+    reports it, so the caller can reset the model state.
+
+    """
+    def __init__(self, model_fps=MODEL_FPS, max_gap=None):
+        self.interval = 1.0 / model_fps
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.last_frame = None
+        self.next_time = None
+
+    def push(self, timestamp, keypoints):
+        """
+        Returns:
+            tuple: (restarted, list of FEATURE_DTYPE frames on the model frame rate grid up to timestamp)
+        """
+        check_array(keypoints, (None,), name="keypoints")
+        restarted = self.last_time is None or (self.max_gap is not None and timestamp - self.last_time > self.max_gap)
+        if restarted:
+            self.last_time, self.last_frame = timestamp, keypoints
+            self.next_time = timestamp + self.interval
+            return True, [keypoints]
+
+        frames = []
+        dt = timestamp - self.last_time
+        while self.next_time <= timestamp:
+            weight = (self.next_time - self.last_time) / dt if dt > 0 else 1.0
+            frames.append(self.last_frame + (keypoints - self.last_frame) * keypoints.dtype.type(weight))
+            self.next_time += self.interval
+        self.last_time, self.last_frame = timestamp, keypoints
+        return False, frames
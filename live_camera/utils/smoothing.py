@@ -0,0 +1,188 @@
+import numpy as np
+
+from utils.constant import (ONE_EURO_MIN_CUTOFF, ONE_EURO_BETA, ONE_EURO_D_CUTOFF, KALMAN_PROCESS_NOISE,
+                            KALMAN_MEASUREMENT_NOISE, SMOOTHING_MAX_GAP)
+
+
+def smoothing_factor(dt, cutoff):
+    """
+    Exponential smoothing factor of a first order low-pass filter with the given cutoff frequency (Hz)
+
+    """
+    tau = 1.0 / (2 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez et al. 2012) over a whole array of values at once, e.g. (33, 3) landmark coordinates.
+    Slow movements get a low cutoff (little jitter), fast movements a high cutoff (little lag).
+
+    NaN values are missing detections: those elements keep their last output and
+    every element starts over after a gap longer than max_gap seconds.
+
+    """
+    def __init__(self, min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA, d_cutoff=ONE_EURO_D_CUTOFF,
+                 max_gap=SMOOTHING_MAX_GAP):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.value = None
+        self.derivative = None
+
+    def __call__(self, timestamp, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.last_time is not None and timestamp - self.last_time > self.max_gap:
+            self.reset()
+
+        measured = ~np.isnan(values)
+        if self.value is None:
+            self.value = values.copy()
+            self.derivative = np.zeros_like(values)
+            self.last_time = timestamp
+            return self.value.copy()
+
+        dt = max(timestamp - self.last_time, 1e-6)
+        self.last_time = timestamp
+
+        # elements seen for the first time start at their measurement
+        first = measured & np.isnan(self.value)
+        self.value[first] = values[first]
+        self.derivative[first] = 0.0
+        update = measured & ~first
+
+        derivative = (values - self.value) / dt
+        derivative = self.derivative + smoothing_factor(dt, self.d_cutoff) * (derivative - self.derivative)
+        alpha = smoothing_factor(dt, self.min_cutoff + self.beta * np.abs(derivative))
+
+        self.derivative = np.where(update, derivative, self.derivative)
+        self.value = np.where(update, self.value + alpha * (values - self.value), self.value)
+        return self.value.copy()
+
+
+class ConstantVelocityKalman:
+    """
+    Constant velocity Kalman filter with independent (position, velocity) states for every array element,
+    e.g. (33, 3) landmark coordinates, updated with array operations.
+
+    NaN values are missing detections: those elements are predicted forward without a measurement,
+    every element starts over after a gap longer than max_gap seconds.
+
+    """
+    def __init__(self, process_noise=KALMAN_PROCESS_NOISE, measurement_noise=KALMAN_MEASUREMENT_NOISE,
+                 max_gap=SMOOTHING_MAX_GAP):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.position = None
+
+    def _start(self, values, elements):
+        self.position[elements] = values[elements]
+        self.velocity[elements] = 0.0
+        self.p00[elements] = self.measurement_noise
+        self.p01[elements] = 0.0
+        self.p11[elements] = 1.0
+
+    def __call__(self, timestamp, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.last_time is not None and timestamp - self.last_time > self.max_gap:
+            self.reset()
+
+        measured = ~np.isnan(values)
+        if self.position is None:
+            self.position = np.full_like(values, np.nan)
+            self.velocity = np.zeros_like(values)
+            self.p00 = np.zeros_like(values)
+            self.p01 = np.zeros_like(values)
+            self.p11 = np.zeros_like(values)
+            self._start(values, measured)
+            self.last_time = timestamp
+            return self.position.copy()
+
+        dt = max(timestamp - self.last_time, 1e-6)
+        self.last_time = timestamp
+        q = self.process_noise
+
+        # predict, white acceleration noise
+        self.position = self.position + self.velocity * dt
+        self.p00 = self.p00 + dt * (2 * self.p01 + dt * self.p11) + q * dt ** 3 / 3
+        self.p01 = self.p01 + dt * self.p11 + q * dt ** 2 / 2
+        self.p11 = self.p11 + q * dt
+
+        first = measured & np.isnan(self.position)
+        self._start(values, first)
+        update = measured & ~first
+
+        # update where there is a measurement
+        innovation = np.where(update, values - self.position, 0.0)
+        gain_position = np.where(update, self.p00 / (self.p00 + self.measurement_noise), 0.0)
+        gain_velocity = np.where(update, self.p01 / (self.p00 + self.measurement_noise), 0.0)
+        self.position = self.position + gain_position * innovation
+        self.velocity = self.velocity + gain_velocity * innovation
+        self.p11 = self.p11 - gain_velocity * self.p01
+        self.p01 = (1 - gain_position) * self.p01
+        self.p00 = (1 - gain_position) * self.p00
+        return self.position.copy()
+
+
+def create_filter(name):
+    """
+    Args:
+        name (str): 'one_euro', 'kalman' or 'none'
+
+    Returns:
+        OneEuroFilter, ConstantVelocityKalman or None
+    """
+    if name == 'one_euro':
+        return OneEuroFilter()
+    if name == 'kalman':
+        return ConstantVelocityKalman()
+    return None
+
+
+def smooth_landmarks(landmark_filter, timestamps, landmarks):
+    """
+    Runs a filter over a recording, all 33 landmarks of a frame in one call
+
+    Args:
+        timestamps: frame times in seconds, shape (T,)
+        landmarks: x, y, z, visibility per frame, shape (T, 33, 4), NaN rows for frames without a person
+
+    Returns:
+        numpy array: landmarks with smoothed x, y, z, same shape; visibility is left as it is
+    """
+    smoothed = np.array(landmarks, dtype=np.float64)
+    for i, timestamp in enumerate(timestamps):
+        smoothed[i, :, :3] = landmark_filter(timestamp, smoothed[i, :, :3])
+    return smoothed
+
+
+class LandmarkSmoother:
+    """
+    Smooths the x, y, z of the mediapipe Pose landmarks in place, so the landmark data, knee angles
+    and counter downstream all see the filtered positions. Frames without a person advance the filter
+    with missing values.
+
+    """
+    def __init__(self, landmark_filter):
+        self.filter = landmark_filter
+
+    def apply(self, results, timestamp):
+        if not results.pose_landmarks:
+            self.filter(timestamp, np.full((33, 3), np.nan))
+            return results
+
+        landmarks = results.pose_landmarks.landmark
+        values = np.array([[res.x, res.y, res.z] for res in landmarks])
+        for res, (x, y, z) in zip(landmarks, self.filter(timestamp, values)):
+            res.x, res.y, res.z = x, y, z
+        return results
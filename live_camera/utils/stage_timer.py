@@ -0,0 +1,61 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Wall clock durations of named pipeline stages, e.g.
+
+        with timer.stage("pose"):
+            results = pose.process(rgb_frame)
+
+    max_samples bounds the kept durations per stage (None keeps all, for benchmarks).
+
+    """
+    def __init__(self, max_samples=None):
+        self.max_samples = max_samples
+        self.durations = {}
+
+    def record(self, name, seconds):
+        if name not in self.durations:
+            self.durations[name] = deque(maxlen=self.max_samples)
+        self.durations[name].append(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # same interface as PipelineMetrics.span, a StageTimer can time the stages of the live pipeline
+    span = stage
+
+    def summary(self):
+        """
+        Returns:
+            dict: {stage: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'fps'}}, fps is 1 / mean duration
+        """
+        summary = {}
+        for name, durations in self.durations.items():
+            if not durations:
+                continue
+            milliseconds = np.asarray(durations) * 1000
+            p50, p95, p99 = np.percentile(milliseconds, [50, 95, 99])
+            mean = float(milliseconds.mean())
+            summary[name] = {
+                'count': len(milliseconds),
+                'mean_ms': mean,
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'fps': 1000 / mean if mean > 0 else float('inf'),
+            }
+        return summary
+
+    def reset(self):
+        self.durations.clear()
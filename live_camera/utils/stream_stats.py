@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class StreamStats:
+    """
+    Thread safe frame counters of one stream: captured, processed and dropped frames,
+    processing fps and capture to result latency over the most recent frames, and the classifier
+    runs the motion gate skipped
+
+    """
+    def __init__(self, history=300):
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.processed = 0
+        self.dropped = 0
+        self.inferences = 0
+        self.skipped_inferences = 0
+        self.processed_times = deque(maxlen=history)
+        self.latencies = deque(maxlen=history)
+
+    def frame_captured(self):
+        with self.lock:
+            self.captured += 1
+
+    def frame_dropped(self):
+        with self.lock:
+            self.dropped += 1
+
+    def frame_processed(self, capture_time):
+        now = time.monotonic()
+        with self.lock:
+            self.processed += 1
+            self.processed_times.append(now)
+            self.latencies.append(now - capture_time)
+
+    def inference_done(self, skipped=False):
+        with self.lock:
+            self.inferences += 1
+            self.skipped_inferences += skipped
+
+    def fps(self):
+        with self.lock:
+            if len(self.processed_times) < 2:
+                return 0.0
+            return (len(self.processed_times) - 1) / (self.processed_times[-1] - self.processed_times[0])
+
+    def latency_ms(self, percentile=50):
+        with self.lock:
+            if not self.latencies:
+                return 0.0
+            return float(np.percentile(self.latencies, percentile)) * 1000
+
+    def stats_text(self):
+        text = (f"{self.fps():5.1f} fps | latency p50 {self.latency_ms(50):6.1f} ms p95 {self.latency_ms(95):6.1f} ms"
+                f" | {self.processed} processed, {self.dropped} dropped of {self.captured} captured")
+        if self.inferences:
+            text += f" | skipped {self.skipped_inferences / self.inferences:.0%} of {self.inferences} inferences"
+        return text
@@ -0,0 +1,313 @@
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from utils.constant import MODEL_FPS, UPLOAD_SEEK_GAP
+
+try:
+    import av
+except ImportError:  # PyAV is optional, we fall back to OpenCV on a temporary file
+    av = None
+
+
+def upload_bytes(uploaded_file):
+    """
+    Returns the raw bytes of a Streamlit UploadedFile (or any file-like / bytes object) without copying to disk
+
+    """
+    if isinstance(uploaded_file, (bytes, bytearray, memoryview)):
+        return bytes(uploaded_file)
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    return uploaded_file.read()
+
+
+def sample_frame_indices(video_frames_count, sequence_length):
+    """
+    Evenly spaced frame indices across the whole video, same spacing as the original feature_extraction_data
+
+    """
+    return [video_frames_count * i // sequence_length for i in range(sequence_length)]
+
+
+def _count_frames_av(data):
+    # demuxing only reads packet headers, no frame is decoded
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.video[0]
+        if stream.frames:
+            return stream.frames
+        return sum(1 for packet in container.demux(stream) if packet.size)
+
+
+def _iter_frames_av(data, frame_indices=None, format="bgr24"):
+    wanted = None if frame_indices is None else sorted(set(frame_indices))
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        frame_duration = 1.0 / float(stream.average_rate or MODEL_FPS)
+        position = 0
+        for index, frame in enumerate(container.decode(stream)):
+            if wanted is not None:
+                if position >= len(wanted):
+                    break
+                if index != wanted[position]:
+                    continue
+                position += 1
+            timestamp = frame.time if frame.time is not None else index * frame_duration
+            yield index, timestamp, frame.to_ndarray(format=format)
+
+
+def _iter_range_av(data, start, end, format):
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if start > 0:
+            # lands on the keyframe before start, the frames up to start are decoded and skipped
+            container.seek(int(start / stream.time_base), stream=stream, backward=True)
+        for frame in container.decode(stream):
+            if frame.time is None or frame.time < start:
+                continue
+            if end is not None and frame.time >= end:
+                return
+            yield frame.time, frame.to_ndarray(format=format)
+
+
+def _iter_at_times_av(data, times, format, seek_gap=UPLOAD_SEEK_GAP):
+    # every frame up to the last time is decoded unless a seek skips it, only the kept ones are converted
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        decoded, frame, image = None, None, None
+        position = 0
+        while position < len(times):
+            target = times[position]
+            if decoded is None or (frame is not None and frame.time is not None
+                                   and target - frame.time > seek_gap):
+                # lands on the keyframe before target
+                container.seek(int(target / stream.time_base), stream=stream, backward=True)
+                decoded = container.decode(stream)
+            next_frame = next(decoded, None)
+            if next_frame is None:
+                break
+            frame = next_frame
+            # first frame at or after every time, with a small tolerance for rounded timestamps
+            if frame.time is None or frame.time < target - 1e-3:
+                continue
+            image = frame.to_ndarray(format=format)
+            while position < len(times) and frame.time >= times[position] - 1e-3:
+                yield image
+                position += 1
+
+        # the header duration can overshoot the last decoded frame, the last frame is the nearest one
+        if position < len(times) and frame is not None:
+            image = frame.to_ndarray(format=format)
+            for _ in range(len(times) - position):
+                yield image
+
+
+def _time_span_av(data):
+    # first and last frame presentation time from the container header, nothing is decoded
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.video[0]
+        if not stream.duration or not stream.average_rate:
+            return None
+        start = float((stream.start_time or 0) * stream.time_base)
+        duration = float(stream.duration * stream.time_base)
+        return start, start + duration - 1.0 / float(stream.average_rate)
+
+
+@contextmanager
+def _spooled_video_path(data):
+    """
+    Writes the upload to a temporary file that is always removed on exit.
+    Only used when the bytes can not be decoded in memory.
+
+    """
+    with tempfile.TemporaryDirectory(prefix="fitness_vision_") as tmp_dir:
+        path = os.path.join(tmp_dir, "upload.mp4")
+        with open(path, "wb") as tfile:
+            tfile.write(data)
+        yield path
+
+
+def _iter_frames_cv2(data, frame_indices=None, format="bgr24"):
+    # OpenCV only decodes to BGR
+    convert = cv2.COLOR_BGR2RGB if format == "rgb24" else None
+    with _spooled_video_path(data) as path:
+        video_stream = cv2.VideoCapture(path)
+        try:
+            if frame_indices is None:
+                index = 0
+                while True:
+                    success, frame = video_stream.read()
+                    if not success:
+                        return
+                    if convert is not None:
+                        frame = cv2.cvtColor(frame, convert)
+                    yield index, video_stream.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+                    index += 1
+            for current_frame in frame_indices:
+                # Set current frame to be the specific frame
+                video_stream.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+                success, frame = video_stream.read()
+                if not success:
+                    return
+                if convert is not None:
+                    frame = cv2.cvtColor(frame, convert)
+                yield current_frame, video_stream.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+        finally:
+            video_stream.release()
+
+
+def _iter_range_cv2(data, start, end, format):
+    convert = cv2.COLOR_BGR2RGB if format == "rgb24" else None
+    with _spooled_video_path(data) as path:
+        video_stream = cv2.VideoCapture(path)
+        try:
+            video_stream.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+            while True:
+                success, frame = video_stream.read()
+                if not success:
+                    return
+                timestamp = video_stream.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if timestamp < start:
+                    continue
+                if end is not None and timestamp >= end:
+                    return
+                if convert is not None:
+                    frame = cv2.cvtColor(frame, convert)
+                yield timestamp, frame
+        finally:
+            video_stream.release()
+
+
+def count_frames(data):
+    """
+    Number of video frames in an encoded video held in memory
+
+    """
+    if av is not None:
+        try:
+            return _count_frames_av(data)
+        except (av.error.FFmpegError, IndexError):
+            pass
+
+    with _spooled_video_path(data) as path:
+        video_stream = cv2.VideoCapture(path)
+        video_frames_count = int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))
+        video_stream.release()
+    return video_frames_count
+
+
+def iter_timed_frames(data, frame_indices=None, format="bgr24"):
+    """
+    Decodes an encoded video held in memory and yields (frame index, timestamp in seconds, BGR frame)
+
+    Args:
+        data (bytes): encoded video, e.g. the content of a Streamlit upload
+        frame_indices: optional list of frame indices to keep, all frames are yielded when None
+        format (str): "bgr24", or "rgb24" for frames that go straight to MediaPipe without a colour conversion
+
+    Decoding runs straight from the in-memory buffer with PyAV. When PyAV is missing or
+    can not read the container, the bytes are spooled to a self-cleaning temporary file for OpenCV.
+    """
+    if av is not None:
+        decoded_any = False
+        try:
+            for item in _iter_frames_av(data, frame_indices, format):
+                decoded_any = True
+                yield item
+            return
+        except (av.error.FFmpegError, IndexError):
+            # a failure half way through can not be retried without yielding frames twice
+            if decoded_any:
+                return
+
+    yield from _iter_frames_cv2(data, frame_indices, format)
+
+
+def iter_time_range(data, start, end=None, format="bgr24"):
+    """
+    Decodes the frames with start <= timestamp < end, seeking to start instead of decoding from the beginning.
+    Consecutive ranges split a video into parts that are decoded independently, every frame in exactly one.
+
+    Yields:
+        tuple: (timestamp in seconds, frame)
+    """
+    if av is not None:
+        decoded_any = False
+        try:
+            for item in _iter_range_av(data, start, end, format):
+                decoded_any = True
+                yield item
+            return
+        except (av.error.FFmpegError, IndexError):
+            if decoded_any:
+                return
+
+    yield from _iter_range_cv2(data, start, end, format)
+
+
+def iter_frames(data, frame_indices=None, format="bgr24"):
+    """
+    Same as iter_timed_frames without the timestamps, yields (frame index, BGR frame)
+
+    """
+    for index, _, frame in iter_timed_frames(data, frame_indices, format):
+        yield index, frame
+
+
+def time_span(data):
+    """
+    (first, last) frame time in seconds from the container header, None when it is not available
+
+    """
+    if av is None:
+        return None
+    try:
+        return _time_span_av(data)
+    except (av.error.FFmpegError, IndexError):
+        return None
+
+
+def iter_sampled_frames(uploaded_file, sequence_length, format="bgr24"):
+    """
+    Yields sequence_length BGR frames evenly spaced in time across an uploaded video without leaving files on disk.
+    Frames are decoded one at a time so only a single frame is held in memory, and only the sampled ones are
+    converted to arrays; samples more than UPLOAD_SEEK_GAP seconds apart are reached by seeking.
+    Sampling follows the frame timestamps, so variable frame rate and dropped frames do not
+    change the time scale the model sees. Falls back to evenly spaced frame indices when the
+    container has no duration.
+
+    Args:
+        uploaded_file: Streamlit UploadedFile, bytes or file-like object
+        sequence_length (int): number of frames to sample
+        format (str): "bgr24", or "rgb24" to skip the colour conversion before MediaPipe
+
+    Yields:
+        numpy array: sampled frames in order
+    """
+    data = upload_bytes(uploaded_file)
+
+    span = time_span(data)
+    if span is not None:
+        decoded_any = False
+        try:
+            for frame in _iter_at_times_av(data, np.linspace(span[0], span[1], sequence_length), format):
+                decoded_any = True
+                yield frame
+            return
+        except (av.error.FFmpegError, IndexError):
+            # a failure half way through can not be retried without yielding frames twice
+            if decoded_any:
+                return
+
+    frame_indices = sample_frame_indices(count_frames(data), sequence_length)
+    # videos shorter than sequence_length repeat indices, reuse the decoded frame instead of seeking back
+    for index, frame in iter_frames(data, frame_indices, format):
+        for _ in range(frame_indices.count(index)):
+            yield frame